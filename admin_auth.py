@@ -0,0 +1,128 @@
+"""
+ADMIN CREDENTIALS & SESSION TOKENS
+File: admin_auth.py
+Used by: voting.py (/api/admin/login and the routes behind require_admin)
+
+Passwords are stored as salted PBKDF2-SHA256 hashes with a tunable
+iteration count; plaintext rows from older databases still verify and are
+rehashed on the next successful login. Logins hand out stateless tokens,
+`<username>.<expiry>.<HMAC-SHA256 signature>`, so checking one is a single
+HMAC over a few dozen bytes: no database or session lookup, and every
+process sharing the secret accepts the same tokens.
+"""
+import base64
+import hashlib
+import hmac
+import os
+import time
+from functools import wraps
+
+from flask import g, jsonify, request
+
+
+HASH_PREFIX = 'pbkdf2_sha256'
+SALT_BYTES = 16
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class AdminAuth:
+    def __init__(self, secret=None, ttl=3600, iterations=200_000):
+        self.secret = secret.encode('utf8') if isinstance(secret, str) else (secret or os.urandom(32))
+        self.ttl = ttl
+        self.iterations = iterations
+        self.issued = 0
+        self.accepted = 0
+        self.rejected = 0
+        # Compared against when the username does not exist, so unknown and
+        # known users take the same time to reject
+        self._dummy_hash = self.hash_password(_b64encode(os.urandom(12)))
+
+    # ========== PASSWORDS ==========
+    def hash_password(self, password, iterations=None):
+        iterations = iterations or self.iterations
+        salt = os.urandom(SALT_BYTES)
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf8'), salt, iterations)
+        return f'{HASH_PREFIX}${iterations}${_b64encode(salt)}${_b64encode(digest)}'
+
+    def verify_password(self, password, stored):
+        """True if `password` matches the stored hash (or legacy plaintext)."""
+        if stored is None:
+            self.verify_password(password, self._dummy_hash)
+            return False
+        if not stored.startswith(HASH_PREFIX + '$'):
+            return hmac.compare_digest(password.encode('utf8'), stored.encode('utf8'))
+        try:
+            _, iterations, salt, digest = stored.split('$')
+            expected = _b64decode(digest)
+            actual = hashlib.pbkdf2_hmac('sha256', password.encode('utf8'), _b64decode(salt), int(iterations))
+        except ValueError:
+            return False
+        return hmac.compare_digest(actual, expected)
+
+    def needs_rehash(self, stored):
+        """Plaintext rows and hashes made with a different cost are upgraded."""
+        parts = stored.split('$')
+        return len(parts) != 4 or parts[0] != HASH_PREFIX or parts[1] != str(self.iterations)
+
+    # ========== TOKENS ==========
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self.secret, payload.encode('ascii'), hashlib.sha256).digest())
+
+    def issue(self, username):
+        """Return (token, expires_at)."""
+        expires_at = int(time.time()) + self.ttl
+        payload = f"{_b64encode(username.encode('utf8'))}.{expires_at}"
+        self.issued += 1
+        return f'{payload}.{self._sign(payload)}', expires_at
+
+    def validate(self, token):
+        """Username for a valid, unexpired token, else None."""
+        # Headers arrive as latin-1; a valid token is always ASCII
+        if not token or not token.isascii() or token.count('.') != 2:
+            return None
+        payload, signature = token.rsplit('.', 1)
+        if not hmac.compare_digest(signature.encode('ascii'), self._sign(payload).encode('ascii')):
+            return None
+        user, expires_at = payload.split('.')
+        try:
+            if int(expires_at) < time.time():
+                return None
+            return _b64decode(user).decode('utf8')
+        except ValueError:
+            return None
+
+    # ========== FLASK INTEGRATION ==========
+    def token_from_request(self):
+        header = request.headers.get('Authorization', '')
+        if header[:7].lower() == 'bearer ':
+            return header[7:].strip()
+        return request.headers.get('X-Admin-Token')
+
+    def required(self, view):
+        """Reject the request with 401 unless it carries a valid admin token."""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            username = self.validate(self.token_from_request())
+            if username is None:
+                self.rejected += 1
+                return jsonify({'error': 'Admin authentication required'}), 401
+            self.accepted += 1
+            g.admin = username
+            return view(*args, **kwargs)
+        return wrapper
+
+    def stats(self):
+        return {
+            'token_ttl_seconds': self.ttl,
+            'hash_iterations': self.iterations,
+            'issued': self.issued,
+            'accepted': self.accepted,
+            'rejected': self.rejected
+        }
@@ -0,0 +1,207 @@
+"""
+READ-ONLY ANALYTICS SNAPSHOT
+File: analytics.py
+Used by: voting.py (/api/results timeline, /api/stats, /api/admin/voters and
+         its export when ANALYTICS_SNAPSHOT=1)
+
+Dashboard reads are served from in-memory SQLite copies of the database
+and of each voter shard, made with the backup API. They never take a
+pooled connection that a vote needs, and never hold a read transaction
+open on the live files while a full roll is streamed. A background
+thread refreshes the copies every max_staleness / 2 seconds. A refresh
+only copies when `PRAGMA data_version` shows that another connection
+committed since the last one; otherwise it just moves `as_of` forward.
+A request that finds the copy older than max_staleness waits for a
+refresh, so no response is staler than the bound. Each response reports
+how old its data is.
+
+The copies take as much memory as the database files, and twice that
+while a refresh replaces them. Reads of one copy are serialized on its
+connection.
+"""
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import shards as shard_storage
+import stats_rollup
+import voter_roll
+import voter_search
+
+
+class ReadOnlyCopy:
+    """An in-memory copy of one database file."""
+
+    def __init__(self, source_conn):
+        self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        source_conn.backup(self.conn)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA query_only = 1')
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        with self._lock:
+            yield self.conn
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class Generation:
+    """One consistent set of copies, with the read helpers the routes need."""
+
+    def __init__(self, number, copies, paths, as_of, max_staleness):
+        self.number = number
+        self.copies = copies
+        self.paths = paths
+        self.as_of = as_of
+        self.max_staleness = max_staleness
+        # Copies of the shards behave like their pools
+        self.shards = shard_storage.ShardSet(paths[0], len(copies) - 1, pools=copies[1:]) if len(copies) > 1 else None
+
+    def age(self):
+        return max(0.0, time.time() - self.as_of)
+
+    def info(self):
+        return {
+            'as_of': datetime.fromtimestamp(self.as_of).isoformat(),
+            'max_staleness_seconds': self.max_staleness,
+            'generation': self.number
+        }
+
+    def _main(self):
+        return self.copies[0].connection()
+
+    def timeline(self, days=7):
+        if self.shards:
+            return self.shards.timeline(days)
+        with self._main() as conn:
+            return stats_rollup.timeline(conn.cursor(), days)
+
+    def total_votes(self):
+        if self.shards:
+            return self.shards.total_votes()
+        with self._main() as conn:
+            return stats_rollup.total_votes(conn.cursor())
+
+    def most_active_hour(self):
+        if self.shards:
+            return self.shards.most_active_hour()
+        with self._main() as conn:
+            return stats_rollup.most_active_hour(conn.cursor())
+
+    def find_voters(self, filters, after='', limit=100):
+        if self.shards:
+            return voter_search.find_voters([copy.connection for copy in self.copies[1:]], filters, after, limit,
+                                            shard_for=self.shards.shard_for)
+        return voter_search.find_voters([self._main], filters, after, limit)
+
+    def voter_pages(self, page_size=voter_roll.EXPORT_PAGE_SIZE, after=''):
+        if self.shards:
+            return self.shards.iter_voter_pages(page_size, after)
+        return voter_roll.iter_voter_pages(self._main, page_size, after)
+
+
+class AnalyticsSnapshot:
+    def __init__(self, sources, max_staleness=5.0, connect=None):
+        """`sources()` returns [main database, shard files...]; `connect(path)`
+        opens a connection to one of them that any thread may use."""
+        self.sources = sources
+        self.max_staleness = max_staleness
+        self.connect = connect or (lambda path: sqlite3.connect(path, check_same_thread=False))
+        self.generation = None
+        self._watchers = {}
+        self._versions = {}
+        self._refresh_lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.refreshes = 0
+        self.copies_made = 0
+        self.waits = 0
+        self.last_copy_seconds = None
+        self.last_error = None
+
+    # ========== PUBLIC API ==========
+    def current(self):
+        """The newest generation, refreshed first if it is older than the bound."""
+        self._ensure_started()
+        generation = self.generation
+        if generation is None or generation.age() > self.max_staleness or self._sources_changed(generation):
+            self.waits += 1
+            generation = self.refresh(max_age=self.max_staleness)
+        return generation
+
+    def refresh(self, max_age=0.0):
+        """Bring the copies up to date; single flight, so concurrent callers
+        reuse a refresh that finished while they waited."""
+        with self._refresh_lock:
+            generation = self.generation
+            if generation is not None and generation.age() <= max_age and not self._sources_changed(generation):
+                return generation
+            paths = list(self.sources())
+            started = time.time()
+            watchers = [self._watcher(path) for path in paths]
+            versions = [watcher.execute('PRAGMA data_version').fetchone()[0] for watcher in watchers]
+            self.refreshes += 1
+            if (generation is not None and generation.paths == paths
+                    and versions == [self._versions.get(path) for path in paths]):
+                # Nothing committed since the last copy: it is current as of now
+                generation.as_of = started
+                return generation
+
+            copy_started = time.perf_counter()
+            copies = [ReadOnlyCopy(watcher) for watcher in watchers]
+            self.last_copy_seconds = round(time.perf_counter() - copy_started, 3)
+            self.copies_made += 1
+            self._versions = dict(zip(paths, versions))
+            number = generation.number + 1 if generation is not None else 1
+            fresh = Generation(number, copies, paths, started, self.max_staleness)
+            # Streams still reading the old copies keep them alive until they finish
+            self.generation = fresh
+            return fresh
+
+    def stats(self):
+        generation = self.generation
+        return {
+            'generation': generation.number if generation else 0,
+            'age_seconds': round(generation.age(), 3) if generation else None,
+            'max_staleness_seconds': self.max_staleness,
+            'refreshes': self.refreshes,
+            'copies': self.copies_made,
+            'waits': self.waits,
+            'last_copy_seconds': self.last_copy_seconds,
+            'last_error': self.last_error
+        }
+
+    # ========== REFRESHER THREAD ==========
+    def _sources_changed(self, generation):
+        return generation.paths != list(self.sources())
+
+    def _watcher(self, path):
+        # A long-lived connection: data_version only tracks commits made
+        # by other connections since this one last asked
+        watcher = self._watchers.get(path)
+        if watcher is None:
+            watcher = self._watchers[path] = self.connect(path)
+        return watcher
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='analytics-refresh', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.max_staleness / 2)
+            try:
+                self.refresh(max_age=self.max_staleness / 2)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
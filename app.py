@@ -1,33 +1,39 @@
 from flask import Flask, jsonify, request
 from flask_cors import CORS
-import sqlite3
+import db_pool
 
 app = Flask(__name__)
 CORS(app)
 
-# Connect to SQLite database
+# Connect to SQLite database (shared pool, see db_pool.py)
 def get_db():
-    conn = sqlite3.connect('voting.db')
-    return conn
+    return db_pool.get_pool('voting.db').acquire()
+
+def release_db(conn):
+    db_pool.get_pool('voting.db').release(conn)
 
 # Create tables
 def init_db():
     conn = get_db()
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS candidates
-                 (id INTEGER PRIMARY KEY, name TEXT, party TEXT, votes INTEGER)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS voters
-                 (id TEXT PRIMARY KEY, name TEXT, has_voted BOOLEAN)''')
-    conn.commit()
-    conn.close()
+    try:
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS candidates
+                     (id INTEGER PRIMARY KEY, name TEXT, party TEXT, votes INTEGER)''')
+        c.execute('''CREATE TABLE IF NOT EXISTS voters
+                     (id TEXT PRIMARY KEY, name TEXT, has_voted BOOLEAN)''')
+        conn.commit()
+    finally:
+        release_db(conn)
 
 @app.route('/api/candidates')
 def get_candidates():
     conn = get_db()
-    c = conn.cursor()
-    c.execute("SELECT * FROM candidates")
-    candidates = c.fetchall()
-    conn.close()
+    try:
+        c = conn.cursor()
+        c.execute("SELECT * FROM candidates")
+        candidates = [tuple(row) for row in c.fetchall()]
+    finally:
+        release_db(conn)
     return jsonify(candidates)
 
 @app.route('/api/vote', methods=['POST'])
@@ -0,0 +1,241 @@
+"""
+ASGI SERVING MODE
+File: asgi.py
+Run: uvicorn asgi:app --port 5000   (or: python asgi.py)
+
+Serves every route of voting.py from an asyncio event loop. Request
+handling (and with it all SQLite work) runs on a bounded thread pool, and
+/api/results/stream is served natively: each subscriber is an asyncio
+queue fed by the shared results broadcaster, not a thread. Request bodies
+up to ASGI_BUFFER_BYTES are read on the loop before the app runs, so a
+slow client only costs a coroutine while it uploads or downloads. A longer
+body (a voter roll import) is streamed: wsgi.input pulls each ASGI message
+from the loop as the app reads, so memory stays flat whatever its size,
+but the request holds a thread for the whole upload. Those requests run on
+their own pool of ASGI_STREAM_WORKERS threads, and wait for a free one
+there, so slow uploads never take a thread from the other requests.
+"""
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import voting
+
+
+ASGI_DB_WORKERS = int(os.environ.get('ASGI_DB_WORKERS', '16'))
+# Bodies longer than this are streamed into the app instead of read up front
+ASGI_BUFFER_BYTES = int(os.environ.get('ASGI_BUFFER_BYTES', str(1024 * 1024)))
+# Requests with a streamed body running at once; the rest wait on the loop
+ASGI_STREAM_WORKERS = int(os.environ.get('ASGI_STREAM_WORKERS', '2'))
+
+executor = ThreadPoolExecutor(max_workers=ASGI_DB_WORKERS, thread_name_prefix='asgi-db')
+stream_executor = ThreadPoolExecutor(max_workers=ASGI_STREAM_WORKERS, thread_name_prefix='asgi-upload')
+
+
+# ========== WSGI BRIDGE ==========
+class ReceiveStream(io.RawIOBase):
+    """wsgi.input for a long body: the rest is received as the app reads it."""
+
+    def __init__(self, loop, receive, head):
+        self.loop = loop
+        self.receive = receive
+        self.pending = memoryview(head)
+        self.more_body = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        # Runs on an executor thread; each receive() is awaited on the loop
+        while not self.pending:
+            if not self.more_body:
+                return 0
+            message = asyncio.run_coroutine_threadsafe(self.receive(), self.loop).result()
+            if message['type'] == 'http.disconnect':
+                raise OSError('Client disconnected before the request body was complete')
+            self.pending = memoryview(message.get('body', b''))
+            self.more_body = message.get('more_body', False)
+        size = min(len(buffer), len(self.pending))
+        buffer[:size] = self.pending[:size]
+        self.pending = self.pending[size:]
+        return size
+
+
+def build_environ(scope, body):
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        # The input ends with the request body, with or without Content-Length
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    for raw_name, raw_value in scope['headers']:
+        name = raw_name.decode('latin1').upper().replace('-', '_')
+        value = raw_value.decode('latin1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'CONTENT_LENGTH':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def start_wsgi(environ):
+    """Run the Flask app up to its first body chunk (on an executor thread)."""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers]
+
+    result = voting.app(environ, start_response)
+    iterator = iter(result)
+    first = next(iterator, None)
+    return started['status'], started['headers'], result, iterator, first
+
+
+def close_wsgi(result):
+    close = getattr(result, 'close', None)
+    if close is not None:
+        close()
+
+
+async def read_body(receive):
+    """wsgi.input for the request: in memory up to ASGI_BUFFER_BYTES, streamed beyond."""
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunk = message.get('body', b'')
+        chunks.append(chunk)
+        size += len(chunk)
+        if not message.get('more_body', False):
+            return io.BytesIO(b''.join(chunks))
+        if size > ASGI_BUFFER_BYTES:
+            stream = ReceiveStream(asyncio.get_running_loop(), receive, b''.join(chunks))
+            return io.BufferedReader(stream, buffer_size=64 * 1024)
+
+
+async def serve_wsgi(scope, receive, send):
+    body = await read_body(receive)
+    if body is None:
+        return
+
+    loop = asyncio.get_running_loop()
+    # The app reads a streamed body while it runs, for as long as the upload takes
+    streamed = isinstance(body, io.BufferedReader)
+    status, headers, result, iterator, chunk = await loop.run_in_executor(
+        stream_executor if streamed else executor, start_wsgi, build_environ(scope, body)
+    )
+    try:
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        if chunk is None:
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        # Each further chunk is pulled on the pool, so a streamed response
+        # never pins a worker while it waits on the client.
+        while chunk is not None:
+            following = await loop.run_in_executor(executor, next, iterator, None)
+            more = following is not None
+            if chunk or not more:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': more})
+            chunk = following
+    finally:
+        await loop.run_in_executor(executor, close_wsgi, result)
+
+
+# ========== NATIVE ROUTES ==========
+async def serve_results_stream(scope, receive, send):
+    broadcaster = voting.get_results_broadcaster()
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+            (b'access-control-allow-origin', b'*')
+        ]
+    })
+
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+                return
+
+    watcher = asyncio.create_task(watch_disconnect())
+    stream = broadcaster.subscribe_async()
+    try:
+        async for frame in stream:
+            if disconnected.is_set():
+                break
+            await send({'type': 'http.response.body', 'body': frame.encode('utf8'), 'more_body': True})
+    except OSError:
+        pass
+    finally:
+        watcher.cancel()
+        await stream.aclose()
+
+
+NATIVE_ROUTES = {
+    ('GET', '/api/results/stream'): serve_results_stream
+}
+
+
+# ========== ASGI ENTRY POINT ==========
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await asyncio.get_running_loop().run_in_executor(executor, voting.startup)
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False)
+            stream_executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    handler = NATIVE_ROUTES.get((scope['method'], scope['path']), serve_wsgi)
+    await handler(scope, receive, send)
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit('ASGI mode needs an ASGI server: pip install uvicorn')
+    uvicorn.run('asgi:app', host='0.0.0.0', port=5000, log_level='warning')
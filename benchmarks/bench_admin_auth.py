@@ -0,0 +1,85 @@
+"""
+BENCHMARK: ADMIN AUTHENTICATION OVERHEAD
+File: benchmarks/bench_admin_auth.py
+Run: python benchmarks/bench_admin_auth.py [--requests 5000] [--validations 200000]
+
+Measures what require_admin adds to an admin request: raw token
+validation, the decorator around a trivial view, and a full
+GET /api/admin/voters?limit=10 through the Flask test client with and
+without the check (same view, decorator swapped out). For comparison it
+also times the per-call admin row lookup that a database-backed session
+check would need, and one login (PBKDF2 verify) at the configured cost.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# All load comes from one client address; the per-IP limits would throttle it
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+import voting
+
+
+def per_call(fn, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        fn()
+    return (time.perf_counter() - started) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--validations', type=int, default=200_000)
+    parser.add_argument('--logins', type=int, default=5)
+    args = parser.parse_args()
+
+    voting.DATABASE = os.path.join(tempfile.mkdtemp(prefix='auth-bench-'), 'voting.db')
+    voting.init_db()
+    client = voting.app.test_client()
+    token = client.post('/api/admin/login', json={'username': 'admin', 'password': 'admin123'}).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+    auth = voting.admin_auth
+
+    rows = []
+    rows.append(('token validation', per_call(lambda: auth.validate(token), args.validations)))
+
+    guarded = auth.required(lambda: 'ok')
+    with voting.app.test_request_context('/', headers=headers):
+        rows.append(('decorator, trivial view', per_call(guarded, args.validations // 4)))
+
+    with voting.get_pool().connection() as conn:
+        lookup = lambda: conn.execute('SELECT * FROM admin WHERE username = ?', ('admin',)).fetchone()
+        rows.append(('admin row lookup (SQLite)', per_call(lookup, args.validations // 4)))
+
+    # Alternate short blocks of both variants so drift affects them equally
+    protected = voting.app.view_functions['get_all_voters']
+    fetch = lambda: client.get('/api/admin/voters?limit=10', headers=headers)
+    assert fetch().status_code == 200
+    with_auth = without_auth = 0
+    block = max(1, args.requests // 20)
+    for _ in range(20):
+        with_auth += per_call(fetch, block) / 20
+        voting.app.view_functions['get_all_voters'] = protected.__wrapped__
+        try:
+            without_auth += per_call(fetch, block) / 20
+        finally:
+            voting.app.view_functions['get_all_voters'] = protected
+    rows.append(('request without auth', without_auth))
+    rows.append(('request with auth', with_auth))
+
+    login = lambda: client.post('/api/admin/login', json={'username': 'admin', 'password': 'admin123'})
+    rows.append((f'login ({auth.iterations} PBKDF2 rounds)', per_call(login, args.logins)))
+
+    print(f"{'step':<36} {'per call':>12}")
+    for label, seconds in rows:
+        print(f'{label:<36} {seconds * 1e6:>10.2f}µs')
+    print(f'auth overhead per admin request: {(with_auth - without_auth) * 1e6:.2f}µs '
+          f'({(with_auth - without_auth) / without_auth * 100:+.1f}%)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+BENCHMARK: VOTE LATENCY UNDER DASHBOARD LOAD, LIVE VS ANALYTICS SNAPSHOT
+File: benchmarks/bench_analytics.py
+Run: python benchmarks/bench_analytics.py [--voters 500000] [--seconds 10] [--dashboards 8]
+
+Starts the threaded development server on a copy of a generated
+electorate, once with ANALYTICS_SNAPSHOT=0 and once with 1. In each mode
+it casts votes from --voter-threads clients for --seconds, first alone and
+then while --dashboards clients poll what the admin dashboard reads:
+/api/stats, /api/results, keyset pages of /api/admin/voters (unvoted and
+voted filters, name searches) and, with --full-roll, the whole roll.
+Reports vote latency percentiles, dashboard throughput and, in analytics
+mode, the largest X-Analytics-Age seen against the bound.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# All load comes from one client address; the per-IP limits would throttle it
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+import load_suite
+
+
+def request(conn, method, path, body=None, headers=None):
+    headers = dict(headers or {})
+    payload = None
+    if body is not None:
+        payload = json.dumps(body)
+        headers['Content-Type'] = 'application/json'
+    conn.request(method, path, payload, headers)
+    response = conn.getresponse()
+    response.body = response.read()
+    return response
+
+
+def start_server(workdir, port, env):
+    process = subprocess.Popen(
+        [sys.executable, '-c', load_suite.SERVER.format(repo=load_suite.REPO, port=port)],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 60
+    while True:
+        try:
+            if request(http.client.HTTPConnection('127.0.0.1', port, timeout=5), 'GET', '/api/health').status == 200:
+                return process
+        except OSError:
+            if time.monotonic() > deadline:
+                process.terminate()
+                raise RuntimeError('server did not start')
+            time.sleep(0.2)
+
+
+def percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+def run_phase(port, args, token, phase, dashboards):
+    stop = threading.Event()
+    votes, reads, ages, errors = [], [], [], []
+    lock = threading.Lock()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def voter(index):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        local, n = [], 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = request(conn, 'POST', '/api/vote',
+                               {'voter_id': f'BENCH-{phase}-{index}-{n}', 'candidate_id': n % args.candidates + 1})
+            local.append(time.perf_counter() - started)
+            if response.status != 200:
+                errors.append(f'vote {response.status}')
+            n += 1
+        with lock:
+            votes.extend(local)
+
+    def dashboard(index):
+        rng = random.Random(index)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        paths = ['/api/stats', '/api/results', '/api/admin/voters?has_voted=0&limit=1000',
+                 '/api/admin/voters?has_voted=1&limit=1000']
+        local_reads, local_ages = 0, []
+        while not stop.is_set():
+            choice = rng.random()
+            if choice < 0.4:
+                path = rng.choice(paths)
+            elif choice < 0.7:
+                path = f'/api/admin/voters?q=voter{rng.randint(1, 9999)}&limit=100'
+            elif choice < 0.95 or not args.full_roll:
+                path = f'/api/admin/voters?limit=1000&after=VOTER{rng.randint(1, args.voters)}'
+            else:
+                path = '/api/admin/voters'
+            response = request(conn, 'GET', path, headers=headers)
+            if response.status != 200:
+                errors.append(f'{path} {response.status}')
+            if response.getheader('X-Analytics-Age'):
+                local_ages.append(float(response.getheader('X-Analytics-Age')))
+            local_reads += 1
+        with lock:
+            reads.append(local_reads)
+            ages.extend(local_ages)
+
+    threads = [threading.Thread(target=voter, args=(i,)) for i in range(args.voter_threads)]
+    threads += [threading.Thread(target=dashboard, args=(i,)) for i in range(dashboards)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    votes.sort()
+    return {
+        'votes': len(votes),
+        'p50': percentile(votes, 50) * 1000,
+        'p99': percentile(votes, 99) * 1000,
+        'max': (votes[-1] if votes else 0) * 1000,
+        'reads_per_s': sum(reads) / args.seconds,
+        'max_age': max(ages) if ages else None,
+        'errors': errors
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--voters', type=int, default=500_000)
+    parser.add_argument('--candidates', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--voter-threads', type=int, default=4)
+    parser.add_argument('--dashboards', type=int, default=8)
+    parser.add_argument('--staleness', type=float, default=5, help='ANALYTICS_MAX_STALENESS')
+    parser.add_argument('--full-roll', action='store_true', help='dashboards also fetch the whole roll')
+    parser.add_argument('--port', type=int, default=5097)
+    args = parser.parse_args()
+
+    source = load_suite.electorate(args.voters, args.candidates, 0.3)
+    failures = []
+    print(f"{'mode':<10} {'phase':<16} {'votes':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'reads/s':>8} {'max age s':>10}")
+    for mode in ('live', 'analytics'):
+        workdir = tempfile.mkdtemp(prefix='analytics-bench-')
+        shutil.copy(source, os.path.join(workdir, 'voting.db'))
+        env = dict(os.environ, TALLY_CHECKPOINT_SECONDS='0', ANALYTICS_MAX_STALENESS=str(args.staleness),
+                   ANALYTICS_SNAPSHOT='1' if mode == 'analytics' else '0')
+        process = start_server(workdir, args.port, env)
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', args.port, timeout=30)
+            login = request(conn, 'POST', '/api/admin/login', {'username': 'admin', 'password': 'admin123'})
+            token = json.loads(login.body)['token']
+            for phase, dashboards in (('votes only', 0), ('with dashboards', args.dashboards)):
+                result = run_phase(args.port, args, token, f'{mode}-{phase[0]}', dashboards)
+                age = f"{result['max_age']:.2f}" if result['max_age'] is not None else '-'
+                print(f"{mode:<10} {phase:<16} {result['votes']:>7} {result['p50']:>8.2f} {result['p99']:>8.2f} "
+                      f"{result['max']:>8.1f} {result['reads_per_s']:>8.1f} {age:>10}")
+                failures.extend(f'{mode} {phase}: {error}' for error in result['errors'][:5])
+                if result['max_age'] is not None and result['max_age'] > args.staleness:
+                    failures.append(f"{mode}: served data {result['max_age']:.2f}s old, bound {args.staleness}s")
+        finally:
+            process.terminate()
+            process.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    for failure in failures:
+        print(f'❌ {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
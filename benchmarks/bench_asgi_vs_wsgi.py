@@ -0,0 +1,211 @@
+"""
+BENCHMARK: ASGI VS WSGI SERVING UNDER MANY CONCURRENT CLIENTS
+File: benchmarks/bench_asgi_vs_wsgi.py
+Run: python benchmarks/bench_asgi_vs_wsgi.py [--clients 1000] [--requests 5] [--watchers 200]
+
+Starts the Flask development server (threaded WSGI, as `python voting.py`
+does) and the ASGI app under uvicorn, each on a scratch database, then
+opens --clients concurrent keep-alive connections issuing a mix of voter
+status checks, votes and results polls while --watchers clients hold
+/api/results/stream open. Reports throughput, latency percentiles, errors
+and the server's thread count.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# All load comes from one client address; the per-IP limits would throttle it
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+SERVERS = {
+    'wsgi': "import voting; voting.startup(); voting.app.run(port={port}, threaded=True)",
+    'asgi': "import uvicorn; uvicorn.run('asgi:app', port={port}, log_level='error', backlog=4096)"
+}
+
+
+def start_server(mode, port):
+    workdir = tempfile.mkdtemp(prefix=f'{mode}-bench-')
+    env = dict(os.environ, PYTHONPATH=REPO, TALLY_CHECKPOINT_SECONDS='0')
+    return subprocess.Popen(
+        [sys.executable, '-c', SERVERS[mode].format(port=port)],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def thread_count(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('Threads:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+async def wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'GET /api/health HTTP/1.1\r\nHost: bench\r\n\r\n')
+            await writer.drain()
+            line = await reader.readline()
+            writer.close()
+            if line.startswith(b'HTTP/1.1 200') or line.startswith(b'HTTP/1.0 200'):
+                return
+        except OSError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+async def http_request(reader, writer, method, path, body=None):
+    payload = json.dumps(body).encode() if body is not None else b''
+    head = f'{method} {path} HTTP/1.1\r\nHost: bench\r\nConnection: keep-alive\r\n'
+    if body is not None:
+        head += f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n'
+    writer.write(head.encode() + b'\r\n' + payload)
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+    length = None
+    keep_alive = not status_line.startswith(b'HTTP/1.0')
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'connection':
+            keep_alive = value.strip().lower() == 'keep-alive'
+    if length is not None:
+        await reader.readexactly(length)
+    else:
+        await reader.read()
+        keep_alive = False
+    return status, keep_alive
+
+
+async def client(port, client_id, requests, latencies, errors):
+    reader = writer = None
+    for n in range(requests):
+        kind = n % 3
+        if kind == 0:
+            method, path, body = 'GET', f'/api/voter/LOAD{client_id:06d}', None
+        elif kind == 1:
+            method, path, body = 'POST', '/api/vote', {'voter_id': f'LOAD{client_id:06d}_{n}', 'candidate_id': (n % 8) + 1}
+        else:
+            method, path, body = 'GET', '/api/results', None
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            status, keep_alive = await http_request(reader, writer, method, path, body)
+            if status >= 500:
+                errors.append(status)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            errors.append(type(e).__name__)
+            writer = None
+            continue
+        latencies.append(time.perf_counter() - started)
+    if writer is not None:
+        writer.close()
+
+
+async def watcher(port, stop, received):
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'GET /api/results/stream HTTP/1.1\r\nHost: bench\r\n\r\n')
+        await writer.drain()
+        while not stop.is_set():
+            try:
+                line = await asyncio.wait_for(reader.readline(), 0.5)
+            except asyncio.TimeoutError:
+                continue
+            if not line:
+                break
+            if line.startswith(b'event: delta'):
+                received.append(1)
+        writer.close()
+    except OSError:
+        pass
+
+
+def percentile(values, pct):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_load(mode, port, clients, requests, watchers):
+    process = start_server(mode, port)
+    try:
+        await wait_until_up(port)
+        stop = asyncio.Event()
+        deltas = []
+        watcher_tasks = [asyncio.create_task(watcher(port, stop, deltas)) for _ in range(watchers)]
+        await asyncio.sleep(1)
+
+        latencies, errors = [], []
+        started = time.perf_counter()
+        await asyncio.gather(*(client(port, i, requests, latencies, errors) for i in range(clients)))
+        elapsed = time.perf_counter() - started
+        threads = thread_count(process.pid)
+
+        stop.set()
+        await asyncio.gather(*watcher_tasks)
+        return {
+            'mode': mode,
+            'clients': clients,
+            'watchers': watchers,
+            'requests': len(latencies),
+            'errors': len(errors),
+            'seconds': round(elapsed, 2),
+            'req_per_sec': round(len(latencies) / elapsed, 1) if elapsed else 0,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+            'server_threads': threads,
+            'stream_deltas': len(deltas)
+        }
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ASGI vs WSGI load comparison')
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=5, help='requests per client')
+    parser.add_argument('--watchers', type=int, default=200, help='open /api/results/stream connections')
+    parser.add_argument('--modes', default='wsgi,asgi')
+    parser.add_argument('--port', type=int, default=5101)
+    args = parser.parse_args()
+
+    rows = []
+    for offset, mode in enumerate(args.modes.split(',')):
+        rows.append(asyncio.run(run_load(mode, args.port + offset, args.clients, args.requests, args.watchers)))
+
+    columns = ['mode', 'clients', 'watchers', 'requests', 'errors', 'seconds', 'req_per_sec', 'p50_ms', 'p99_ms', 'server_threads', 'stream_deltas']
+    print(' '.join(f'{c:>14}' for c in columns))
+    for row in rows:
+        print(' '.join(f'{str(row[c]):>14}' for c in columns))
+
+
+if __name__ == '__main__':
+    main()
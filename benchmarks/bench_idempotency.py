@@ -0,0 +1,116 @@
+"""
+BENCHMARK: VOTE RETRY STORM WITH AND WITHOUT IDEMPOTENCY KEYS
+File: benchmarks/bench_idempotency.py
+Run: python benchmarks/bench_idempotency.py [--seconds 5] [--voter-threads 8] [--retries 5] [--max-keys 100000]
+
+For --seconds, --voter-threads clients cast one ballot per new voter and
+then send it --retries more times, as a client does when its first
+attempt timed out. Without keys every retry is told 403 "already voted"
+although its ballot was counted; with an Idempotency-Key per ballot it
+gets the first 200 back. Reports first-attempt and retry latency, how the
+retries were answered, SQL statements per request and, with keys, the hit
+rate and the keys and bytes held (at most --max-keys entries).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# All load comes from one client address; the per-IP limits would throttle it
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+import voting
+from metrics import metrics
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0
+
+
+def run(keyed, args):
+    voting.DATABASE = os.path.join(tempfile.mkdtemp(prefix='idempotency-bench-'), 'voting.db')
+    voting.init_db()
+    voting.idempotency.max_entries = args.max_keys
+    voting.idempotency.clear()
+    voting.idempotency.hits = voting.idempotency.misses = 0
+    client = voting.app.test_client()
+    client.get('/api/candidates')
+
+    queries_before = sum(entry.queries for entry in metrics.endpoints.values())
+    stop = threading.Event()
+    firsts, retries, answers = [], [], Counter()
+    lock = threading.Lock()
+
+    def voter(index):
+        voter_client = voting.app.test_client()
+        local_firsts, local_retries, local_answers = [], [], Counter()
+        n = index
+        while not stop.is_set():
+            n += args.voter_threads
+            ballot = {'voter_id': f'retry-{n}', 'candidate_id': n % 8 + 1}
+            headers = {'Idempotency-Key': f'ballot-{n}'} if keyed else {}
+            started = time.perf_counter()
+            voter_client.post('/api/vote', json=ballot, headers=headers)
+            local_firsts.append(time.perf_counter() - started)
+            for _ in range(args.retries):
+                started = time.perf_counter()
+                response = voter_client.post('/api/vote', json=ballot, headers=headers)
+                local_retries.append(time.perf_counter() - started)
+                local_answers[response.status_code] += 1
+        with lock:
+            firsts.extend(local_firsts)
+            retries.extend(local_retries)
+            answers.update(local_answers)
+
+    threads = [threading.Thread(target=voter, args=(n,)) for n in range(args.voter_threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    stats = voting.idempotency.stats()
+    requests = len(firsts) + len(retries)
+    voting.db_pool.close_all()
+    return {
+        'keys': 'on' if keyed else 'off',
+        'ballots': len(firsts),
+        'requests_per_sec': requests / elapsed,
+        'first_p50_ms': percentile(firsts, 0.50) * 1000,
+        'retry_p50_ms': percentile(retries, 0.50) * 1000,
+        'retry_p99_ms': percentile(retries, 0.99) * 1000,
+        'answers': dict(answers),
+        'sql_per_request': (sum(entry.queries for entry in metrics.endpoints.values()) - queries_before) / max(requests, 1),
+        'hit_rate': stats['hit_rate'] if keyed else None,
+        'held': f"{stats['entries']} / {stats['bytes'] // 1024} KiB" if keyed else '-'
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--voter-threads', type=int, default=8)
+    parser.add_argument('--retries', type=int, default=5, help='repeats of every ballot after the first attempt')
+    parser.add_argument('--max-keys', type=int, default=100_000, help='IDEMPOTENCY_MAX_KEYS')
+    args = parser.parse_args()
+
+    print(f"{'keys':<5} {'ballots':>8} {'req/s':>7} {'first p50':>10} {'retry p50':>10} {'retry p99':>10} "
+          f"{'SQL/req':>8} {'hit %':>6} {'held':>16}  retries answered")
+    for keyed in (False, True):
+        r = run(keyed, args)
+        hit_rate = f"{r['hit_rate']:.1f}" if r['hit_rate'] is not None else '-'
+        print(f"{r['keys']:<5} {r['ballots']:>8} {r['requests_per_sec']:>7.0f} {r['first_p50_ms']:>10.2f} "
+              f"{r['retry_p50_ms']:>10.3f} {r['retry_p99_ms']:>10.3f} {r['sql_per_request']:>8.2f} {hit_rate:>6} "
+              f"{r['held']:>16}  {r['answers']}")
+
+
+if __name__ == '__main__':
+    main()
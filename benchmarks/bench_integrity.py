@@ -0,0 +1,160 @@
+"""
+BENCHMARK: VOTE LATENCY WITH THE INTEGRITY VERIFIER RUNNING
+File: benchmarks/bench_integrity.py
+Run: python benchmarks/bench_integrity.py [--voters 2000000] [--seconds 15] [--voter-threads 4]
+
+Starts the threaded development server on a copy of a generated
+electorate, once with INTEGRITY_INTERVAL=0 (no verifier) and once with the
+verifier on. A copied electorate has never been verified, so in the second
+run the verifier makes its first full pass over the log (and sweeps the
+voted voters alongside) while --voter-threads clients vote, then keeps up
+with the new ballots. Reports vote latency without the verifier, during
+its first pass and once it has caught up, then how far it got, its lag
+behind the log and its findings (which must be none).
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# All load comes from one client address; the per-IP limits would throttle it
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+import load_suite
+
+SERVER = ("import sys; sys.path.insert(0, {repo!r}); import voting; voting.prepare_db(); voting.get_pool().warm(); "
+          "voting.get_tally(); voting.start_integrity_verifier(); voting.app.run(port={port}, threaded=True)")
+
+
+def request(conn, method, path, body=None, headers=None):
+    headers = dict(headers or {})
+    payload = None
+    if body is not None:
+        payload = json.dumps(body)
+        headers['Content-Type'] = 'application/json'
+    conn.request(method, path, payload, headers)
+    response = conn.getresponse()
+    response.body = response.read()
+    return response
+
+
+def start_server(workdir, port, env):
+    process = subprocess.Popen(
+        [sys.executable, '-c', SERVER.format(repo=load_suite.REPO, port=port)],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 120
+    while True:
+        try:
+            if request(http.client.HTTPConnection('127.0.0.1', port, timeout=5), 'GET', '/api/health').status == 200:
+                return process
+        except OSError:
+            if time.monotonic() > deadline:
+                process.terminate()
+                raise RuntimeError('server did not start')
+            time.sleep(0.2)
+
+
+def cast_votes(port, args, prefix):
+    stop = threading.Event()
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def voter(index):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        local, n = [], 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            response = request(conn, 'POST', '/api/vote',
+                               {'voter_id': f'{prefix}-{index}-{n}', 'candidate_id': n % args.candidates + 1})
+            local.append(time.perf_counter() - started)
+            if response.status != 200:
+                errors.append(response.status)
+            n += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=voter, args=(i,)) for i in range(args.voter_threads)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    latencies.sort()
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--voters', type=int, default=2_000_000)
+    parser.add_argument('--candidates', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=15)
+    parser.add_argument('--voter-threads', type=int, default=4)
+    parser.add_argument('--interval', type=float, default=10, help='INTEGRITY_INTERVAL')
+    parser.add_argument('--chunk-size', type=int, default=2000, help='INTEGRITY_CHUNK_SIZE')
+    parser.add_argument('--pause-ms', type=float, default=20, help='INTEGRITY_PAUSE_MS')
+    parser.add_argument('--port', type=int, default=5098)
+    args = parser.parse_args()
+
+    source = load_suite.electorate(args.voters, args.candidates, 0.3)
+    failures = []
+    print(f"{'verifier':<22} {'votes':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+
+    def phase(label, prefix):
+        latencies, errors = cast_votes(args.port, args, prefix)
+        pct = {p: load_suite.percentile(latencies, p) * 1000 for p in (50, 90, 99)}
+        print(f"{label:<22} {len(latencies):>7} {pct[50]:>8.2f} {pct[90]:>8.2f} {pct[99]:>8.2f} "
+              f"{latencies[-1] * 1000:>8.1f}")
+        failures.extend(f'{label}: vote returned {status}' for status in sorted(set(errors)))
+
+    for mode in ('off', 'on'):
+        workdir = tempfile.mkdtemp(prefix='integrity-bench-')
+        shutil.copy(source, os.path.join(workdir, 'voting.db'))
+        env = dict(os.environ, TALLY_CHECKPOINT_SECONDS='0', INTEGRITY_INTERVAL=str(args.interval) if mode == 'on' else '0',
+                   INTEGRITY_CHUNK_SIZE=str(args.chunk_size), INTEGRITY_PAUSE_MS=str(args.pause_ms))
+        process = start_server(workdir, args.port, env)
+        try:
+            if mode == 'off':
+                phase('off', 'BENCH-off')
+                continue
+            conn = http.client.HTTPConnection('127.0.0.1', args.port, timeout=30)
+            token = json.loads(request(conn, 'POST', '/api/admin/login',
+                                       {'username': 'admin', 'password': 'admin123'}).body)['token']
+
+            def report():
+                return json.loads(request(conn, 'GET', '/api/admin/integrity',
+                                          headers={'Authorization': f'Bearer {token}'}).body)
+
+            phase('on, first full pass', 'BENCH-first')
+            while report()['rounds'] == 0:
+                time.sleep(0.5)
+            phase('on, caught up', 'BENCH-steady')
+            result = report()
+            file = result['files'][0]
+            print(f"   verified {file['rows_checked']:,} log rows in {result['rounds']} passes and swept "
+                  f"{file['voters_checked']:,} voted voters; lag {result['lag_rows']} rows / "
+                  f"{result['lag_seconds']} s; {result['outstanding']} findings")
+            if result['outstanding'] or result['last_error']:
+                failures.append(f"verifier reported {result['outstanding']} findings, error {result['last_error']}")
+        finally:
+            process.terminate()
+            process.wait()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    for failure in failures:
+        print(f'❌ {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
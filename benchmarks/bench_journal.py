@@ -0,0 +1,51 @@
+"""
+BENCHMARK: VOTE JOURNAL APPEND AND REPLAY
+File: benchmarks/bench_journal.py
+Run: python benchmarks/bench_journal.py [--records 2000000] [--batch 64]
+
+Appends --records synthetic ballots to a scratch journal in batches of
+--batch (one msync per batch, as the group-commit writer does), then
+replays the file with and without checksum verification and reports
+records per second for each step.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import journal
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=2_000_000)
+    parser.add_argument('--batch', type=int, default=64)
+    parser.add_argument('--no-sync', action='store_true', help='skip msync after each batch')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix='journal-bench-'), 'voting.journal')
+    log = journal.VoteJournal(path, sync=not args.no_sync)
+    vote_time = '2026-01-01T09:00:00.000000'
+
+    started = time.perf_counter()
+    for first in range(0, args.records, args.batch):
+        log.append([(f'VOTER{n:03d}', n % 8 + 1, vote_time)
+                    for n in range(first, min(first + args.batch, args.records))])
+    append_seconds = time.perf_counter() - started
+    log.close()
+
+    print(f"{'step':<18} {'records':>10} {'seconds':>9} {'records/sec':>13}")
+    print(f"{'append':<18} {args.records:>10} {append_seconds:>9.2f} {args.records / append_seconds:>13,.0f}")
+    for label, check_crc in (('replay (crc)', True), ('replay (no crc)', False)):
+        state = journal.replay(path, check_crc=check_crc)
+        assert len(state.voters) == args.records, state.summary()
+        print(f'{label:<18} {state.records:>10} {state.seconds:>9.2f} {state.records / state.seconds:>13,.0f}')
+    print(f'journal size: {os.path.getsize(path) / 1e6:.1f} MB allocated')
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
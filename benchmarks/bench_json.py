@@ -0,0 +1,83 @@
+"""
+BENCHMARK: JSON ENCODING, COLUMNAR FORMAT AND COMPRESSION
+File: benchmarks/bench_json.py
+Run: python benchmarks/bench_json.py [--voters 100000] [--candidates 200] [--repeat 20]
+
+Serves /api/candidates, one 1000-voter page of /api/admin/voters and the
+streamed full voter roll through the Flask test client, with the stdlib
+or orjson encoder, row objects or ?format=columnar, and identity, gzip or
+brotli (when installed) content encoding. The response and compression
+caches are cleared before every request, so each row is the full cost of
+building, encoding and compressing the body. Reports bytes on the wire
+and CPU milliseconds per request; the first row of each endpoint (stdlib,
+objects, identity) is the behaviour before fast encoding was added.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# All load comes from one client address; the per-IP limits would throttle it
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+import compression
+import json_codec
+import load_suite
+import voting
+
+
+def measure(client, path, headers, repeat):
+    size = 0
+    started = time.process_time()
+    for _ in range(repeat):
+        voting.response_cache.clear()
+        voting.compressor.clear()
+        response = client.get(path, headers=headers)
+        assert response.status_code == 200, response.status_code
+        size = len(response.get_data())
+    return size, (time.process_time() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--voters', type=int, default=100_000)
+    parser.add_argument('--candidates', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    source = load_suite.electorate(args.voters, args.candidates, 0.3)
+    voting.DATABASE = os.path.join(tempfile.mkdtemp(prefix='json-bench-'), 'voting.db')
+    shutil.copy(source, voting.DATABASE)
+    client = voting.app.test_client()
+    token = client.post('/api/admin/login', json={'username': 'admin', 'password': 'admin123'}).get_json()['token']
+
+    endpoints = [
+        ('candidates', '/api/candidates', True, args.repeat * 10),
+        ('voter page', '/api/admin/voters?limit=1000', True, args.repeat * 5),
+        ('voter roll', '/api/admin/voters', False, max(1, args.repeat // 10))
+    ]
+    encoders = [False, True] if json_codec.AVAILABLE else [False]
+    encodings = ['identity', 'gzip'] + (['br'] if compression.brotli is not None else [])
+
+    print(f"{'endpoint':<12} {'encoder':<8} {'format':<9} {'encoding':<9} {'bytes':>11} {'cpu ms':>9} {'vs before':>10}")
+    for label, path, columnar_ok, repeat in endpoints:
+        baseline = None
+        for fast in encoders:
+            json_codec.enabled = fast
+            for fmt in ['objects', 'columnar'] if columnar_ok else ['objects']:
+                url = path + ('&' if '?' in path else '?') + 'format=columnar' if fmt == 'columnar' else path
+                for encoding in encodings:
+                    headers = {'Authorization': f'Bearer {token}', 'Accept-Encoding': encoding}
+                    size, cpu = measure(client, url, headers, repeat)
+                    baseline = baseline or cpu
+                    print(f"{label:<12} {json_codec.encoder_name():<8} {fmt:<9} {encoding:<9} {size:>11,} "
+                          f"{cpu * 1000:>9.3f} {baseline / cpu:>9.2f}x")
+    json_codec.enabled = voting.JSON_FAST
+
+
+if __name__ == '__main__':
+    main()
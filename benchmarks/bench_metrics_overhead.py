@@ -0,0 +1,79 @@
+"""
+BENCHMARK: INSTRUMENTATION OVERHEAD
+File: benchmarks/bench_metrics_overhead.py
+Run: python benchmarks/bench_metrics_overhead.py [--requests 5000] [--repeat 3]
+
+Runs the same in-process request mix (voter status checks, votes, results
+polls, candidate listings) through the Flask test client with metrics off,
+metrics on, and metrics plus the sampling profiler, each in a fresh
+interpreter on a scratch database, and reports throughput and the overhead
+relative to the uninstrumented run. The best of --repeat runs is kept.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# All load comes from one client address; the per-IP limits would throttle it
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+WORKER = '''
+import json, os, sys, time
+sys.path.insert(0, {repo!r})
+import voting
+voting.DATABASE = os.path.join({workdir!r}, 'voting.db')
+voting.init_db()
+if os.environ.get('PROFILER_ENABLED') == '1':
+    voting.profiler.start()
+client = voting.app.test_client()
+requests = {requests}
+started = time.perf_counter()
+for n in range(requests):
+    kind = n % 4
+    if kind == 0:
+        client.get('/api/voter/VOTER%03d' % (n % 100 + 1))
+    elif kind == 1:
+        client.post('/api/vote', json={{'voter_id': 'BENCH%07d' % n, 'candidate_id': n % 8 + 1}})
+    elif kind == 2:
+        client.get('/api/results')
+    else:
+        client.get('/api/candidates')
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed}}))
+'''
+
+MODES = {
+    'off': {'METRICS_ENABLED': '0', 'PROFILER_ENABLED': '0'},
+    'metrics': {'METRICS_ENABLED': '1', 'PROFILER_ENABLED': '0'},
+    'metrics+profiler': {'METRICS_ENABLED': '1', 'PROFILER_ENABLED': '1'}
+}
+
+
+def run_once(mode, requests):
+    workdir = tempfile.mkdtemp(prefix='metrics-bench-')
+    env = dict(os.environ, TALLY_CHECKPOINT_SECONDS='0', **MODES[mode])
+    code = WORKER.format(repo=REPO, workdir=workdir, requests=requests)
+    output = subprocess.run([sys.executable, '-c', code], cwd=workdir, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])['seconds']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure instrumentation overhead')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    best = {mode: min(run_once(mode, args.requests) for _ in range(args.repeat)) for mode in MODES}
+    baseline = best['off']
+    print(f"{'mode':>18} {'req/s':>10} {'us/request':>12} {'overhead':>10}")
+    for mode, seconds in best.items():
+        overhead = (seconds - baseline) / baseline * 100
+        print(f'{mode:>18} {args.requests / seconds:>10.0f} {seconds / args.requests * 1e6:>12.1f} {overhead:>9.1f}%')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+BENCHMARK: RANKED-CHOICE TABULATION
+File: benchmarks/bench_ranked.py
+Run: python benchmarks/bench_ranked.py [--ballots 10000000] [--candidates 8] [--stored 1000000]
+
+Generates --ballots synthetic ranked ballots (partial rankings with a few
+popular candidates) straight into a ballot buffer. It times IRV and
+3-seat STV on them with the NumPy engine, and on --python-ballots of them
+with the pure-Python engine. It also stores --stored ballots in a scratch
+SQLite database and times the first and the incremental BallotBox load.
+The two engines must elect the same candidates.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ranked
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def generate(count, candidates, width, seed=7):
+    """`count` encoded ballots of 1..width preferences as one buffer."""
+    rng = np.random.default_rng(seed)
+    popularity = np.linspace(1.5, 0.0, candidates).astype(np.float32)
+    chunks = []
+    for start in range(0, count, 1_000_000):
+        size = min(1_000_000, count - start)
+        noise = rng.random((size, candidates), dtype=np.float32) + popularity * rng.random((size, 1), dtype=np.float32)
+        order = np.argsort(-noise, axis=1)[:, :width].astype('<u2') + 1
+        lengths = rng.integers(1, width + 1, size)
+        order[np.arange(width) >= lengths[:, None]] = 0
+        chunks.append(order.tobytes())
+    return b''.join(chunks)
+
+
+def timed(label, function):
+    started = time.perf_counter()
+    result = function()
+    print(f'{label:<44} {time.perf_counter() - started:8.2f} s')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ballots', type=int, default=10_000_000)
+    parser.add_argument('--candidates', type=int, default=8)
+    parser.add_argument('--width', type=int, default=8, help='ranks per ballot')
+    parser.add_argument('--python-ballots', type=int, default=1_000_000)
+    parser.add_argument('--stored', type=int, default=1_000_000, help='ballots loaded from SQLite')
+    args = parser.parse_args()
+    if np is None:
+        sys.exit('NumPy is required to generate the benchmark ballots')
+
+    width = min(args.width, args.candidates)
+    candidate_ids = list(range(1, args.candidates + 1))
+    data = timed(f'generate {args.ballots:,} ballots', lambda: generate(args.ballots, args.candidates, width))
+
+    reports = {}
+    for method, seats in (('irv', 1), ('stv', 3)):
+        reports[method] = timed(f'numpy  {method} ({seats} seat{"s" if seats > 1 else ""}), {args.ballots:,} ballots',
+                                lambda: ranked.tabulate(data, width, candidate_ids, method, seats, engine='numpy'))
+        print(f"   {len(reports[method]['rounds'])} rounds, elected {reports[method]['elected']}")
+
+    subset = data[:args.python_ballots * 2 * width]
+    for method, seats in (('irv', 1), ('stv', 3)):
+        fast = ranked.tabulate(subset, width, candidate_ids, method, seats, engine='numpy')
+        slow = timed(f'python {method}, {args.python_ballots:,} ballots',
+                     lambda: ranked.tabulate(subset, width, candidate_ids, method, seats, engine='python'))
+        if slow['elected'] != fast['elected']:
+            sys.exit(f"❌ {method}: python engine elected {slow['elected']}, numpy {fast['elected']}")
+
+    database = os.path.join(tempfile.mkdtemp(prefix='ranked-bench-'), 'ballots.db')
+    conn = sqlite3.connect(database)
+    conn.execute(ranked.RANKED_SCHEMA)
+    size = 2 * width
+    stored = data[:args.stored * size]
+    timed(f'store {args.stored:,} ballots in SQLite', lambda: (conn.executemany(
+        'INSERT INTO ranked_ballots (voter_id, ranking) VALUES (?, ?)',
+        ((f'VOTER{i}', stored[i * size:(i + 1) * size]) for i in range(args.stored))), conn.commit()))
+
+    def connection():
+        return sqlite3.connect(database)
+
+    box = ranked.BallotBox(width)
+    timed('BallotBox first load', lambda: box.refresh([connection]))
+    conn.executemany('INSERT INTO ranked_ballots (voter_id, ranking) VALUES (?, ?)',
+                     ((f'LATE{i}', stored[:size]) for i in range(1000)))
+    conn.commit()
+    loaded = timed('BallotBox refresh after 1,000 new ballots', lambda: box.refresh([connection]))
+    conn.close()
+    if loaded != args.stored + 1000:
+        sys.exit(f'❌ BallotBox holds {loaded} ballots, expected {args.stored + 1000}')
+    print('✅ engines agree')
+
+
+if __name__ == '__main__':
+    main()
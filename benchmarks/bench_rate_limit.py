@@ -0,0 +1,118 @@
+"""
+BENCHMARK: VOTE RATE LIMITING UNDER A RETRY STORM
+File: benchmarks/bench_rate_limit.py
+Run: python benchmarks/bench_rate_limit.py [--seconds 5] [--storm-clients 16] [--storm-rate 50]
+
+For --seconds, --legit-threads keep casting one ballot per new voter while
+storm clients, each from its own address, replay a scripted ballot
+--storm-rate times per second for a candidate that does not exist (each
+replay costs a SQLite lookup before its 404). Runs once with the limiter
+off and once on, and reports legitimate vote throughput, latency and
+failures, storm requests rejected before the database, and SQL statements
+executed.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import voting
+from metrics import metrics
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0
+
+
+def run(enabled, args):
+    voting.DATABASE = os.path.join(tempfile.mkdtemp(prefix='ratelimit-bench-'), 'voting.db')
+    voting.init_db()
+    voting.rate_limiter.enabled = enabled
+    voting.rate_limiter.clear()
+    client = voting.app.test_client()
+    client.get('/api/candidates')
+
+    queries_before = sum(entry.queries for entry in metrics.endpoints.values())
+    stop = threading.Event()
+    storm = {'sent': 0, 'limited': 0}
+    failed = []
+    latencies = []
+    lock = threading.Lock()
+
+    def storm_worker(index):
+        storm_client = voting.app.test_client()
+        sent = limited = 0
+        next_send = time.perf_counter()
+        while not stop.is_set():
+            next_send += 1 / args.storm_rate
+            time.sleep(max(0, next_send - time.perf_counter()))
+            response = storm_client.post('/api/vote', json={'voter_id': f'storm-{index}', 'candidate_id': 999},
+                                         environ_base={'REMOTE_ADDR': f'10.1.0.{index}'})
+            sent += 1
+            limited += response.status_code == 429
+        with lock:
+            storm['sent'] += sent
+            storm['limited'] += limited
+
+    def legit_worker(index):
+        legit_client = voting.app.test_client()
+        local = []
+        n = index
+        while not stop.is_set():
+            n += args.legit_threads
+            started = time.perf_counter()
+            response = legit_client.post('/api/vote', json={'voter_id': f'legit-{n}', 'candidate_id': n % 8 + 1},
+                                         environ_base={'REMOTE_ADDR': f'10.2.{n // 250}.{n % 250}'})
+            if response.status_code == 200:
+                local.append(time.perf_counter() - started)
+            else:
+                failed.append(response.status_code)
+        with lock:
+            latencies.extend(local)
+
+    storms = [threading.Thread(target=storm_worker, args=(n,)) for n in range(args.storm_clients)]
+    legit = [threading.Thread(target=legit_worker, args=(n,)) for n in range(args.legit_threads)]
+    started = time.perf_counter()
+    for thread in storms + legit:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in storms + legit:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'limiter': 'on' if enabled else 'off',
+        'votes_per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'failed': len(failed),
+        'storm': storm['sent'],
+        'limited': storm['limited'],
+        'queries': sum(entry.queries for entry in metrics.endpoints.values()) - queries_before
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--legit-threads', type=int, default=4)
+    parser.add_argument('--storm-clients', type=int, default=16)
+    parser.add_argument('--storm-rate', type=float, default=50, help='requests per second per storm client')
+    args = parser.parse_args()
+
+    print(f"{'limiter':<8} {'votes/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'failed':>7} "
+          f"{'storm req':>10} {'limited':>8} {'SQL stmts':>10}")
+    for enabled in (False, True):
+        r = run(enabled, args)
+        print(f"{r['limiter']:<8} {r['votes_per_sec']:>8.0f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['failed']:>7} "
+              f"{r['storm']:>10} {r['limited']:>8} {r['queries']:>10}")
+
+
+if __name__ == '__main__':
+    main()
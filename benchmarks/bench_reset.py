@@ -0,0 +1,122 @@
+"""
+BENCHMARK: ELECTION RESET, SNAPSHOT RESTORE AND STARTUP
+File: benchmarks/bench_reset.py
+Run: python benchmarks/bench_reset.py [--voters 2000000] [--voted 0.3]
+
+Works on a copy of a generated electorate through the Flask test client:
+  - saves a baseline snapshot with POST /api/admin/snapshot
+  - times POST /api/admin/reset, then POST /api/admin/restore back to the
+    baseline, and checks that the voted count returns
+  - times the previous reset SQL (rewriting every voter row, one UPDATE
+    per seeded voter) on the same data, restoring the baseline afterwards
+  - times startup's prepare_db() on the existing database against the
+    full init_db() it used to run
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# All load comes from one client address; the per-IP limits would throttle it
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+import load_suite
+import migrations
+import stats_rollup
+import voting
+
+
+def legacy_reset(conn):
+    """The reset SQL before set-based statements, for comparison."""
+    cursor = conn.cursor()
+    cursor.execute('UPDATE candidates SET votes = 0')
+    cursor.execute('UPDATE voters SET has_voted = 0, vote_time = NULL')
+    cursor.execute('DELETE FROM votes_log')
+    votes_data = [(f'VOTER{str(i).zfill(3)}', (i % 8) + 1, datetime.now().isoformat()) for i in range(1, 61)]
+    cursor.executemany('INSERT INTO votes_log (voter_id, candidate_id, vote_time) VALUES (?, ?, ?)', votes_data[:30])
+    for candidate_id in range(1, 9):
+        vote_count = len([v for v in votes_data[:30] if v[1] == candidate_id])
+        if vote_count > 0:
+            cursor.execute('UPDATE candidates SET votes = votes + ? WHERE id = ?', (vote_count, candidate_id))
+    for i in range(1, 31):
+        cursor.execute('UPDATE voters SET has_voted = 1, vote_time = ? WHERE id = ?',
+                       (datetime.now().isoformat(), f'VOTER{str(i).zfill(3)}'))
+    stats_rollup.rebuild(cursor)
+    conn.commit()
+
+
+def timed(label, function):
+    started = time.perf_counter()
+    result = function()
+    print(f'{label:<40} {time.perf_counter() - started:8.2f} s')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--voters', type=int, default=2_000_000)
+    parser.add_argument('--candidates', type=int, default=8)
+    parser.add_argument('--voted', type=float, default=0.3, help='fraction of voters who voted')
+    args = parser.parse_args()
+
+    source = load_suite.electorate(args.voters, args.candidates, args.voted)
+    workdir = tempfile.mkdtemp(prefix='reset-bench-')
+    voting.DATABASE = os.path.join(workdir, 'voting.db')
+    shutil.copy(source, voting.DATABASE)
+    conn = sqlite3.connect(voting.DATABASE)
+    migrations.migrate(conn)
+    conn.close()
+
+    client = voting.app.test_client()
+    token = client.post('/api/admin/login', json={'username': 'admin', 'password': 'admin123'}).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def post(path):
+        response = client.post(path, headers=headers)
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()
+
+    def voted():
+        return client.get('/api/results').get_json()['summary']['voted_count']
+
+    failures = []
+    try:
+        baseline = voted()
+        print(f'{args.voters:,} voters, {baseline:,} voted')
+        saved = timed('POST /api/admin/snapshot', lambda: post('/api/admin/snapshot'))
+        print(f"   {saved['bytes'] / 1e6:.0f} MB in {saved['files']} file(s)")
+        timed('POST /api/admin/reset', lambda: post('/api/admin/reset'))
+        if voted() != 30:
+            failures.append(f'{voted()} voted after reset, expected 30')
+        timed('POST /api/admin/restore', lambda: post('/api/admin/restore'))
+        if voted() != baseline:
+            failures.append(f'{voted()} voted after restore, expected {baseline}')
+
+        conn = sqlite3.connect(voting.DATABASE, timeout=30)
+        timed('previous reset SQL', lambda: legacy_reset(conn))
+        conn.close()
+        post('/api/admin/restore')
+
+        voting.DB_RESET_ON_START = False
+        timed('startup, schema current (prepare_db)', voting.prepare_db)
+        if voted() != baseline:
+            failures.append('prepare_db() changed the existing database')
+        timed('startup, previous full init_db()', voting.init_db)
+    finally:
+        voting.db_pool.close_all()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for failure in failures:
+        print(f'❌ {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+BENCHMARK: GROUP-COMMIT VS PER-REQUEST COMMIT
+File: benchmarks/bench_vote_batching.py
+Run: python benchmarks/bench_vote_batching.py [--votes 2000] [--threads 32]
+
+Fires concurrent POST /api/vote requests through the Flask test client
+against a scratch copy of the database and reports votes/sec for the
+per-request commit path and the batched path.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# All load comes from one client address; the per-IP limits would throttle it
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+import voting
+
+
+def run(batching, votes, threads):
+    workdir = tempfile.mkdtemp(prefix='vote-bench-')
+    voting.DATABASE = os.path.join(workdir, 'voting.db')
+    voting.VOTE_BATCHING = batching
+    voting.init_db()
+
+    per_thread = votes // threads
+    errors = []
+
+    def worker(worker_id):
+        client = voting.app.test_client()
+        for i in range(per_thread):
+            response = client.post('/api/vote', json={
+                'voter_id': f'BENCH{worker_id:04d}_{i:06d}',
+                'candidate_id': (i % 8) + 1
+            })
+            if response.status_code != 200:
+                errors.append(response.get_json())
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    total = per_thread * threads
+    return {
+        'mode': 'batched' if batching else 'per-request',
+        'votes': total,
+        'errors': len(errors),
+        'seconds': round(elapsed, 3),
+        'votes_per_sec': round(total / elapsed, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--votes', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=32)
+    args = parser.parse_args()
+
+    print(f"{'mode':<12} {'votes':>7} {'errors':>7} {'seconds':>9} {'votes/sec':>10}")
+    for batching in (False, True):
+        r = run(batching, args.votes, args.threads)
+        print(f"{r['mode']:<12} {r['votes']:>7} {r['errors']:>7} {r['seconds']:>9} {r['votes_per_sec']:>10}")
+
+
+if __name__ == '__main__':
+    main()
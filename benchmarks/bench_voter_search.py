@@ -0,0 +1,113 @@
+"""
+BENCHMARK: VOTER SEARCH AND FILTERED PAGES
+File: benchmarks/bench_voter_search.py
+Run: python benchmarks/bench_voter_search.py [--voters 2000000] [--repeat 20]
+
+Serves the first page (and, for searches, the page after it) of
+/api/admin/voters for unfiltered, has_voted, vote_time range and
+name/email search requests on a generated electorate through the Flask
+test client. The response cache is cleared before every request.
+Searches are compared with the LIKE '%term%' scan that was the only way to
+find a voter by name or email before the FTS5 index. Reports median and
+worst milliseconds per request, and checks every searched page against
+that scan.
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+# All load comes from one client address; the per-IP limits would throttle it
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+import load_suite
+import migrations
+import voting
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        voting.response_cache.clear()
+        started = time.perf_counter()
+        result = function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(samples), max(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--voters', type=int, default=2_000_000)
+    parser.add_argument('--candidates', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+
+    source = load_suite.electorate(args.voters, args.candidates, 0.3)
+    voting.DATABASE = os.path.join(tempfile.mkdtemp(prefix='search-bench-'), 'voting.db')
+    shutil.copy(source, voting.DATABASE)
+    conn = sqlite3.connect(voting.DATABASE)
+    started = time.perf_counter()
+    applied = migrations.migrate(conn)
+    if applied:
+        print(f'   migrated cached electorate ({applied}) in {time.perf_counter() - started:.1f}s')
+    latest = conn.execute('SELECT MAX(vote_time) FROM voters WHERE has_voted = 1').fetchone()[0]
+    day, hour = latest[:10], latest[:13] + ':00:00'
+
+    client = voting.app.test_client()
+    token = client.post('/api/admin/login', json={'username': 'admin', 'password': 'admin123'}).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def page(**params):
+        response = client.get('/api/admin/voters?' + urlencode(dict(params, limit=args.limit)), headers=headers)
+        assert response.status_code == 200, response.get_json()
+        return response.get_json()
+
+    requests = [
+        ('first page', {}),
+        ('has_voted=1', {'has_voted': 1}),
+        ('has_voted=0', {'has_voted': 0}),
+        ('voted in latest hour', {'voted_from': hour}),
+        ('voted on latest day', {'voted_from': day}),
+        ('q=voter (all)', {'q': 'voter'}),
+        ('q=1234 (prefix)', {'q': '1234'}),
+        ('q=voter1234567@', {'q': 'voter1234567@'}),
+        ('q=12 has_voted=1', {'q': '12', 'has_voted': 1})
+    ]
+    failures = []
+    print(f"{'request':<22} {'rows':>5} {'p50 ms':>9} {'max ms':>9} {'next page':>10} {'LIKE scan':>10}")
+    for label, params in requests:
+        result, p50, worst = timed(lambda: page(**params), args.repeat)
+        next_ms = like_ms = ''
+        if result['next_after']:
+            _, next_p50, _ = timed(lambda: page(after=result['next_after'], **params), args.repeat)
+            next_ms = f'{next_p50:.2f}'
+        if 'q' in params:
+            term = params['q'].strip('@')
+            scan = 'SELECT id FROM voters WHERE (name LIKE ? OR email LIKE ?)' + (
+                f" AND has_voted = {params['has_voted']}" if 'has_voted' in params else '')
+            started = time.perf_counter()
+            found = {row[0] for row in conn.execute(scan, (f'%{term}%', f'%{term}%'))}
+            like_ms = f'{(time.perf_counter() - started) * 1000:.0f}'
+            # Prefix matches are a subset of the substring scan
+            missing = [v['id'] for v in result['voters'] if v['id'] not in found]
+            if missing:
+                failures.append(f'{label}: {missing[:5]} not matched by LIKE')
+        print(f"{label:<22} {len(result['voters']):>5} {p50:>9.2f} {worst:>9.2f} {next_ms:>10} {like_ms:>10}")
+    conn.close()
+
+    for failure in failures:
+        print(f'❌ {failure}')
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
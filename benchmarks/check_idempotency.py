@@ -0,0 +1,208 @@
+"""
+CHECK: IDEMPOTENT VOTE RETRIES
+File: benchmarks/check_idempotency.py
+Run: python benchmarks/check_idempotency.py [--storm 32] [--workers 4]
+
+On a scratch database, with and without vote batching:
+  - a retry with the same Idempotency-Key gets the first response back
+    byte for byte (Idempotent-Replayed: true) and runs no SQL, also past
+    the per-voter rate limit; the same key on a different ballot gets 422
+    and a retry without a key still gets 403
+  - --storm concurrent requests with one key record one ballot and all get
+    the same 200
+  - the cache stays within its entry limit, drops expired keys and is
+    emptied by an election reset
+Then starts workers.py and replays one keyed vote on --storm fresh
+connections, which spread over the workers: every one must get the stored
+response. Exits 1 on any failure.
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+# All load comes from one client address; the per-IP limits would throttle it
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+import voting
+
+
+def logged_rows(voter_id):
+    conn = sqlite3.connect(voting.DATABASE)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM votes_log WHERE voter_id = ?', (voter_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def vote_queries():
+    entry = voting.metrics.endpoints.get('vote')
+    return entry.queries if entry else 0
+
+
+def check_mode(batching, args, failures):
+    label = 'batched' if batching else 'unbatched'
+    workdir = tempfile.mkdtemp(prefix='idempotency-check-')
+    voting.DATABASE = os.path.join(workdir, 'voting.db')
+    voting.VOTE_BATCHING = batching
+    voting.image_store.directory = os.path.join(workdir, 'images')
+    try:
+        voting.init_db()
+        client = voting.app.test_client()
+        ballot = {'voter_id': f'IDEM-{label}', 'candidate_id': 3}
+        headers = {'Idempotency-Key': f'key-{label}'}
+
+        first = client.post('/api/vote', json=ballot, headers=headers)
+        if first.status_code != 200:
+            failures.append(f'{label}: first keyed vote returned {first.status_code}')
+            return
+        queries = vote_queries()
+        # More retries than vote.voter allows in a minute: replays come before the limits
+        voting.rate_limiter.enabled = True
+        try:
+            replays = [client.post('/api/vote', json=ballot, headers=headers) for _ in range(10)]
+        finally:
+            voting.rate_limiter.enabled = False
+        if any(r.status_code != 200 or r.get_data() != first.get_data() for r in replays):
+            failures.append(f'{label}: replays returned {sorted({r.status_code for r in replays})} or a different body')
+        if any(r.headers.get('Idempotent-Replayed') != 'true' for r in replays):
+            failures.append(f'{label}: replays are not marked Idempotent-Replayed')
+        if vote_queries() != queries:
+            failures.append(f'{label}: replays ran {vote_queries() - queries} SQL statements')
+        field = client.post('/api/vote', json=dict(ballot, idempotency_key=f'field-{label}'))
+        if field.status_code != 403:
+            failures.append(f'{label}: a new key for a counted voter returned {field.status_code}, expected 403')
+
+        other = client.post('/api/vote', json=dict(ballot, candidate_id=4), headers=headers)
+        if other.status_code != 422:
+            failures.append(f'{label}: same key for a different ballot returned {other.status_code}, expected 422')
+        unkeyed = client.post('/api/vote', json=ballot)
+        if unkeyed.status_code != 403:
+            failures.append(f'{label}: unkeyed retry returned {unkeyed.status_code}, expected 403')
+
+        # A retry storm: every copy is in flight at once
+        storm_ballot = {'voter_id': f'STORM-{label}', 'candidate_id': 5}
+        results = []
+        barrier = threading.Barrier(args.storm)
+
+        def cast():
+            storm_client = voting.app.test_client()
+            barrier.wait()
+            response = storm_client.post('/api/vote', json=storm_ballot, headers={'Idempotency-Key': f'storm-{label}'})
+            results.append((response.status_code, response.get_data()))
+
+        threads = [threading.Thread(target=cast) for _ in range(args.storm)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if {status for status, _ in results} != {200} or len({body for _, body in results}) != 1:
+            failures.append(f'{label}: storm got statuses {sorted(status for status, _ in results)}')
+        if logged_rows(storm_ballot['voter_id']) != 1:
+            failures.append(f'{label}: storm logged {logged_rows(storm_ballot["voter_id"])} ballots')
+
+        stats = voting.idempotency.stats()
+        print(f"{label}: {stats['hits']} replays, {stats['waits']} waits, hit rate {stats['hit_rate']}%, "
+              f"{stats['entries']} keys / {stats['bytes']} bytes held")
+        token = client.post('/api/admin/login', json={'username': 'admin', 'password': 'admin123'}).get_json()['token']
+        client.post('/api/admin/reset', headers={'Authorization': f'Bearer {token}'})
+        if voting.idempotency.stats()['entries']:
+            failures.append(f'{label}: stored responses survived an election reset')
+        after_reset = client.post('/api/vote', json=ballot, headers=headers)
+        if after_reset.status_code != 200 or after_reset.headers.get('Idempotent-Replayed'):
+            failures.append(f'{label}: vote after the reset returned {after_reset.status_code} or a replay')
+    finally:
+        voting.VOTE_BATCHING = True
+        voting.db_pool.close_all()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def check_bounds(failures):
+    cache = voting.IdempotencyCache(ttl=60, max_entries=100)
+    for n in range(10_000):
+        cache.store(f'key-{n}', 'digest', b'{"success": true}', now=0)
+    stats = cache.stats()
+    if stats['entries'] != 100 or stats['evictions'] != 9_900:
+        failures.append(f"bounded cache holds {stats['entries']} keys after 10000 stores ({stats['evictions']} evicted)")
+    if cache.lookup('key-9999', 'digest', now=30) != ('hit', b'{"success": true}'):
+        failures.append('newest key missing from the bounded cache')
+    cache.store('late', 'digest', b'{}', now=61)
+    if cache.stats()['entries'] != 1 or cache.lookup('key-9999', 'digest', now=61) != (None, None):
+        failures.append('expired keys were kept past their TTL')
+    print(f"bounds: 10000 keys into a 100 key cache kept {stats['entries']}, {stats['bytes']} bytes")
+
+
+def check_workers(args, failures):
+    workdir = tempfile.mkdtemp(prefix='idempotency-workers-')
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(REPO, 'workers.py'), '--workers', str(args.workers), '--port', str(args.port)],
+        cwd=workdir, env=dict(os.environ, TALLY_CHECKPOINT_SECONDS='0'),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    def post(body, key):
+        conn = http.client.HTTPConnection('127.0.0.1', args.port, timeout=30)
+        try:
+            conn.request('POST', '/api/vote', json.dumps(body), {'Content-Type': 'application/json', 'Idempotency-Key': key})
+            response = conn.getresponse()
+            return response.status, response.read(), response.getheader('Idempotent-Replayed')
+        finally:
+            conn.close()
+
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                post({}, 'probe')
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError('workers did not start')
+                time.sleep(0.2)
+        ballot = {'voter_id': 'IDEM-workers', 'candidate_id': 2}
+        status, body, _ = post(ballot, 'worker-key')
+        if status != 200:
+            failures.append(f'workers: first keyed vote returned {status}')
+            return
+        replays = [post(ballot, 'worker-key') for _ in range(args.storm)]
+        if any(r != (200, body, 'true') for r in replays):
+            failures.append(f'workers: replays on new connections returned {sorted({r[0] for r in replays})} '
+                            f'or a different body')
+        print(f'workers: {len(replays)} replays on new connections answered from the writer\'s store')
+    finally:
+        process.terminate()
+        process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--storm', type=int, default=32, help='concurrent copies of one keyed vote')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+
+    failures = []
+    for batching in (True, False):
+        check_mode(batching, args, failures)
+    check_bounds(failures)
+    check_workers(args, failures)
+
+    for failure in failures:
+        print(f'❌ {failure}')
+    if failures:
+        sys.exit(1)
+    print('✅ keyed retries replay the first response without SQL, in one process and across workers')
+
+
+if __name__ == '__main__':
+    main()
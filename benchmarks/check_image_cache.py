@@ -0,0 +1,167 @@
+"""
+CHECK: CANDIDATE IMAGE CACHE
+File: benchmarks/check_image_cache.py
+Run: python benchmarks/check_image_cache.py [--upstream-ms 300] [--requests 200]
+
+Runs against a scratch database through the Flask test client. The image
+store's fetcher is replaced with one that serves local fixture PNGs
+(built in memory by this script) after --upstream-ms. This stands in for the
+third-party host, so no network is used. Checks:
+  - each image is fetched upstream once
+  - thumbnails are no wider than asked
+  - the candidate list switches to digest-stamped URLs, which are served
+    immutable and answer If-None-Match with 304
+  - an upload replaces the image and its URL
+  - a failing source is not retried on every request
+  - bad uploads, uploads without a token and candidates without a
+    photo are refused
+Reports the latency of the first (fetching) request against the cached
+ones. Exits 1 on any failure.
+"""
+import argparse
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# All load comes from one client address; the per-IP limits would throttle it
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+import image_store
+import voting
+
+
+def png_fixture(width, height, rgb):
+    """A solid-colour RGB PNG, built without Pillow."""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    row = b'\x00' + bytes(rgb) * width
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(row * height))
+            + chunk(b'IEND', b''))
+
+
+def png_width(data):
+    return struct.unpack('>I', data[16:20])[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--upstream-ms', type=float, default=300, help='simulated third-party latency')
+    parser.add_argument('--requests', type=int, default=200, help='cached requests to time')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='image-check-')
+    voting.DATABASE = os.path.join(workdir, 'voting.db')
+    voting.image_store.directory = os.path.join(workdir, 'images')
+    voting.init_db()
+    client = voting.app.test_client()
+    token = client.post('/api/admin/login', json={'username': 'admin', 'password': 'admin123'}).get_json()['token']
+    admin = {'Authorization': f'Bearer {token}'}
+
+    candidates = client.get('/api/candidates').get_json()
+    fixtures = {c['image_url']: png_fixture(800, 800, (40 * c['id'] % 256, 90, 160)) for c in candidates}
+    fetched = []
+
+    def fixture_fetcher(url, timeout, max_bytes):
+        fetched.append(url)
+        time.sleep(args.upstream_ms / 1000)
+        if url not in fixtures:
+            raise image_store.ImageUnavailable(f'404 for {url}')
+        return fixtures[url]
+
+    voting.image_store.fetcher = fixture_fetcher
+    failures = []
+    thumbnails = image_store.Image is not None
+
+    def expect(condition, message):
+        if not condition:
+            failures.append(message)
+
+    try:
+        first = candidates[0]
+        expect(first['image'] == f"/api/candidates/{first['id']}/image?w={voting.IMAGE_WIDTHS[-1]}",
+               f"unfetched image path: {first['image']}")
+
+        started = time.perf_counter()
+        response = client.get(first['image'])
+        cold_ms = (time.perf_counter() - started) * 1000
+        expect(response.status_code == 200, f'first image request: {response.status_code}')
+        expect(response.mimetype == 'image/png', f'image type: {response.mimetype}')
+        if thumbnails:
+            expect(png_width(response.get_data()) == voting.IMAGE_WIDTHS[-1],
+                   f'thumbnail width {png_width(response.get_data())}')
+            small = client.get(f"/api/candidates/{first['id']}/image?w=100")
+            expect(png_width(small.get_data()) == voting.IMAGE_WIDTHS[0], 'w=100 did not pick the smallest thumbnail')
+        else:
+            expect(response.get_data() == fixtures[first['image_url']], 'original bytes changed')
+        expect(response.cache_control.max_age == 300 and not response.cache_control.immutable,
+               f'unstamped URL cache header: {response.headers.get("Cache-Control")}')
+
+        for candidate in candidates[1:]:
+            client.get(candidate['image'])
+        expect(len(fetched) == len(candidates), f'{len(fetched)} upstream fetches for {len(candidates)} candidates')
+
+        listed = {c['id']: c['image'] for c in client.get('/api/candidates').get_json()}
+        stamped = listed[first['id']]
+        expect('&v=' in stamped, f'candidate list not updated: {stamped}')
+        results = client.get('/api/results').get_json()['candidates']
+        expect(all('&v=' in c['image'] for c in results), 'results not updated')
+
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            response = client.get(stamped)
+        warm_ms = (time.perf_counter() - started) * 1000 / args.requests
+        expect(len(fetched) == len(candidates), 'cached images were fetched again')
+        expect(response.cache_control.immutable and response.cache_control.max_age == voting.IMAGE_MAX_AGE,
+               f'stamped URL cache header: {response.headers.get("Cache-Control")}')
+        revalidated = client.get(stamped, headers={'If-None-Match': response.headers['ETag']})
+        expect(revalidated.status_code == 304, f'If-None-Match: {revalidated.status_code}')
+
+        upload = client.post(f"/api/admin/candidates/{first['id']}/image", headers=admin,
+                             data=png_fixture(600, 400, (250, 250, 0)), content_type='image/png')
+        expect(upload.status_code == 200, f'upload: {upload.status_code} {upload.get_json()}')
+        replaced = {c['id']: c['image'] for c in client.get('/api/candidates').get_json()}[first['id']]
+        expect(replaced != stamped and replaced == upload.get_json()['image'], 'upload did not change the image URL')
+        old = client.get(stamped)
+        expect(not old.cache_control.immutable, 'stale digest still served as immutable')
+        rejected = client.post(f"/api/admin/candidates/{first['id']}/image", headers=admin,
+                               data=b'not an image', content_type='image/png')
+        expect(rejected.status_code == 400, f'bad upload: {rejected.status_code}')
+        unauthorized = client.post(f"/api/admin/candidates/{first['id']}/image", data=png_fixture(8, 8, (0, 0, 0)))
+        expect(unauthorized.status_code == 401, f'upload without token: {unauthorized.status_code}')
+
+        added = client.post('/api/admin/candidates', headers=admin, json={
+            'name': 'Broken Link', 'party': 'Test Party', 'image_url': 'https://example.invalid/missing.jpg'
+        }).get_json()['candidate']
+        broken = f"/api/candidates/{added['id']}/image"
+        statuses = [client.get(broken).status_code for _ in range(5)]
+        expect(statuses == [502] * 5, f'failing source: {statuses}')
+        expect(fetched.count(added['image_url']) == 1, f"failing source fetched {fetched.count(added['image_url'])} times")
+
+        plain = client.post('/api/admin/candidates', headers=admin, json={'name': 'No Photo', 'party': 'Test Party'})
+        plain = plain.get_json()['candidate']
+        expect(client.get(f"/api/candidates/{plain['id']}/image").status_code == 404, 'candidate without image')
+        expect(client.get('/api/candidates/9999/image').status_code == 404, 'unknown candidate')
+
+        print(f"thumbnails: {'Pillow' if thumbnails else 'off (Pillow not installed)'}, "
+              f"upstream fetches: {len(fetched)}")
+        print(f'first request (fetch + store): {cold_ms:8.2f} ms')
+        print(f'cached request:                {warm_ms:8.2f} ms')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for failure in failures:
+        print(f'❌ {failure}')
+    if failures:
+        sys.exit(1)
+    print('✅ images fetched once, served from the local cache with digest-stamped URLs')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+CHECK: HOT QUERY PLANS USE INDEXES
+File: benchmarks/check_query_plans.py
+Run: python benchmarks/check_query_plans.py
+
+Brings a fresh database up to the latest schema with migrations.migrate,
+and does the same to a copy of the repo's voting.db when it predates the
+current schema, then runs migrations.audit over HOT_QUERIES on each: any
+SCAN of a large table without an index, or any temp B-tree outside
+TEMP_BTREE_OK, is a failure. Also makes sure the audit itself still
+notices a dropped index and an unindexed ORDER BY. Exits 1 on any failure.
+"""
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+import migrations
+
+
+def audit_database(label, path, failures):
+    conn = sqlite3.connect(path)
+    try:
+        applied = migrations.migrate(conn)
+        if migrations.current_version(conn) != migrations.LATEST_VERSION:
+            failures.append(f'{label}: schema at version {migrations.current_version(conn)} after migrating')
+            return
+        report = migrations.audit(conn)
+        for name, plan, offending in report:
+            if offending:
+                failures.append(f"{label}: {name} ({', '.join(offending)}): {' | '.join(plan)}")
+        print(f'{label}: applied {len(applied)} migrations, {len(report)} hot queries audited')
+    finally:
+        conn.close()
+
+
+def check_detection(path, failures):
+    """The audit must flag a dropped index and a sort it cannot avoid."""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('DROP INDEX idx_votes_log_voter')
+        flagged = {name for name, _, offending in migrations.audit(conn) if offending}
+        if 'votes by voter' not in flagged:
+            failures.append('audit did not flag votes by voter after idx_votes_log_voter was dropped')
+        sort = [('unindexed sort', 'SELECT id FROM voters ORDER BY email LIMIT ?', (10,))]
+        if 'temp b-tree' not in migrations.audit(conn, sort)[0][2]:
+            failures.append('audit did not flag a temp B-tree for ORDER BY on an unindexed column')
+    finally:
+        conn.close()
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='plan-check-')
+    failures = []
+    try:
+        fresh = os.path.join(workdir, 'fresh.db')
+        audit_database('fresh database', fresh, failures)
+
+        baseline = os.path.join(REPO, 'voting.db')
+        if os.path.exists(baseline):
+            copy = os.path.join(workdir, 'baseline.db')
+            shutil.copyfile(baseline, copy)
+            audit_database('repo voting.db', copy, failures)
+
+        check_detection(fresh, failures)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for failure in failures:
+        print(f'❌ {failure}')
+    if failures:
+        sys.exit(1)
+    print('✅ every hot query reads an index, without full scans or temp B-trees')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""
+CHECK: RANKED-CHOICE TABULATION AGAINST A NAIVE REFERENCE
+File: benchmarks/check_ranked.py
+Run: python benchmarks/check_ranked.py [--elections 500] [--seed 1]
+
+The reference below walks every ballot in every round and counts with
+exact fractions, applying the same rules as ranked.py: strict majority for
+IRV, Droop quota with Gregory surplus transfer for STV, and elimination of
+the higher candidate id on ties. Random elections of up to 300 candidates
+(many small enough to produce ties) are tabulated by both engines and each
+round is compared with the reference. The script then casts ranked ballots
+through POST /api/vote on a scratch database and checks that
+/api/results?method=irv|stv matches the reference, also after
+ranked_ballots is rebuilt from the vote journal, and that bad rankings are
+refused. Exits 1 on any mismatch.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+from fractions import Fraction
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# All load comes from one client address; the per-IP limits would throttle it
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+import journal
+import ranked
+import voting
+
+TOLERANCE = 1e-6
+
+
+def reference(ballots, candidate_ids, method, seats):
+    """Per-ballot tabulation with exact arithmetic; same report shape as ranked.tabulate."""
+    seats = 1 if method == 'irv' else seats
+    continuing = set(candidate_ids)
+    weights = [Fraction(1)] * len(ballots)
+    elected, rounds, quota = [], [], None
+
+    def top(ballot):
+        for candidate_id in ballot:
+            if candidate_id not in candidate_ids:
+                return None
+            if candidate_id in continuing:
+                return candidate_id
+        return None
+
+    while len(elected) < seats and continuing:
+        votes = {candidate_id: Fraction(0) for candidate_id in continuing}
+        exhausted = Fraction(0)
+        for ballot, weight in zip(ballots, weights):
+            choice = top(ballot)
+            if choice is None:
+                exhausted += weight
+            else:
+                votes[choice] += weight
+        if not rounds:
+            valid = sum(votes.values())
+            if valid == 0:
+                break
+            if method == 'stv':
+                quota = valid // (seats + 1) + 1
+        info = {'votes': votes, 'exhausted': exhausted, 'elected': [], 'eliminated': None}
+        rounds.append(info)
+        by_votes = sorted(continuing, key=lambda c: (-votes[c], c))
+        if len(continuing) <= seats - len(elected):
+            info['elected'] = by_votes
+            elected.extend(by_votes)
+            break
+        leader = by_votes[0]
+        if method == 'irv':
+            wins = votes[leader] * 2 > sum(votes.values()) or len(continuing) == 1
+        else:
+            wins = votes[leader] >= quota
+        if wins:
+            info['elected'] = [leader]
+            elected.append(leader)
+            if method == 'irv':
+                break
+            factor = (votes[leader] - quota) / votes[leader]
+            for i, ballot in enumerate(ballots):
+                if top(ballot) == leader:
+                    weights[i] *= factor
+            continuing.discard(leader)
+        else:
+            lowest = min(votes.values())
+            loser = max(c for c in continuing if votes[c] == lowest)
+            info['eliminated'] = loser
+            continuing.discard(loser)
+    return {'elected': elected, 'rounds': rounds, 'quota': quota}
+
+
+def compare(report, expected):
+    """First difference between a ranked.tabulate report and the reference, or None."""
+    if report['elected'] != expected['elected']:
+        return f"elected {report['elected']} != {expected['elected']}"
+    if report['quota'] != expected['quota']:
+        return f"quota {report['quota']} != {expected['quota']}"
+    if len(report['rounds']) != len(expected['rounds']):
+        return f"{len(report['rounds'])} rounds != {len(expected['rounds'])}"
+    for number, (got, want) in enumerate(zip(report['rounds'], expected['rounds']), 1):
+        votes = {int(c): v for c, v in got['votes'].items()}
+        if set(votes) != set(want['votes']):
+            return f'round {number}: continuing {sorted(votes)} != {sorted(want["votes"])}'
+        for candidate_id, count in want['votes'].items():
+            if abs(votes[candidate_id] - float(count)) > TOLERANCE:
+                return f'round {number}: candidate {candidate_id} has {votes[candidate_id]}, expected {float(count)}'
+        if abs(got['exhausted'] - float(want['exhausted'])) > TOLERANCE:
+            return f"round {number}: exhausted {got['exhausted']} != {float(want['exhausted'])}"
+        if got['elected'] != want['elected'] or got['eliminated'] != want['eliminated']:
+            return (f"round {number}: elected {got['elected']} eliminated {got['eliminated']}, "
+                    f"expected {want['elected']} / {want['eliminated']}")
+    return None
+
+
+def random_election(rng):
+    count = rng.choice([2, 3, 4, 5, 8, 12, 300]) if rng.random() < 0.9 else rng.randint(2, 40)
+    candidate_ids = sorted(rng.sample(range(1, 1000), count))
+    width = rng.choice([3, 4, 8, 12])
+    size = rng.choice([1, 2, 5, 9, 30, 200])
+    # A few popular candidates make majorities and surpluses likely
+    favourites = candidate_ids[:3] + rng.sample(candidate_ids, min(3, count))
+    ballots = []
+    for _ in range(size):
+        length = rng.randint(1, min(width, count))
+        first = rng.choice(favourites) if rng.random() < 0.6 else rng.choice(candidate_ids)
+        rest = rng.sample([c for c in candidate_ids if c != first], length - 1)
+        ballots.append([first] + rest)
+    return candidate_ids, width, ballots
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--elections', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    engines = ['python'] + (['numpy'] if ranked.np is not None else [])
+    failures = []
+    checked = 0
+    for number in range(args.elections):
+        candidate_ids, width, ballots = random_election(rng)
+        data = b''.join(ranked.encode(ballot, width) for ballot in ballots)
+        for method, seats in (('irv', 1), ('stv', rng.randint(1, min(4, len(candidate_ids))))):
+            expected = reference(ballots, set(candidate_ids), method, seats)
+            for engine in engines:
+                report = ranked.tabulate(data, width, candidate_ids, method, seats, engine=engine)
+                problem = compare(report, expected)
+                checked += 1
+                if problem:
+                    failures.append(f'election {number} ({len(candidate_ids)} candidates, {len(ballots)} ballots) '
+                                    f'{method}/{seats} {engine}: {problem}')
+    print(f"engines: {', '.join(engines)}; {checked} tabulations compared with the reference")
+
+    workdir = tempfile.mkdtemp(prefix='ranked-check-')
+    voting.DATABASE = os.path.join(workdir, 'voting.db')
+    voting.image_store.directory = os.path.join(workdir, 'images')
+    voting.RANKED_TABULATION_INTERVAL = 0
+    try:
+        voting.init_db()
+        client = voting.app.test_client()
+        before = {c['id']: c['votes'] for c in client.get('/api/results').get_json()['candidates']}
+        candidate_ids = sorted(before)
+        ballots = []
+        for i in range(400):
+            ballot = rng.sample(candidate_ids, rng.randint(1, 5))
+            if i % 2 and ballot[0] not in candidate_ids[:3]:
+                ballot.insert(0, rng.choice([c for c in candidate_ids[:3] if c not in ballot] or ballot))
+                ballot = list(dict.fromkeys(ballot))
+            response = client.post('/api/vote', json={'voter_id': f'RANKED{i:04d}', 'ranking': ballot})
+            if response.status_code != 200:
+                failures.append(f'ranked vote {ballot}: {response.status_code} {response.get_json()}')
+            ballots.append(ballot)
+        for method, seats in (('irv', 1), ('stv', 3)):
+            response = client.get(f'/api/results?method={method}&seats={seats}')
+            problem = compare(response.get_json(), reference(ballots, set(candidate_ids), method, seats))
+            if problem:
+                failures.append(f'/api/results?method={method}: {problem}')
+
+        # Lose the ranked ballots and rebuild them from the journal
+        path = journal.journal_path(voting.DATABASE)
+        conn = voting.db_pool.connect(voting.DATABASE, isolation_level=None)
+        try:
+            if not journal.verify(conn, journal.replay(path))['ok']:
+                failures.append('journal does not match the database after ranked votes')
+            conn.execute('DELETE FROM ranked_ballots')
+            journal.rebuild(conn, journal.replay(path))
+        finally:
+            conn.close()
+        voting.reset_tabulations()
+        for method, seats in (('irv', 1), ('stv', 3)):
+            response = client.get(f'/api/results?method={method}&seats={seats}')
+            problem = compare(response.get_json(), reference(ballots, set(candidate_ids), method, seats))
+            if problem:
+                failures.append(f'/api/results?method={method} after a journal rebuild: {problem}')
+        long_ranking = list(range(1, 41))
+        scratch = journal.VoteJournal(os.path.join(workdir, 'long.journal'), sync=False)
+        scratch.append([('LONG', 1, '2024-01-01T00:00:00', ranked.encode(long_ranking, 48))])
+        scratch.close()
+        replayed = journal.replay(os.path.join(workdir, 'long.journal')).rankings.get('LONG', b'')
+        if ranked.decode(replayed) != long_ranking:
+            failures.append(f'a 40-candidate ranking came back from the journal as {ranked.decode(replayed)}')
+
+        after = {c['id']: c['votes'] for c in client.get('/api/results').get_json()['candidates']}
+        for candidate_id in candidate_ids:
+            first_choices = sum(ballot[0] == candidate_id for ballot in ballots)
+            if after[candidate_id] - before[candidate_id] != first_choices:
+                failures.append(f'candidate {candidate_id}: plurality count did not grow by its {first_choices} first choices')
+
+        refused = {
+            'duplicate candidate': ({'voter_id': 'BAD1', 'ranking': [1, 1]}, 400),
+            'empty ranking': ({'voter_id': 'BAD2', 'ranking': []}, 400),
+            'too many ranks': ({'voter_id': 'BAD3', 'ranking': list(range(1, voting.RANKED_MAX_RANKS + 2))}, 400),
+            'first choice conflict': ({'voter_id': 'BAD4', 'candidate_id': 2, 'ranking': [1, 2]}, 400),
+            'unknown candidate': ({'voter_id': 'BAD5', 'ranking': [1, 999]}, 404)
+        }
+        for label, (body, status) in refused.items():
+            response = client.post('/api/vote', json=body)
+            if response.status_code != status:
+                failures.append(f'{label}: {response.status_code}, expected {status}')
+        if client.get('/api/results?method=borda').status_code != 400:
+            failures.append('unknown method was not refused')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for failure in failures[:20]:
+        print(f'❌ {failure}')
+    if failures:
+        print(f'❌ {len(failures)} mismatches')
+        sys.exit(1)
+    print('✅ every round matches the reference; ranked votes and results work end to end')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+CHECK: BULK VOTER IMPORT AGAINST CACHED PAGES AND SEARCHES
+File: benchmarks/check_voter_import.py
+Run: python benchmarks/check_voter_import.py [--voters 12000]
+
+On a scratch database, in a single file and with two shards:
+  - imports --voters new voters and checks the reported counts, the tally's
+    total_voters and that search finds them
+  - warms the cached /api/admin/voters page and a search for a seeded
+    voter, then imports a roll that only renames that voter (created 0):
+    both must show the new name at once
+  - imports a roll that fails halfway and checks that the error reports
+    the rows already written and that they are counted
+Exits 1 on any failure.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# All load comes from one client address; the per-IP limits would throttle it
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+import voter_roll
+import voting
+
+
+def ndjson(rows):
+    return ''.join(json.dumps(row) + '\n' for row in rows)
+
+
+def check_mode(shard_count, args, failures):
+    label = f'{shard_count} shards' if shard_count else 'single file'
+    workdir = tempfile.mkdtemp(prefix='import-check-')
+    voting.DATABASE = os.path.join(workdir, 'voting.db')
+    voting.SHARD_COUNT = shard_count
+    voting.image_store.directory = os.path.join(workdir, 'images')
+    try:
+        voting.init_db()
+        client = voting.app.test_client()
+        token = client.post('/api/admin/login', json={'username': 'admin', 'password': 'admin123'}).get_json()['token']
+        headers = {'Authorization': f'Bearer {token}'}
+
+        def import_roll(body):
+            return client.post('/api/admin/voters/import?format=ndjson', data=body, headers=headers)
+
+        def names(path):
+            return [voter['name'] for voter in client.get(path, headers=headers).get_json()['voters']]
+
+        before = client.get('/api/results').get_json()['summary']['total_voters']
+        rows = [{'id': f'IMPORT{n:06d}', 'name': f'Imported {n}', 'email': f'imported{n}@example.com'}
+                for n in range(args.voters)]
+        response = import_roll(ndjson(rows))
+        counts = response.get_json()
+        if response.status_code != 200 or (counts['processed'], counts['created']) != (args.voters, args.voters):
+            failures.append(f'{label}: import returned {response.status_code} {counts}')
+        after = client.get('/api/results').get_json()['summary']['total_voters']
+        if after - before != args.voters:
+            failures.append(f'{label}: total_voters grew by {after - before}, expected {args.voters}')
+        if not names(f'/api/admin/voters?q=imported{args.voters - 1}'):
+            failures.append(f'{label}: search does not find the last imported voter')
+
+        # Warm the cache, then rename a voter without creating anyone
+        page = names('/api/admin/voters?limit=2&after=VOTER000')
+        searched = names('/api/admin/voters?q=james')
+        if 'James Miller' not in page or 'James Miller' not in searched:
+            failures.append(f'{label}: seeded voter missing before the rename ({page}, {searched})')
+        response = import_roll(ndjson([{'id': 'VOTER001', 'name': 'Renamed Person', 'email': 'voter1@email.com'}]))
+        if response.status_code != 200 or response.get_json()['created'] != 0:
+            failures.append(f'{label}: rename import returned {response.status_code} {response.get_json()}')
+        if 'Renamed Person' not in names('/api/admin/voters?limit=2&after=VOTER000'):
+            failures.append(f'{label}: cached voter page still shows the old name after a rename import')
+        if 'James Miller' in names('/api/admin/voters?q=james'):
+            failures.append(f'{label}: cached search still finds the old name after a rename import')
+        if 'Renamed Person' not in names('/api/admin/voters?q=renamed'):
+            failures.append(f'{label}: search does not find the new name')
+
+        # A bad row after a full chunk: the chunk before it stays written
+        total = client.get('/api/results').get_json()['summary']['total_voters']
+        partial = [{'id': f'PARTIAL{n:06d}', 'name': f'Partial {n}', 'email': ''}
+                   for n in range(voter_roll.IMPORT_CHUNK_SIZE)]
+        response = import_roll(ndjson(partial) + '{not json}\n')
+        counts = response.get_json()
+        if response.status_code != 400 or counts.get('created') != voter_roll.IMPORT_CHUNK_SIZE:
+            failures.append(f'{label}: failed import returned {response.status_code} {counts}')
+        grown = client.get('/api/results').get_json()['summary']['total_voters'] - total
+        if grown != counts.get('created'):
+            failures.append(f'{label}: total_voters grew by {grown} after a failed import that created {counts.get("created")}')
+        print(f'{label}: {args.voters} imported, rename and partial import reflected in pages, searches and the tally')
+    finally:
+        voting.SHARD_COUNT = 0
+        voting.db_pool.close_all()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--voters', type=int, default=12_000, help='voters in the first import')
+    args = parser.parse_args()
+
+    failures = []
+    for shard_count in (0, 2):
+        check_mode(shard_count, args, failures)
+
+    for failure in failures:
+        print(f'❌ {failure}')
+    if failures:
+        sys.exit(1)
+    print('✅ imports update counts, cached pages and searches, also when they only rename voters')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+CHECK: DUPLICATE VOTES ACROSS WORKER PROCESSES
+File: benchmarks/check_worker_votes.py
+Run: python benchmarks/check_worker_votes.py [--workers 4] [--voters 300] [--copies 6]
+
+Starts workers.py on a scratch database, then sends --copies concurrent
+votes for every one of --voters new voters (canonical VOTERnnn ids and
+free-form ids), each copy on its own connection so they land on different
+workers. Passes only if every voter got exactly one 200, /api/results is
+identical from every worker, and the change in the served tallies matches
+the votes_log rows added in SQLite (and candidates.votes, without shards).
+Exits 1 on any mismatch.
+"""
+import argparse
+import glob
+import http.client
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# All load comes from one client address; the per-IP limits would throttle it
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+
+
+def request(port, method, path, body=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    try:
+        payload = json.dumps(body) if body is not None else None
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        conn.request(method, path, payload, headers)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b'null')
+    finally:
+        conn.close()
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if request(port, 'GET', '/api/health')[0] == 200:
+                return
+        except OSError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError('workers did not start')
+        time.sleep(0.2)
+
+
+def logged_votes(workdir):
+    """{candidate_id: votes_log rows} over the main database and any shards."""
+    counts = Counter()
+    for path in glob.glob(os.path.join(workdir, 'voting*.db')):
+        conn = sqlite3.connect(path)
+        try:
+            counts.update(dict(conn.execute('SELECT candidate_id, COUNT(*) FROM votes_log GROUP BY candidate_id')))
+        finally:
+            conn.close()
+    return counts
+
+
+def served_votes(port):
+    _, health = request(port, 'GET', '/api/health')
+    _, results = request(port, 'GET', '/api/results')
+    return health['worker']['index'], {c['id']: c['votes'] for c in results['candidates']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--voters', type=int, default=300)
+    parser.add_argument('--copies', type=int, default=6)
+    parser.add_argument('--port', type=int, default=5097)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='worker-check-')
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(REPO, 'workers.py'), '--workers', str(args.workers), '--port', str(args.port)],
+        cwd=workdir, env=dict(os.environ, TALLY_CHECKPOINT_SECONDS='0'),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    failures = []
+    try:
+        wait_for_server(args.port)
+        _, candidates = request(args.port, 'GET', '/api/candidates')
+        candidate_ids = [c['id'] for c in candidates]
+        served_before = served_votes(args.port)[1]
+        logged_before = logged_votes(workdir)
+
+        voters = [f'VOTER{5000 + n}' if n % 2 else f'check-voter-{n}' for n in range(args.voters)]
+        jobs = [(voter_id, random.choice(candidate_ids)) for voter_id in voters for _ in range(args.copies)]
+        random.shuffle(jobs)
+        statuses = {voter_id: Counter() for voter_id in voters}
+        lock = threading.Lock()
+
+        def cast(voter_id, candidate_id):
+            try:
+                status, _ = request(args.port, 'POST', '/api/vote', {'voter_id': voter_id, 'candidate_id': candidate_id})
+            except OSError as e:
+                status = type(e).__name__
+            with lock:
+                statuses[voter_id][status] += 1
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=cast, args=job) for job in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - started
+        print(f'{len(jobs)} vote requests for {len(voters)} voters in {seconds:.2f}s')
+
+        for voter_id, counts in statuses.items():
+            if counts[200] != 1 or counts[403] != args.copies - 1:
+                failures.append(f'{voter_id}: {dict(counts)}')
+
+        time.sleep(0.2)
+        seen = {}
+        for _ in range(args.workers * 8):
+            index, served = served_votes(args.port)
+            seen[index] = served
+        if len(set(map(lambda r: tuple(sorted(r.items())), seen.values()))) != 1:
+            failures.append(f'workers disagree on /api/results: {seen}')
+        if len(seen) < min(args.workers, 2):
+            failures.append(f'only reached workers {sorted(seen)}')
+
+        logged = logged_votes(workdir)
+        sharded = len(glob.glob(os.path.join(workdir, 'voting*.db'))) > 1
+        conn = sqlite3.connect(os.path.join(workdir, 'voting.db'))
+        try:
+            stored = dict(conn.execute('SELECT id, votes FROM candidates'))
+        finally:
+            conn.close()
+        served = next(iter(seen.values()), {})
+        for candidate_id in candidate_ids:
+            served_delta = served.get(candidate_id, 0) - served_before.get(candidate_id, 0)
+            logged_delta = logged[candidate_id] - logged_before[candidate_id]
+            if served_delta != logged_delta:
+                failures.append(f'candidate {candidate_id}: +{served_delta} served, +{logged_delta} in votes_log')
+            if not sharded and stored.get(candidate_id) != served.get(candidate_id):
+                failures.append(f'candidate {candidate_id}: {served.get(candidate_id)} served, {stored.get(candidate_id)} stored')
+        accepted = sum(logged.values()) - sum(logged_before.values())
+        if accepted != len(voters):
+            failures.append(f'{accepted} votes logged for {len(voters)} voters')
+        print(f'workers checked: {sorted(seen)}, votes logged: {accepted}')
+    finally:
+        process.terminate()
+        process.wait()
+
+    for failure in failures[:20]:
+        print(f'❌ {failure}')
+    if failures:
+        print(f'❌ {len(failures)} problems')
+        sys.exit(1)
+    print('✅ one accepted vote per voter, consistent results on every worker')
+
+
+if __name__ == '__main__':
+    main()
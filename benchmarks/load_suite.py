@@ -0,0 +1,410 @@
+"""
+BENCHMARK: LOAD-TEST SUITE FOR THE VOTING API
+File: benchmarks/load_suite.py
+Run: python benchmarks/load_suite.py run [--voters 100000] [--candidates 8] [--mode inprocess,http]
+     python benchmarks/load_suite.py compare old.json new.json
+
+Generates a synthetic electorate (VOTERnnn ids, a deterministic fraction of
+them already voted, with matching votes_log, rollups and tally checkpoint),
+caches it under benchmarks/.electorates per schema version, then replays a weighted mix of
+voter-status checks, votes, results polls and stats requests against a
+fresh copy: in-process through the Flask test client and over HTTP against
+the threaded development server. Throughput, per-kind latency percentiles,
+error counts and database size before/after are written as JSON to
+benchmarks/results/ so runs can be compared across commits.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# All load comes from one client address; the per-IP limits would throttle it
+os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+sys.path.insert(0, REPO)
+
+CACHE_DIR = os.path.join(REPO, 'benchmarks', '.electorates')
+RESULTS_DIR = os.path.join(REPO, 'benchmarks', 'results')
+
+DEFAULT_MIX = 'status=50,vote=20,results=25,stats=5'
+
+# A voter has already voted when (n * HASH_MULTIPLIER) % 1000 falls below the
+# voted fraction in permille; the same rule is used in SQL and in the replay.
+HASH_MULTIPLIER = 2654435761
+
+
+def already_voted(number, permille):
+    return (number * HASH_MULTIPLIER) % 1000 < permille
+
+
+# ========== ELECTORATE GENERATION ==========
+def generate_electorate(path, voters, candidates, permille):
+    import db_pool
+    import integrity
+    import stats_rollup
+    import voter_search
+    import voting
+    from tally import Tally
+
+    voting.DATABASE = path
+    voting.init_db()
+
+    conn = db_pool.connect(path, 'balanced')
+    try:
+        conn.execute('DELETE FROM votes_log')
+        conn.execute('DELETE FROM voters')
+        conn.execute('DELETE FROM candidates')
+        voter_search.drop_triggers(conn)
+        conn.executemany(
+            'INSERT INTO candidates (id, name, party, bio, color, votes, avatar, image_url) VALUES (?, ?, ?, ?, ?, 0, ?, NULL)',
+            [(n, f'Candidate {n}', f'Party {n % 5}', '', '#4CAF50', '👤') for n in range(1, candidates + 1)]
+        )
+        conn.execute('''
+            WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < ?)
+            INSERT INTO voters (id, name, email, has_voted, vote_time)
+            SELECT printf('VOTER%03d', n), 'Voter ' || n, 'voter' || n || '@email.com',
+                   (n * ?) % 1000 < ?,
+                   CASE WHEN (n * ?) % 1000 < ? THEN datetime('now', '-' || (n % 168) || ' hours') END
+            FROM seq
+        ''', (voters, HASH_MULTIPLIER, permille, HASH_MULTIPLIER, permille))
+        conn.execute('''
+            INSERT INTO votes_log (voter_id, candidate_id, vote_time)
+            SELECT id, (CAST(substr(id, 6) AS INTEGER) % ?) + 1, vote_time
+            FROM voters WHERE has_voted = 1 ORDER BY vote_time
+        ''', (candidates,))
+        conn.execute('''
+            UPDATE candidates SET votes = (
+                SELECT COUNT(*) FROM votes_log WHERE votes_log.candidate_id = candidates.id
+            )
+        ''')
+        stats_rollup.rebuild(conn.cursor())
+        voter_search.ensure_index(conn)
+        voter_search.rebuild(conn)
+        integrity.record_baseline(conn.cursor())
+        conn.commit()
+        Tally().checkpoint(conn)
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        conn.close()
+
+
+def electorate(voters, candidates, voted_fraction, regenerate=False):
+    """Path of a cached electorate database, generating it if needed."""
+    import migrations
+
+    permille = int(voted_fraction * 1000)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Keyed by schema version: a cache built before a migration is never reused
+    path = os.path.join(CACHE_DIR, f'electorate-v{migrations.LATEST_VERSION}-{voters}-{candidates}-{permille}.db')
+    if regenerate or not os.path.exists(path):
+        stale = [path + suffix for suffix in ('', '-wal', '-shm')] + [os.path.splitext(path)[0] + '.journal']
+        for stale_path in stale:
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+        started = time.perf_counter()
+        # Generated in a child so this process never holds pools on the cache file.
+        code = (f'import sys; sys.path.insert(0, {REPO!r}); sys.path.insert(0, {os.path.dirname(__file__)!r});'
+                f'import load_suite; load_suite.generate_electorate({path!r}, {voters}, {candidates}, {permille})')
+        subprocess.run([sys.executable, '-c', code], check=True, cwd=tempfile.mkdtemp(prefix='electorate-'),
+                       env=dict(os.environ, TALLY_CHECKPOINT_SECONDS='0'))
+        print(f'   generated {voters} voters in {time.perf_counter() - started:.1f}s')
+    return path
+
+
+def database_size(path):
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+
+
+# ========== WORKLOAD ==========
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(','):
+        kind, _, weight = part.partition('=')
+        if kind not in ('status', 'vote', 'results', 'stats', 'candidates'):
+            raise ValueError(f'Unknown request kind: {kind}')
+        mix[kind] = float(weight)
+    return mix
+
+
+class Workload:
+    """Per-thread request generator; each thread votes with its own voters."""
+
+    def __init__(self, voters, candidates, permille, mix, seed, thread_index, threads):
+        self.voters = voters
+        self.candidates = candidates
+        self.permille = permille
+        self.kinds = list(mix)
+        self.weights = list(mix.values())
+        self.random = random.Random(seed * 1000 + thread_index)
+        self.next_voter = thread_index + 1
+        self.stride = threads
+
+    def _fresh_voter(self):
+        while self.next_voter <= self.voters:
+            number = self.next_voter
+            self.next_voter += self.stride
+            if not already_voted(number, self.permille):
+                return number
+        return self.random.randint(1, self.voters)
+
+    def next(self):
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        if kind == 'status':
+            return kind, 'GET', f'/api/voter/VOTER{self.random.randint(1, self.voters):03d}', None
+        if kind == 'vote':
+            body = {'voter_id': f'VOTER{self._fresh_voter():03d}', 'candidate_id': self.random.randint(1, self.candidates)}
+            return kind, 'POST', '/api/vote', body
+        if kind == 'results':
+            return kind, 'GET', '/api/results', None
+        if kind == 'stats':
+            return kind, 'GET', '/api/stats', None
+        return kind, 'GET', '/api/candidates', None
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(samples, elapsed):
+    kinds = {}
+    for kind, status, seconds in samples:
+        entry = kinds.setdefault(kind, {'latencies': [], 'statuses': {}})
+        entry['latencies'].append(seconds)
+        entry['statuses'][str(status)] = entry['statuses'].get(str(status), 0) + 1
+    report = {}
+    for kind, entry in sorted(kinds.items()):
+        ordered = sorted(entry['latencies'])
+        report[kind] = {
+            'requests': len(ordered),
+            'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+            'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+            'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+            'max_ms': round(ordered[-1] * 1000, 3),
+            'statuses': entry['statuses']
+        }
+    every = sorted(s[2] for s in samples)
+    errors = sum(1 for s in samples if not isinstance(s[1], int) or s[1] >= 500)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'req_per_sec': round(len(samples) / elapsed, 1) if elapsed else 0,
+        'p50_ms': round(percentile(every, 50) * 1000, 3),
+        'p99_ms': round(percentile(every, 99) * 1000, 3),
+        'by_kind': report
+    }
+
+
+def drive(send_factory, args, mix):
+    samples = []
+    lock = threading.Lock()
+    per_thread = args.requests // args.threads
+    permille = int(args.voted_fraction * 1000)
+
+    def worker(index):
+        send = send_factory()
+        workload = Workload(args.voters, args.candidates, permille, mix, args.seed, index, args.threads)
+        local = []
+        for _ in range(per_thread):
+            kind, method, path, body = workload.next()
+            started = time.perf_counter()
+            try:
+                status = send(method, path, body)
+            except (OSError, http.client.HTTPException) as e:
+                status = type(e).__name__
+            local.append((kind, status, time.perf_counter() - started))
+        with lock:
+            samples.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return summarize(samples, time.perf_counter() - started)
+
+
+# ========== RUNNERS ==========
+def run_inprocess(database, args, mix):
+    import voting
+    voting.DATABASE = database
+    voting.get_pool().warm()
+    voting.get_tally()
+
+    def send_factory():
+        client = voting.app.test_client()
+
+        def send(method, path, body):
+            return client.open(path, method=method, json=body).status_code
+        return send
+
+    return drive(send_factory, args, mix)
+
+
+SERVER = ("import sys; sys.path.insert(0, {repo!r}); import voting; voting.get_pool().warm(); "
+          "voting.get_tally(); voting.app.run(port={port}, threaded=True)")
+
+
+def run_http(database, args, mix):
+    env = dict(os.environ, TALLY_CHECKPOINT_SECONDS='0')
+    process = subprocess.Popen(
+        [sys.executable, '-c', SERVER.format(repo=REPO, port=args.port)],
+        cwd=os.path.dirname(database), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                probe = http.client.HTTPConnection('127.0.0.1', args.port, timeout=2)
+                probe.request('GET', '/api/health')
+                if probe.getresponse().status == 200:
+                    break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError('server did not start')
+                time.sleep(0.2)
+
+        def send_factory():
+            conn = http.client.HTTPConnection('127.0.0.1', args.port, timeout=30)
+
+            def send(method, path, body):
+                payload = json.dumps(body) if body is not None else None
+                headers = {'Content-Type': 'application/json'} if body is not None else {}
+                try:
+                    conn.request(method, path, payload, headers)
+                    response = conn.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    raise
+                return response.status
+            return send
+
+        return drive(send_factory, args, mix)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+RUNNERS = {'inprocess': run_inprocess, 'http': run_http}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    mix = parse_mix(args.mix)
+    source = electorate(args.voters, args.candidates, args.voted_fraction, args.regenerate)
+    report = {
+        'commit': git_commit(),
+        'started_at': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'config': {
+            'voters': args.voters,
+            'candidates': args.candidates,
+            'voted_fraction': args.voted_fraction,
+            'mix': mix,
+            'requests': args.requests,
+            'threads': args.threads,
+            'seed': args.seed,
+            'env': {k: v for k, v in os.environ.items()
+                    if k.startswith(('VOTE_', 'DB_', 'SHARD_', 'METRICS_', 'VOTED_INDEX_', 'RATE_LIMIT'))}
+        },
+        'runs': {}
+    }
+
+    for mode in args.mode.split(','):
+        workdir = tempfile.mkdtemp(prefix=f'load-{mode}-')
+        database = os.path.join(workdir, 'voting.db')
+        shutil.copy(source, database)
+        size_before = database_size(database)
+        result = RUNNERS[mode](database, args, mix)
+        result['db_bytes_before'] = size_before
+        result['db_bytes_after'] = database_size(database)
+        report['runs'][mode] = result
+        print(f"{mode:>10}: {result['req_per_sec']:>8} req/s  p50 {result['p50_ms']} ms  "
+              f"p99 {result['p99_ms']} ms  errors {result['errors']}  db {result['db_bytes_after'] / 1e6:.1f} MB")
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f'{stamp}-{report["commit"] or "nogit"}-{args.voters}.json')
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'✅ Results saved to {output}')
+
+
+# ========== COMPARISON ==========
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    def change(a, b):
+        return f'{(b - a) / a * 100:+.1f}%' if a else 'n/a'
+
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    print(f"{'mode':>10} {'kind':>10} {'metric':>12} {'old':>10} {'new':>10} {'change':>9}")
+    for mode in sorted(set(old['runs']) & set(new['runs'])):
+        a, b = old['runs'][mode], new['runs'][mode]
+        for metric in ('req_per_sec', 'p50_ms', 'p99_ms', 'db_bytes_after'):
+            print(f"{mode:>10} {'all':>10} {metric:>12} {a[metric]:>10} {b[metric]:>10} {change(a[metric], b[metric]):>9}")
+        for kind in sorted(set(a['by_kind']) & set(b['by_kind'])):
+            for metric in ('p50_ms', 'p99_ms'):
+                x, y = a['by_kind'][kind][metric], b['by_kind'][kind][metric]
+                print(f'{mode:>10} {kind:>10} {metric:>12} {x:>10} {y:>10} {change(x, y):>9}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Voting API load-test suite')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help='generate an electorate and replay a request mix')
+    run_parser.add_argument('--voters', type=int, default=100_000, help='electorate size (10k to 10M)')
+    run_parser.add_argument('--candidates', type=int, default=8)
+    run_parser.add_argument('--voted-fraction', type=float, default=0.3, help='share of voters who already voted')
+    run_parser.add_argument('--mix', default=DEFAULT_MIX, help='weights for status, vote, results, stats, candidates')
+    run_parser.add_argument('--requests', type=int, default=20_000)
+    run_parser.add_argument('--threads', type=int, default=16)
+    run_parser.add_argument('--mode', default='inprocess,http')
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--port', type=int, default=5201)
+    run_parser.add_argument('--regenerate', action='store_true', help='rebuild the cached electorate')
+    run_parser.add_argument('--output', help='JSON report path (default benchmarks/results/...)')
+
+    compare_parser = sub.add_parser('compare', help='diff two saved reports')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run(args)
+    else:
+        compare(args.old, args.new)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+RESPONSE COMPRESSION
+File: compression.py
+Used by: voting.py (after_request hook)
+
+Compresses responses of at least `min_bytes` with brotli (when the brotli
+package is installed) or gzip, whichever the client prefers in
+Accept-Encoding. Bodies that carry an ETag (the cached read endpoints)
+are compressed once per ETag and encoding and then served from a small
+LRU; streamed responses (voter exports) are compressed chunk by chunk.
+Compressed responses keep their ETag as a weak validator, which still
+matches If-None-Match.
+"""
+import threading
+import zlib
+from collections import Counter, OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = {'application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html'}
+
+
+def _gzip_compressor(level):
+    return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+
+class Compressor:
+    def __init__(self, min_bytes=1024, gzip_level=6, brotli_quality=5, cache_entries=128, enabled=True):
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_entries = cache_entries
+        self.enabled = enabled
+        self.encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.responses = Counter()
+        self.bytes_in = Counter()
+        self.bytes_out = Counter()
+        self.cache_hits = 0
+
+    def init_app(self, app):
+        app.after_request(self.compress_response)
+
+    # ========== ENCODERS ==========
+    def compress(self, body, encoding):
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        compressor = _gzip_compressor(self.gzip_level)
+        return compressor.compress(body) + compressor.flush()
+
+    def compress_stream(self, chunks, encoding):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            compress, finish = compressor.process, compressor.finish
+        else:
+            compressor = _gzip_compressor(self.gzip_level)
+            compress, finish = compressor.compress, compressor.flush
+        size_in = size_out = 0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf8')
+                size_in += len(chunk)
+                data = compress(chunk)
+                if data:
+                    size_out += len(data)
+                    yield data
+            data = finish()
+            size_out += len(data)
+            yield data
+        finally:
+            with self._lock:
+                self.bytes_in[encoding] += size_in
+                self.bytes_out[encoding] += size_out
+
+    def _cached(self, key, body):
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return data
+        data = self.compress(body, key[1])
+        with self._lock:
+            self._cache[key] = data
+            if len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return data
+
+    # ========== FLASK INTEGRATION ==========
+    def compress_response(self, response):
+        if (not self.enabled or response.status_code != 200 or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE or request.method == 'HEAD'):
+            return response
+        if not response.is_streamed and (response.content_length or 0) < self.min_bytes:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self.compress_stream(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+            response.direct_passthrough = True
+        else:
+            body = response.get_data()
+            etag, weak = response.get_etag()
+            data = self._cached((etag, encoding), body) if etag else self.compress(body, encoding)
+            response.set_data(data)
+            if etag:
+                response.set_etag(etag, weak=True)
+            with self._lock:
+                self.bytes_in[encoding] += len(body)
+                self.bytes_out[encoding] += len(data)
+        response.headers['Content-Encoding'] = encoding
+        with self._lock:
+            self.responses[encoding] += 1
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'encodings': self.encodings,
+                'min_bytes': self.min_bytes,
+                'responses': dict(self.responses),
+                'bytes_in': dict(self.bytes_in),
+                'bytes_out': dict(self.bytes_out),
+                'ratio': {e: round(self.bytes_out[e] / self.bytes_in[e], 3) for e in self.bytes_in if self.bytes_in[e]},
+                'cache_entries': len(self._cache),
+                'cache_hits': self.cache_hits
+            }
@@ -0,0 +1,209 @@
+"""
+SQLITE CONNECTION POOL
+File: db_pool.py
+Used by: voting.py, app.py
+
+Keeps warmed SQLite connections configured with a pragma profile (WAL
+journal, synchronous level, page cache and mmap size) and a per-connection
+prepared statement cache, and records checkout metrics for sizing.
+"""
+import queue
+import sqlite3
+import threading
+import time
+
+
+# synchronous=FULL keeps every acknowledged commit durable across power loss;
+# NORMAL in WAL mode only risks the last transactions on an OS crash.
+PRAGMA_PROFILES = {
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -16000,
+        'mmap_size': 64 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000
+    },
+    'balanced': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,
+        'mmap_size': 256 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000
+    },
+    'legacy': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000
+    }
+}
+
+STATEMENT_CACHE_SIZE = 256
+
+# Instrumentation hooks (set by metrics.py when METRICS_ENABLED): the
+# sqlite3.Connection subclass used for new connections, and a callable that
+# receives the seconds each pool checkout waited.
+CONNECTION_FACTORY = sqlite3.Connection
+WAIT_OBSERVER = None
+
+
+def connect(database, profile='durable', **kwargs):
+    """Open a single connection with the given pragma profile applied."""
+    kwargs.setdefault('cached_statements', STATEMENT_CACHE_SIZE)
+    kwargs.setdefault('factory', CONNECTION_FACTORY)
+    conn = sqlite3.connect(database, **kwargs)
+    conn.row_factory = sqlite3.Row
+    for name, value in PRAGMA_PROFILES[profile].items():
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, database, size=8, profile='durable', timeout=10.0):
+        if profile not in PRAGMA_PROFILES:
+            raise ValueError(f'Unknown pragma profile: {profile}')
+        self.database = database
+        self.size = size
+        self.profile = profile
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _new_connection(self):
+        return connect(self.database, self.profile, check_same_thread=False)
+
+    def warm(self, count=None):
+        """Open connections up front so first requests do not pay for it."""
+        for _ in range(min(count or self.size, self.size)):
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+            self._idle.put(self._new_connection())
+
+    def acquire(self):
+        started = time.perf_counter()
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    conn = self._new_connection()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise PoolTimeout(f'No database connection free after {self.timeout}s')
+
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_total += waited
+            if waited > 0.001:
+                self._waits += 1
+            if waited > self._wait_max:
+                self._wait_max = waited
+        if WAIT_OBSERVER is not None:
+            WAIT_OBSERVER(waited)
+        return conn
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            with self._lock:
+                self._in_use -= 1
+                self._created -= 1
+            return
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(conn)
+
+    def connection(self):
+        """Context manager form: `with pool.connection() as conn: ...`"""
+        return _PooledConnection(self)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'profile': self.profile,
+                'open': self._created,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'checkouts': self._checkouts,
+                'waited_checkouts': self._waits,
+                'avg_wait_ms': round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0,
+                'max_wait_ms': round(self._wait_max * 1000, 3)
+            }
+
+
+class _PooledConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = None
+
+    def __enter__(self):
+        self.conn = self.pool.acquire()
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.pool.release(self.conn)
+        self.conn = None
+
+
+# ========== SHARED POOL REGISTRY ==========
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(database, size=8, profile='durable'):
+    """Return the process-wide pool for `database`, creating it on first use."""
+    pool = _pools.get(database)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(database)
+            if pool is None:
+                pool = ConnectionPool(database, size, profile)
+                _pools[database] = pool
+    return pool
+
+
+def close_all():
+    """Close idle connections of every pool and forget the pools (before fork)."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
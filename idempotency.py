@@ -0,0 +1,207 @@
+"""
+IDEMPOTENT REQUEST REPLAY
+File: idempotency.py
+Used by: voting.py (POST /api/vote), workers.py (the writer holds the store)
+
+A client sends the same Idempotency-Key header (or "idempotency_key" JSON
+field) with every retry of one request. The first successful response is
+stored under the key with a fingerprint of the JSON body; retries within
+the TTL get the stored bytes back (with Idempotent-Replayed: true) before
+the rate limiter or the view runs, so they never touch the database. A
+retry that arrives while the first attempt is still running waits for it
+instead of racing it. Reusing a key for a different body is refused with
+422. Entries live in one dict in the order they were stored, which is also
+the order they expire in: each store drops expired entries from the old
+end, then the oldest ones beyond max_entries. Only 200 responses are
+stored: a failed attempt leaves the key free for the next retry.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import jsonify, make_response, request
+
+HEADER = 'Idempotency-Key'
+JSON_FIELD = 'idempotency_key'
+
+
+def fingerprint(data):
+    """Stable digest of a JSON body, whatever its key order or spacing."""
+    encoded = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(encoded.encode('utf8')).hexdigest()[:20]
+
+
+class IdempotencyCache:
+    def __init__(self, ttl=300, max_entries=100_000, max_key_length=255, wait_timeout=30.0, enabled=True):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_key_length = max_key_length
+        self.wait_timeout = wait_timeout
+        self.enabled = enabled
+        # Set in worker processes: stored responses are looked up in and
+        # written to the writer's cache, so any worker can replay them
+        self.remote = None
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.conflicts = 0
+        self.stored = 0
+        self.expired = 0
+        self.evictions = 0
+
+    # ----- store -----
+    def lookup(self, key, digest, now=None):
+        """('hit', body), ('conflict', None) or (None, None) for an unknown or expired key."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, None
+            if entry[0] <= now:
+                self._drop(key)
+                self.expired += 1
+                return None, None
+        if entry[1] != digest:
+            return 'conflict', None
+        return 'hit', entry[2]
+
+    def store(self, key, digest, body, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (now + self.ttl, digest, body)
+            self._bytes += len(key) + len(body)
+            self.stored += 1
+            while self._entries:
+                oldest = next(iter(self._entries))
+                if self._entries[oldest][0] <= now:
+                    self.expired += 1
+                elif len(self._entries) > self.max_entries:
+                    self.evictions += 1
+                else:
+                    break
+                self._drop(oldest)
+
+    def _drop(self, key):
+        body = self._entries.pop(key)[2]
+        self._bytes -= len(key) + len(body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    # ----- requests -----
+    def _find(self, key, digest):
+        if self.remote is not None:
+            return self.remote.lookup(key, digest)
+        return self.lookup(key, digest)
+
+    def _claim(self, key, digest):
+        """Returns (state, body); state is 'owner' when this request has to run the view."""
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            with self._lock:
+                pending = self._pending.get(key)
+                if pending is None:
+                    self._pending[key] = threading.Event()
+            if pending is None:
+                try:
+                    state, body = self._find(key, digest)
+                except Exception:
+                    self._release(key)
+                    raise
+                if state is None:
+                    return 'owner', None
+                self._release(key)
+                return state, body
+            self.waits += 1
+            if not pending.wait(max(0.0, deadline - time.monotonic())):
+                return 'busy', None
+
+    def _release(self, key):
+        with self._lock:
+            event = self._pending.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def _replay(self, body):
+        self.hits += 1
+        response = make_response(body)
+        response.mimetype = 'application/json'
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response
+
+    def replayable(self, view):
+        """Decorator: serve retries carrying a known key from the cache."""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            data = request.get_json(silent=True)
+            key = request.headers.get(HEADER) or (data.get(JSON_FIELD) if isinstance(data, dict) else None)
+            if not self.enabled or not key:
+                return view(*args, **kwargs)
+            key = str(key)
+            if len(key) > self.max_key_length:
+                return jsonify({'error': f'{HEADER} is longer than {self.max_key_length} characters'}), 400
+
+            digest = fingerprint(data)
+            state, body = self._claim(key, digest)
+            if state == 'hit':
+                return self._replay(body)
+            if state == 'conflict':
+                self.conflicts += 1
+                return jsonify({'error': f'{HEADER} was already used for a different request'}), 422
+            if state == 'busy':
+                response = make_response(jsonify({'error': f'A request with this {HEADER} is still in progress'}), 409)
+                response.headers['Retry-After'] = '1'
+                return response
+
+            try:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    body = response.get_data()
+                    if self.remote is not None:
+                        self.remote.store(key, digest, body)
+                    else:
+                        self.store(key, digest, body)
+                elif response.status_code == 403 and self.remote is not None:
+                    # The first attempt may have gone through another worker
+                    state, body = self.remote.lookup(key, digest)
+                    if state == 'hit':
+                        return self._replay(body)
+                self.misses += 1
+                return response
+            finally:
+                self._release(key)
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            entries, held = len(self._entries), self._bytes
+            pending = len(self._pending)
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'ttl_seconds': self.ttl,
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'bytes': held,
+            'in_flight': pending,
+            'hits': self.hits,
+            'misses': self.misses,
+            'waits': self.waits,
+            'conflicts': self.conflicts,
+            'stored': self.stored,
+            'expired': self.expired,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups * 100, 2) if lookups else 0,
+            'store': 'writer' if self.remote is not None else 'local'
+        }
@@ -0,0 +1,315 @@
+"""
+CANDIDATE IMAGE CACHE
+File: image_store.py
+Used by: voting.py (GET /api/candidates/<id>/image, admin uploads, prefetch)
+
+A candidate photo is fetched from its image_url once, or uploaded by an
+admin, and stored under the image directory with the SHA-256 of its bytes
+as the file name. When Pillow is installed, thumbnails are also written at
+each configured width, never wider than the original. Without Pillow,
+every width serves the original. The candidate_images table maps a
+candidate id to its current digest. Each process caches those rows and
+re-reads the table at most every `revalidate_seconds` (and at once when a
+request names a digest it does not know), so an upload handled by one
+worker reaches the others within that interval. Image URLs carry the
+digest (?v=), so a browser may keep them for as long as it likes. Failed
+fetches are retried only after `retry_seconds`, so a slow or broken
+upstream is not hit again on every page view.
+"""
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+IMAGE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS candidate_images (
+        candidate_id INTEGER PRIMARY KEY,
+        digest TEXT NOT NULL,
+        content_type TEXT NOT NULL,
+        thumb_type TEXT,
+        widths TEXT NOT NULL DEFAULT '',
+        source TEXT,
+        stored_at TIMESTAMP
+    )
+'''
+
+# Leading bytes -> content type; anything else is refused
+SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif')
+]
+EXTENSIONS = {'image/jpeg': 'jpg', 'image/png': 'png', 'image/gif': 'gif', 'image/webp': 'webp'}
+# Thumbnails keep the original format, except GIF (first frame, as PNG)
+THUMB_FORMATS = {'image/jpeg': ('JPEG', 'image/jpeg'), 'image/png': ('PNG', 'image/png'),
+                 'image/gif': ('PNG', 'image/png'), 'image/webp': ('WEBP', 'image/webp')}
+DIGEST_CHARS = 16
+
+
+class ImageError(ValueError):
+    pass
+
+
+class ImageUnavailable(ImageError):
+    """The source could not be fetched (network error, bad status, too large)."""
+
+
+def sniff(data):
+    for signature, content_type in SIGNATURES:
+        if data.startswith(signature):
+            return content_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    raise ImageError('Not a JPEG, PNG, GIF or WebP image')
+
+
+def fetch_url(url, timeout, max_bytes):
+    if not url.lower().startswith(('http://', 'https://')):
+        raise ImageUnavailable(f'Unsupported image URL: {url}')
+    request = urllib.request.Request(url, headers={'User-Agent': 'online-voting-system image cache'})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            data = response.read(max_bytes + 1)
+    except (urllib.error.URLError, OSError) as e:
+        raise ImageUnavailable(f'Could not fetch {url}: {e}')
+    if len(data) > max_bytes:
+        raise ImageUnavailable(f'Image at {url} is larger than {max_bytes} bytes')
+    return data
+
+
+class ImageStore:
+    def __init__(self, directory, connection, widths=(160, 480), max_bytes=5 * 1024 * 1024,
+                 fetch_timeout=5.0, retry_seconds=300, revalidate_seconds=2.0, fetcher=fetch_url):
+        self.directory = directory
+        self.connection = connection
+        self.widths = sorted(widths)
+        self.max_bytes = max_bytes
+        self.fetch_timeout = fetch_timeout
+        self.retry_seconds = retry_seconds
+        self.revalidate_seconds = revalidate_seconds
+        self.fetcher = fetcher
+        self.version = 0
+        self._records = {}
+        self._checked_at = 0.0
+        self._failures = {}
+        self._fetch_locks = {}
+        self._lock = threading.Lock()
+        self.fetches = 0
+        self.fetch_errors = 0
+        self.uploads = 0
+
+    def reset(self):
+        """Forget cached records and failures (after init_db rebuilt the tables)."""
+        with self._lock:
+            self._records.clear()
+            self._failures.clear()
+            self.version += 1
+
+    # ========== LOOKUP ==========
+    @staticmethod
+    def _from_row(row):
+        return {
+            'digest': row['digest'],
+            'content_type': row['content_type'],
+            'thumb_type': row['thumb_type'],
+            'widths': [int(w) for w in row['widths'].split(',') if w],
+            'source': row['source']
+        }
+
+    def revalidate(self, force=False):
+        """Pick up rows stored by other processes; returns the (possibly bumped) version.
+
+        The table holds one row per candidate, so it is read whole, at most
+        every revalidate_seconds unless forced.
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.revalidate_seconds:
+            return self.version
+        self._checked_at = now
+        with self.connection() as conn:
+            rows = conn.execute('SELECT * FROM candidate_images').fetchall()
+        current = {row['candidate_id']: self._from_row(row) for row in rows}
+        with self._lock:
+            if current != self._records:
+                self._records = current
+                self.version += 1
+        return self.version
+
+    def record(self, candidate_id, digest=None):
+        """The stored record; `digest` is the ?v= a client asked for, re-read at once if unknown."""
+        self.revalidate(force=digest is not None and not self._matches(candidate_id, digest))
+        record = self._records.get(candidate_id)
+        if record is not None:
+            return record
+        with self.connection() as conn:
+            row = conn.execute('SELECT * FROM candidate_images WHERE candidate_id = ?', (candidate_id,)).fetchone()
+        if row is None:
+            return None
+        return self._remember(candidate_id, self._from_row(row))
+
+    def _matches(self, candidate_id, digest):
+        record = self._records.get(candidate_id)
+        return record is not None and self.is_current(record, digest)
+
+    def _remember(self, candidate_id, record):
+        with self._lock:
+            self._records[candidate_id] = record
+            self.version += 1
+        return record
+
+    def url(self, candidate):
+        """Path of the candidate's image, with the digest once it is stored."""
+        record = self._records.get(candidate['id'])
+        if record is None and not candidate.get('image_url'):
+            return None
+        path = f"/api/candidates/{candidate['id']}/image?w={self.widths[-1]}"
+        return f"{path}&v={record['digest'][:DIGEST_CHARS]}" if record else path
+
+    def is_current(self, record, version):
+        return version == record['digest'][:DIGEST_CHARS]
+
+    def file_for(self, record, width=None):
+        """(path, content type, etag) of the smallest stored size at least `width` wide."""
+        chosen = next((w for w in record['widths'] if width and w >= width), None)
+        if chosen is None:
+            extension = EXTENSIONS[record['content_type']]
+            return (os.path.join(self.directory, f"{record['digest']}.{extension}"),
+                    record['content_type'], record['digest'][:DIGEST_CHARS])
+        extension = EXTENSIONS[record['thumb_type']]
+        return (os.path.join(self.directory, f"{record['digest']}-{chosen}.{extension}"),
+                record['thumb_type'], f"{record['digest'][:DIGEST_CHARS]}-{chosen}")
+
+    # ========== STORING ==========
+    def _write(self, name, data):
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+
+    def _thumbnails(self, digest, data, content_type):
+        """Write one thumbnail per configured width below the original's; returns the widths."""
+        if Image is None:
+            return None, []
+        try:
+            original = Image.open(io.BytesIO(data))
+            original.load()
+        except Exception as e:
+            raise ImageError(f'Unreadable image: {e}')
+        image_format, thumb_type = THUMB_FORMATS[content_type]
+        if image_format == 'JPEG' and original.mode != 'RGB':
+            original = original.convert('RGB')
+        elif original.mode == 'P':
+            original = original.convert('RGBA')
+        widths = []
+        for width in self.widths:
+            if width >= original.width:
+                break
+            thumb = original.copy()
+            thumb.thumbnail((width, original.height), Image.LANCZOS)
+            buffer = io.BytesIO()
+            thumb.save(buffer, image_format, quality=85, optimize=True)
+            self._write(f'{digest}-{width}.{EXTENSIONS[thumb_type]}', buffer.getvalue())
+            widths.append(width)
+        return thumb_type, widths
+
+    def store(self, candidate_id, data, source=None):
+        if len(data) > self.max_bytes:
+            raise ImageError(f'Image is larger than {self.max_bytes} bytes')
+        content_type = sniff(data)
+        digest = hashlib.sha256(data).hexdigest()
+        os.makedirs(self.directory, exist_ok=True)
+        thumb_type, widths = self._thumbnails(digest, data, content_type)
+        self._write(f'{digest}.{EXTENSIONS[content_type]}', data)
+
+        with self.connection() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO candidate_images '
+                '(candidate_id, digest, content_type, thumb_type, widths, source, stored_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (candidate_id, digest, content_type, thumb_type, ','.join(map(str, widths)), source,
+                 datetime.now().isoformat())
+            )
+            conn.commit()
+        with self._lock:
+            self._failures.pop(candidate_id, None)
+        return self._remember(candidate_id, {
+            'digest': digest, 'content_type': content_type, 'thumb_type': thumb_type,
+            'widths': widths, 'source': source
+        })
+
+    def upload(self, candidate_id, data):
+        record = self.store(candidate_id, data, source='upload')
+        self.uploads += 1
+        return record
+
+    # ========== FETCHING ==========
+    def ensure(self, candidate, digest=None):
+        """The stored record, fetching the candidate's image_url first if needed."""
+        record = self.record(candidate['id'], digest)
+        url = candidate.get('image_url')
+        if record is not None or not url:
+            return record
+
+        with self._lock:
+            lock = self._fetch_locks.setdefault(candidate['id'], threading.Lock())
+        with lock:
+            record = self._records.get(candidate['id'])
+            if record is not None:
+                return record
+            failure = self._failures.get(candidate['id'])
+            if failure is not None and failure[0] == url and time.monotonic() - failure[1] < self.retry_seconds:
+                raise ImageUnavailable(failure[2])
+            try:
+                self.fetches += 1
+                data = self.fetcher(url, self.fetch_timeout, self.max_bytes)
+                return self.store(candidate['id'], data, source=url)
+            except ImageError as e:
+                self.fetch_errors += 1
+                with self._lock:
+                    self._failures[candidate['id']] = (url, time.monotonic(), str(e))
+                raise ImageUnavailable(str(e))
+
+    def prefetch(self, candidates):
+        """Fetch missing candidate images in a background thread."""
+        def run():
+            for candidate in candidates:
+                try:
+                    self.ensure(candidate)
+                except ImageError as e:
+                    print(f"⚠️ Candidate image {candidate['id']} not cached: {e}")
+                except Exception as e:
+                    print(f"⚠️ Candidate image prefetch failed: {e}")
+                    return
+
+        thread = threading.Thread(target=run, name='image-prefetch', daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        return {
+            'directory': self.directory,
+            'thumbnails': Image is not None,
+            'widths': self.widths,
+            'cached': len(self._records),
+            'failing': len(self._failures),
+            'fetches': self.fetches,
+            'fetch_errors': self.fetch_errors,
+            'uploads': self.uploads
+        }
@@ -0,0 +1,531 @@
+"""
+VOTE INTEGRITY VERIFIER
+File: integrity.py
+Used by: voting.py (background thread, /api/admin/integrity), workers.py
+         (the writer process runs the thread), migrations.py, shards.py
+Run: python integrity.py check [--database voting.db] [--repair]
+
+Checks `votes_log`, `voters.has_voted` and the candidate counters against
+each other while votes land:
+  - every log row has a voter row, marked as voted, and is the only log
+    row of that voter
+  - every voter marked as voted has a log row (a rolling sweep over the
+    partial index of voted voters, one chunk per step)
+  - each counter equals its baseline plus the log rows for the candidate
+
+Log rows are read in chunks after a high-water mark on `votes_log.id`,
+with the per-candidate counts so far, so a pass only reads new rows. The
+mark is kept in `integrity_state` and survives restarts. The baseline is
+the part of a counter with no log row behind it, e.g. the seeded counts
+of init_db(). It is recorded when the database is seeded or reset (or
+when the state row is first created), and verification then starts over
+from the beginning of the log.
+
+Reads run in short read transactions on a dedicated connection, which in
+WAL mode never block the vote writer. Repairs take the write lock once
+per pass: missing or unmarked voters are marked as voted, duplicate log
+rows are deleted with their counter and rollup increments, and counters
+are set to baseline + log. A voter marked as voted without a log row is
+only reported, since the ballot it cast is unknown.
+"""
+import argparse
+import json
+import secrets
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import db_pool
+
+
+INTEGRITY_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS integrity_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        token TEXT NOT NULL,
+        last_log_id INTEGER NOT NULL,
+        logged TEXT NOT NULL,
+        baseline TEXT NOT NULL,
+        updated_at TIMESTAMP
+    )
+'''
+
+# One chunk of log rows with everything the checks need about each
+LOG_CHUNK_QUERY = '''
+    SELECT l.id, l.voter_id, l.candidate_id, l.vote_time, v.id IS NULL AS missing, v.has_voted,
+           EXISTS (SELECT 1 FROM votes_log d WHERE d.voter_id = l.voter_id AND d.id < l.id) AS duplicate
+    FROM votes_log l LEFT JOIN voters v ON v.id = l.voter_id
+    WHERE l.id > ? ORDER BY l.id LIMIT ?
+'''
+
+VOTER_SWEEP_QUERY = '''
+    SELECT v.id, EXISTS (SELECT 1 FROM votes_log l WHERE l.voter_id = v.id) AS logged
+    FROM voters v WHERE v.has_voted = 1 AND v.id > ? ORDER BY v.id LIMIT ?
+'''
+
+NEXT_UNVERIFIED_QUERY = 'SELECT vote_time FROM votes_log WHERE id > ? ORDER BY id LIMIT 1'
+
+COUNTER_QUERIES = {
+    'candidates': 'SELECT id, votes FROM candidates',
+    'candidate_votes': 'SELECT candidate_id, votes FROM candidate_votes'
+}
+
+KINDS = ('missing_voter', 'unmarked_voter', 'duplicate_vote', 'unlogged_voter')
+
+
+def record_baseline(cursor, counter_table='candidates'):
+    """Take the counts not backed by a log row as given and restart
+    verification from the first log row (caller commits)."""
+    cursor.execute(INTEGRITY_SCHEMA)
+    logged = {row[0]: row[1] for row in cursor.execute(
+        'SELECT candidate_id, COUNT(*) FROM votes_log GROUP BY candidate_id')}
+    baseline = {}
+    for candidate_id, votes in cursor.execute(COUNTER_QUERIES[counter_table]).fetchall():
+        if votes != logged.get(candidate_id, 0):
+            baseline[candidate_id] = votes - logged.get(candidate_id, 0)
+    cursor.execute(
+        'INSERT OR REPLACE INTO integrity_state (id, token, last_log_id, logged, baseline, updated_at) '
+        'VALUES (1, ?, 0, ?, ?, ?)',
+        (secrets.token_hex(8), '{}', json.dumps(baseline), datetime.now().isoformat())
+    )
+    return baseline
+
+
+def _timestamp(vote_time):
+    try:
+        return datetime.fromisoformat(vote_time).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _counts(text):
+    return {int(k): v for k, v in json.loads(text).items()}
+
+
+class Verifier:
+    """Incremental checks of one database file (the main one or a shard)."""
+
+    def __init__(self, database, counter_table='candidates', chunk_size=2000, profile='durable', max_findings=1000):
+        self.database = database
+        self.counter_table = counter_table
+        self.chunk_size = chunk_size
+        self.profile = profile
+        self.max_findings = max_findings
+        self._conn = None
+        self._lock = threading.Lock()
+        self._forget()
+        self.rows_checked = 0
+        self.voters_checked = 0
+        self.sweeps = 0
+        self.found = dict.fromkeys(KINDS, 0)
+        self.repaired = dict.fromkeys(KINDS + ('counter',), 0)
+        self.dropped = 0
+
+    def _forget(self):
+        self.token = None
+        self.last_log_id = 0
+        self.persisted_log_id = 0
+        self.logged = {}
+        self.baseline = {}
+        self.log_max_id = 0
+        self.verified_as_of = None
+        self.sweep_after = ''
+        self.findings = OrderedDict()
+        self.counters = []
+
+    def reload(self):
+        """Drop what was derived from the file (after a restore); the next
+        step reads the state row again."""
+        with self._lock:
+            self._forget()
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = db_pool.connect(self.database, self.profile, isolation_level=None,
+                                         check_same_thread=False)
+            self._conn.execute(INTEGRITY_SCHEMA)
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ========== CHECKS ==========
+    def step(self):
+        """Check one chunk of log rows and the next chunk of voted voters.
+
+        Returns (log verified up to its end, voter sweep just wrapped around).
+        """
+        with self._lock:
+            conn = self._connection()
+            started = time.time()
+            conn.execute('BEGIN')
+            try:
+                state = conn.execute(
+                    'SELECT token, last_log_id, logged, baseline FROM integrity_state WHERE id = 1'
+                ).fetchone()
+                if state is None:
+                    conn.execute('COMMIT')
+                    self._establish(conn)
+                    return False, False
+                log_max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM votes_log').fetchone()[0]
+                if state['token'] != self.token or self.last_log_id > log_max_id:
+                    # Seeded, reset or restored since the last step
+                    self._forget()
+                    self.token = state['token']
+                    self.last_log_id = self.persisted_log_id = state['last_log_id']
+                    self.logged = _counts(state['logged'])
+                    self.baseline = _counts(state['baseline'])
+                self.log_max_id = log_max_id
+
+                rows = conn.execute(LOG_CHUNK_QUERY, (self.last_log_id, self.chunk_size)).fetchall()
+                log_done = len(rows) < self.chunk_size
+                counters = dict(tuple(row) for row in conn.execute(COUNTER_QUERIES[self.counter_table])) \
+                    if log_done else None
+                next_vote = None if log_done else conn.execute(
+                    NEXT_UNVERIFIED_QUERY, (rows[-1]['id'],)).fetchone()
+                sweep = conn.execute(VOTER_SWEEP_QUERY, (self.sweep_after, self.chunk_size)).fetchall()
+            finally:
+                if conn.in_transaction:
+                    conn.execute('COMMIT')
+
+            for row in rows:
+                self.logged[row['candidate_id']] = self.logged.get(row['candidate_id'], 0) + 1
+                if row['missing']:
+                    self._found('missing_voter', row)
+                elif not row['has_voted']:
+                    self._found('unmarked_voter', row)
+                if row['duplicate']:
+                    self._found('duplicate_vote', row)
+            if rows:
+                self.last_log_id = rows[-1]['id']
+            self.rows_checked += len(rows)
+            if log_done:
+                self.verified_as_of = started
+                self.counters = self._compare(counters)
+            elif next_vote is not None:
+                self.verified_as_of = _timestamp(next_vote[0]) or self.verified_as_of
+
+            for voter_id, logged in sweep:
+                if not logged:
+                    self._found('unlogged_voter', {'voter_id': voter_id})
+                elif self.found['unlogged_voter']:
+                    self.findings.pop(('unlogged_voter', voter_id), None)
+            self.voters_checked += len(sweep)
+            wrapped = len(sweep) < self.chunk_size
+            if wrapped:
+                self.sweep_after = ''
+                self.sweeps += 1
+            else:
+                self.sweep_after = sweep[-1]['id']
+
+            if log_done and self.last_log_id != self.persisted_log_id:
+                self._persist(conn)
+            return log_done, wrapped
+
+    def _establish(self, conn):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            record_baseline(conn.cursor(), self.counter_table)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _found(self, kind, row):
+        key = (kind, row['id'] if kind == 'duplicate_vote' else row['voter_id'])
+        if key in self.findings:
+            return
+        finding = {'kind': kind, 'voter_id': row['voter_id'], 'detected_at': datetime.now().isoformat()}
+        if kind != 'unlogged_voter':
+            finding.update(log_id=row['id'], candidate_id=row['candidate_id'], vote_time=row['vote_time'])
+        self.findings[key] = finding
+        self.found[kind] += 1
+        if len(self.findings) > self.max_findings:
+            self.findings.popitem(last=False)
+            self.dropped += 1
+
+    def _expected(self, candidate_id):
+        return self.baseline.get(candidate_id, 0) + self.logged.get(candidate_id, 0)
+
+    def _compare(self, counters):
+        return [
+            {'candidate_id': candidate_id, 'counter': votes, 'expected': self._expected(candidate_id)}
+            for candidate_id, votes in sorted(counters.items()) if votes != self._expected(candidate_id)
+        ]
+
+    def _persist(self, conn):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            self._write_state(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _write_state(self, conn):
+        conn.execute(
+            'UPDATE integrity_state SET last_log_id = ?, logged = ?, updated_at = ? WHERE id = 1 AND token = ?',
+            (self.last_log_id, json.dumps(self.logged), datetime.now().isoformat(), self.token)
+        )
+        self.persisted_log_id = self.last_log_id
+
+    # ========== REPAIR ==========
+    def repair(self):
+        """Fix the outstanding findings in one write transaction.
+
+        Returns (voter ids now marked as voted, whether anything changed);
+        every statement re-checks its condition, so a
+        finding that was fixed meanwhile is left alone.
+        """
+        with self._lock:
+            repairable = [key for key, f in self.findings.items() if f['kind'] != 'unlogged_voter']
+            if not repairable and not self.counters:
+                return [], False
+            conn = self._connection()
+            marked, recount = [], False
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                token = conn.execute('SELECT token FROM integrity_state WHERE id = 1').fetchone()
+                if token is None or token[0] != self.token:
+                    conn.execute('ROLLBACK')
+                    return [], False
+                cursor = conn.cursor()
+                done = []
+                for key in repairable:
+                    finding = self.findings[key]
+                    changed = self._repair_one(cursor, finding)
+                    if finding['kind'] != 'duplicate_vote' and changed:
+                        marked.append(finding['voter_id'])
+                    recount |= changed
+                    done.append(key)
+
+                # Counters can only be compared with a log that has no unverified rows
+                if self.counters and cursor.execute(
+                        'SELECT COALESCE(MAX(id), 0) FROM votes_log').fetchone()[0] == self.last_log_id:
+                    counters = dict(tuple(row) for row in cursor.execute(COUNTER_QUERIES[self.counter_table]))
+                    fixes = [(self._expected(c['candidate_id']), c['candidate_id']) for c in self._compare(counters)]
+                    if self.counter_table == 'candidate_votes':
+                        cursor.executemany(
+                            'INSERT INTO candidate_votes (candidate_id, votes) VALUES (?2, ?1) '
+                            'ON CONFLICT(candidate_id) DO UPDATE SET votes = excluded.votes', fixes
+                        )
+                    else:
+                        cursor.executemany('UPDATE candidates SET votes = ? WHERE id = ?', fixes)
+                    self.repaired['counter'] += len(fixes)
+                    recount |= bool(fixes)
+                    self.counters = []
+                self._write_state(conn)
+                conn.execute('COMMIT')
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+            for key in done:
+                self.repaired[self.findings.pop(key)['kind']] += 1
+            return marked, recount
+
+    def _repair_one(self, cursor, finding):
+        voter_id, vote_time = finding['voter_id'], finding['vote_time']
+        if finding['kind'] == 'missing_voter':
+            cursor.execute(
+                'INSERT OR IGNORE INTO voters (id, name, email, has_voted, vote_time) VALUES (?, ?, ?, 1, ?)',
+                (voter_id, f'Voter {voter_id}', f'{voter_id}@email.com', vote_time)
+            )
+        elif finding['kind'] == 'unmarked_voter':
+            cursor.execute('UPDATE voters SET has_voted = 1, vote_time = ? WHERE id = ? AND has_voted = 0',
+                           (vote_time, voter_id))
+        else:
+            cursor.execute(
+                'DELETE FROM votes_log WHERE id = ? AND EXISTS '
+                '(SELECT 1 FROM votes_log d WHERE d.voter_id = ? AND d.id < ?)',
+                (finding['log_id'], voter_id, finding['log_id'])
+            )
+            if cursor.rowcount != 1:
+                return False
+            # Undo everything the extra ballot added
+            candidate_id = finding['candidate_id']
+            if self.counter_table == 'candidate_votes':
+                cursor.execute('UPDATE candidate_votes SET votes = votes - 1 WHERE candidate_id = ?', (candidate_id,))
+            else:
+                cursor.execute('UPDATE candidates SET votes = votes - 1 WHERE id = ?', (candidate_id,))
+            if vote_time:
+                cursor.execute('UPDATE votes_by_day SET votes = votes - 1 WHERE day = ?', (vote_time[:10],))
+                cursor.execute('UPDATE votes_by_hour SET votes = votes - 1 WHERE hour = ?', (vote_time[11:13],))
+            cursor.execute(
+                'DELETE FROM ranked_ballots WHERE id = (SELECT MAX(id) FROM ranked_ballots WHERE voter_id = ?) '
+                'AND (SELECT COUNT(*) FROM ranked_ballots WHERE voter_id = ?) > 1',
+                (voter_id, voter_id)
+            )
+            self.logged[candidate_id] -= 1
+            return True
+        return cursor.rowcount == 1
+
+    # ========== REPORTING ==========
+    def report(self, limit=100):
+        with self._lock:
+            return {
+                'database': self.database,
+                'verified_log_id': self.last_log_id,
+                'log_max_id': self.log_max_id,
+                'lag_rows': max(0, self.log_max_id - self.last_log_id),
+                'verified_as_of': datetime.fromtimestamp(self.verified_as_of).isoformat()
+                if self.verified_as_of else None,
+                'lag_seconds': round(time.time() - self.verified_as_of, 3) if self.verified_as_of else None,
+                'rows_checked': self.rows_checked,
+                'voters_checked': self.voters_checked,
+                'sweeps': self.sweeps,
+                'baseline': self.baseline,
+                'counters': self.counters,
+                'found': dict(self.found),
+                'repaired': dict(self.repaired),
+                'outstanding': len(self.findings),
+                'dropped': self.dropped,
+                'findings': list(self.findings.values())[:limit]
+            }
+
+
+class IntegrityMonitor:
+    def __init__(self, targets, interval=10.0, chunk_size=2000, pause=0.02, repair=False,
+                 on_repair=None, profile='durable'):
+        """`targets()` returns [(database path, counter table)]: the main
+        file, or every shard file. `on_repair(voter_ids, recount)` runs after
+        a repair changed something, to update in-memory state."""
+        self.targets = targets
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.auto_repair = repair
+        self.on_repair = on_repair
+        self.profile = profile
+        self.verifiers = []
+        self._verifiers_lock = threading.Lock()
+        self._round_lock = threading.Lock()
+        self._thread = None
+        self.rounds = 0
+        self.last_round_seconds = None
+        self.last_error = None
+
+    def _current(self):
+        targets = list(self.targets())
+        with self._verifiers_lock:
+            if [(v.database, v.counter_table) for v in self.verifiers] != targets:
+                for verifier in self.verifiers:
+                    verifier.close()
+                self.verifiers = [Verifier(path, table, self.chunk_size, self.profile) for path, table in targets]
+            return self.verifiers
+
+    # ========== PUBLIC API ==========
+    def run_round(self, repair=None, rescan=False, full_sweep=False, pause=0.0):
+        """Verify every file up to the end of its log; repair afterwards if
+        asked (or if auto-repair is on).
+
+        The voter sweep moves on one chunk per step, so background passes
+        cover the voted voters over many passes; `full_sweep` walks all of
+        them in this one. `rescan` checks the whole log again.
+        """
+        repair = self.auto_repair if repair is None else repair
+        with self._round_lock:
+            started = time.perf_counter()
+            verifiers = self._current()
+            for verifier in verifiers:
+                with verifier._lock:
+                    if rescan:
+                        verifier.last_log_id, verifier.logged = 0, {}
+                    if full_sweep:
+                        verifier.sweep_after = ''
+            pending = list(verifiers)
+            while pending:
+                steps = [(verifier, verifier.step()) for verifier in pending]
+                pending = [verifier for verifier, (log_done, wrapped) in steps
+                           if not log_done or (full_sweep and not wrapped)]
+                if pending and pause:
+                    time.sleep(pause)
+            if repair:
+                self._repair(verifiers)
+            self.rounds += 1
+            self.last_round_seconds = round(time.perf_counter() - started, 3)
+
+    def _repair(self, verifiers):
+        marked, recount = [], False
+        for verifier in verifiers:
+            voter_ids, changed = verifier.repair()
+            marked += voter_ids
+            recount |= changed
+        if (marked or recount) and self.on_repair is not None:
+            self.on_repair(marked, recount)
+
+    def reload(self):
+        for verifier in self._current():
+            verifier.reload()
+
+    def report(self, limit=100):
+        files = [verifier.report(limit) for verifier in self._current()]
+        lags = [f['lag_seconds'] for f in files]
+        return {
+            'running': self._thread is not None and self._thread.is_alive(),
+            'auto_repair': self.auto_repair,
+            'interval_seconds': self.interval,
+            'chunk_size': self.chunk_size,
+            'rounds': self.rounds,
+            'last_round_seconds': self.last_round_seconds,
+            'last_error': self.last_error,
+            'lag_rows': sum(f['lag_rows'] for f in files),
+            'lag_seconds': max(lags) if lags and None not in lags else None,
+            'outstanding': sum(f['outstanding'] + len(f['counters']) for f in files),
+            'files': files
+        }
+
+    def stats(self):
+        report = self.report(limit=0)
+        return {key: report[key] for key in ('running', 'rounds', 'lag_rows', 'lag_seconds', 'outstanding',
+                                             'last_error')}
+
+    # ========== VERIFIER THREAD ==========
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+        self._thread = threading.Thread(target=self._run, name='integrity-verifier', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def _run(self):
+        while True:
+            try:
+                self.run_round(pause=self.pause)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+            time.sleep(self.interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check votes_log, voter flags and candidate counters')
+    parser.add_argument('command', choices=['check'])
+    parser.add_argument('--database', default='voting.db')
+    parser.add_argument('--counter-table', default='candidates', choices=sorted(COUNTER_QUERIES),
+                        help='candidate_votes for a shard file')
+    parser.add_argument('--repair', action='store_true')
+    args = parser.parse_args()
+
+    monitor = IntegrityMonitor(lambda: [(args.database, args.counter_table)], repair=args.repair)
+    monitor.run_round(full_sweep=True)
+    report = monitor.report()['files'][0]
+    print(f"✅ Verified {report['rows_checked']} log rows and {report['voters_checked']} voted voters "
+          f"(log id {report['verified_log_id']})")
+    for finding in report['findings']:
+        print(f"❌ {finding['kind']}: {finding['voter_id']}" + (f" (log id {finding['log_id']})"
+                                                               if 'log_id' in finding else ''))
+    for counter in report['counters']:
+        print(f"❌ candidate {counter['candidate_id']}: counter {counter['counter']}, expected {counter['expected']}")
+    if any(report['repaired'].values()):
+        print(f"🔧 Repaired: {', '.join(f'{k} {v}' for k, v in report['repaired'].items() if v)}")
+    if report['outstanding'] or report['counters']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
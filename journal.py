@@ -0,0 +1,521 @@
+"""
+APPEND-ONLY VOTE JOURNAL
+File: journal.py
+Used by: voting.py, vote_batcher.py, shards.py
+Run: python journal.py replay [--database voting.db]
+     python journal.py verify [--database voting.db]
+     python journal.py rebuild [--database voting.db]
+
+Every accepted ballot is appended to a memory-mapped file of fixed 64-byte
+records and synced before the SQLite transaction that records it commits,
+so the journal is always a superset of what the database holds. Each
+record carries a sequence number and a CRC32. A ballot whose transaction
+fails afterwards is marked void in place, and an election reset appends a
+RESET marker, so the file stays an audit trail of the whole election.
+A ranked ballot's ranking follows its vote in RANKING records of up to 19
+candidate ids each.
+
+`replay` rebuilds per-candidate counts, the voted-set and the rankings from
+the journal alone; `verify` compares them with votes_log, voters,
+ranked_ballots and the candidate counters; `rebuild` rewrites those tables
+from the journal after a crash.
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+import db_pool
+import stats_rollup
+
+
+MAGIC = b'VOTEJRNL'
+FORMAT_VERSION = 1
+HEADER_SIZE = 64
+RECORD_SIZE = 64
+MAX_VOTER_ID_BYTES = 38
+GROW_BYTES = 16 * 1024 * 1024
+
+# seq, microseconds since 1970-01-01 (naive), candidate_id, flags, id length, voter id, crc32.
+# BASELINE records carry a candidate's count that has no ballot behind it
+# (seeded demo counts) in the time field. RANKING records carry part of the
+# preceding vote's ranking (uint16 candidate ids) in the voter id field.
+RECORD = struct.Struct('<QqIBB38sI')
+BODY = struct.Struct('<QqIBB38s')
+HEADER = struct.Struct('<8sII')
+
+FLAG_VOTE = 1
+FLAG_VOID = 2
+FLAG_RESET = 4
+FLAG_BASELINE = 8
+FLAG_RANKING = 16
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+class JournalError(Exception):
+    pass
+
+
+def journal_path(database):
+    root, _ = os.path.splitext(database)
+    return f'{root}.journal'
+
+
+def to_micros(vote_time):
+    try:
+        moment = datetime.fromisoformat(vote_time)
+    except (TypeError, ValueError):
+        return 0
+    return (moment.replace(tzinfo=None) - _EPOCH) // _MICROSECOND
+
+
+def from_micros(micros):
+    return (_EPOCH + timedelta(microseconds=micros)).isoformat()
+
+
+def trim_ranking(blob):
+    """A ranked.encode blob without its zero padding."""
+    end = len(blob)
+    while end >= 2 and blob[end - 2:end] == b'\0\0':
+        end -= 2
+    return bytes(blob[:end])
+
+
+class VoteJournal:
+    def __init__(self, path, sync=True, grow_bytes=GROW_BYTES):
+        self.path = path
+        self.sync_writes = sync
+        self.grow_bytes = grow_bytes
+        self._lock = threading.Lock()
+        self.appended = 0
+        self.syncs = 0
+        self.sync_seconds = 0.0
+        self.torn_records = 0
+        self._open()
+
+    # ========== FILE MANAGEMENT ==========
+    def _open(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        self._file = os.fdopen(fd, 'r+b')
+        size = os.fstat(fd).st_size
+        if size < HEADER_SIZE:
+            self._file.truncate(HEADER_SIZE + self.grow_bytes)
+            self._file.seek(0)
+            self._file.write(HEADER.pack(MAGIC, FORMAT_VERSION, RECORD_SIZE).ljust(HEADER_SIZE, b'\0'))
+            self._file.flush()
+            os.fsync(fd)
+        self._map = mmap.mmap(fd, 0)
+        magic, version, record_size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD_SIZE:
+            raise JournalError(f'{self.path} is not a version {FORMAT_VERSION} vote journal')
+        self._tail, self._seq = self._find_tail()
+
+    def _find_tail(self):
+        """Offset after the last intact record, and its sequence number.
+
+        A record with a bad checksum at the very end is a torn write from a
+        crash mid-append; it is zeroed so the next append reuses the slot.
+        """
+        offset = HEADER_SIZE
+        seq = 0
+        end = len(self._map) - RECORD_SIZE
+        while offset <= end:
+            record_seq = struct.unpack_from('<Q', self._map, offset)[0]
+            if record_seq == 0:
+                break
+            seq = record_seq
+            offset += RECORD_SIZE
+        last = offset - RECORD_SIZE
+        if last >= HEADER_SIZE and not _intact(self._map, last):
+            self._map[last:offset] = bytes(RECORD_SIZE)
+            self.torn_records += 1
+            offset = last
+            seq = struct.unpack_from('<Q', self._map, last - RECORD_SIZE)[0] if last > HEADER_SIZE else 0
+        return offset, seq
+
+    def _ensure_capacity(self, needed):
+        if self._tail + needed <= len(self._map):
+            return
+        size = len(self._map) + max(self.grow_bytes, needed)
+        self._map.close()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+
+    def _sync(self, start, end):
+        if not self.sync_writes:
+            return
+        started = time.perf_counter()
+        aligned = start - start % mmap.PAGESIZE
+        self._map.flush(aligned, end - aligned)
+        self.syncs += 1
+        self.sync_seconds += time.perf_counter() - started
+
+    def _write(self, offset, seq, micros, candidate_id, flags, voter_id):
+        raw = voter_id if flags & FLAG_RANKING else voter_id.encode('utf8')
+        if len(raw) > MAX_VOTER_ID_BYTES:
+            raise JournalError(f'Voter ID longer than {MAX_VOTER_ID_BYTES} bytes')
+        body = BODY.pack(seq, micros, candidate_id, flags, len(raw), raw)
+        self._map[offset:offset + BODY.size] = body
+        struct.pack_into('<I', self._map, offset + BODY.size, zlib.crc32(body))
+
+    # ========== WRITES ==========
+    def append(self, votes):
+        """Append and sync [(voter_id, candidate_id, vote_time[, ranking])].
+
+        `ranking` is an encoded ranked ballot (ranked.encode) or None.
+        Returns the record offsets, for `void` if the caller's transaction
+        fails.
+        """
+        records = []
+        for voter_id, candidate_id, vote_time, *ranking in votes:
+            micros = to_micros(vote_time)
+            records.append((micros, candidate_id, FLAG_VOTE, voter_id))
+            ranking = trim_ranking(ranking[0]) if ranking and ranking[0] is not None else b''
+            for part in range(0, len(ranking), MAX_VOTER_ID_BYTES):
+                records.append((micros, 0, FLAG_RANKING, ranking[part:part + MAX_VOTER_ID_BYTES]))
+        with self._lock:
+            self._ensure_capacity(len(records) * RECORD_SIZE)
+            start = self._tail
+            offsets = []
+            for micros, candidate_id, flags, value in records:
+                self._write(self._tail, self._seq + 1, micros, candidate_id, flags, value)
+                self._seq += 1
+                offsets.append(self._tail)
+                self._tail += RECORD_SIZE
+            self._sync(start, self._tail)
+            self.appended += len(offsets)
+            return offsets
+
+    def void(self, offsets):
+        """Mark records whose ballots were not committed."""
+        with self._lock:
+            for offset in offsets:
+                seq, micros, candidate_id, flags, length, raw, _ = RECORD.unpack_from(self._map, offset)
+                value = raw[:length] if flags & FLAG_RANKING else raw[:length].decode('utf8')
+                self._write(offset, seq, micros, candidate_id, flags | FLAG_VOID, value)
+            if offsets:
+                self._sync(min(offsets), max(offsets) + RECORD_SIZE)
+
+    def record_reset(self, conn):
+        """Append a RESET marker, candidate baselines, then every votes_log row
+        with its ranked ballot."""
+        markers = [(to_micros(datetime.now().isoformat()), 0, FLAG_RESET)]
+        if _has_table(conn, 'candidates'):
+            markers += [(votes, candidate_id, FLAG_BASELINE) for candidate_id, votes in conn.execute('''
+                SELECT id, votes - (SELECT COUNT(*) FROM votes_log WHERE votes_log.candidate_id = candidates.id)
+                FROM candidates
+            ''') if votes]
+        with self._lock:
+            self._ensure_capacity(len(markers) * RECORD_SIZE)
+            start = self._tail
+            for value, candidate_id, flags in markers:
+                self._write(self._tail, self._seq + 1, value, candidate_id, flags, '')
+                self._seq += 1
+                self._tail += RECORD_SIZE
+            self._sync(start, self._tail)
+        rankings = {}
+        if _has_table(conn, 'ranked_ballots'):
+            # Newest first, so a voter's first ballot is the one kept
+            rankings = dict(conn.execute('SELECT voter_id, ranking FROM ranked_ballots ORDER BY id DESC').fetchall())
+        rows = conn.execute('SELECT voter_id, candidate_id, vote_time FROM votes_log ORDER BY id')
+        while True:
+            chunk = rows.fetchmany(5000)
+            if not chunk:
+                break
+            self.append([(*row, rankings.get(row[0])) for row in chunk])
+
+    def truncate(self):
+        """Start an empty journal (a freshly initialized database)."""
+        with self._lock:
+            self._map[HEADER_SIZE:self._tail] = bytes(self._tail - HEADER_SIZE)
+            self._sync(HEADER_SIZE, max(self._tail, HEADER_SIZE + 1))
+            self._tail, self._seq = HEADER_SIZE, 0
+
+    def close(self):
+        with self._lock:
+            self._map.close()
+            self._file.close()
+
+    def stats(self):
+        records = (self._tail - HEADER_SIZE) // RECORD_SIZE
+        return {
+            'path': self.path,
+            'records': records,
+            'last_seq': self._seq,
+            'bytes': self._tail,
+            'allocated_bytes': len(self._map),
+            'appended': self.appended,
+            'syncs': self.syncs,
+            'avg_sync_ms': round(self.sync_seconds / self.syncs * 1000, 3) if self.syncs else 0,
+            'torn_records_repaired': self.torn_records
+        }
+
+
+def _intact(buffer, offset):
+    return zlib.crc32(buffer[offset:offset + BODY.size]) == struct.unpack_from('<I', buffer, offset + BODY.size)[0]
+
+
+# ========== SHARED JOURNAL REGISTRY ==========
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def get_journal(path, sync=True):
+    """Return the process-wide journal for `path`, opening it on first use."""
+    journal = _journals.get(path)
+    if journal is None:
+        with _journals_lock:
+            journal = _journals.get(path)
+            if journal is None:
+                journal = _journals[path] = VoteJournal(path, sync)
+    return journal
+
+
+def close_journals():
+    """Close and forget every open journal (before fork)."""
+    with _journals_lock:
+        for journal in _journals.values():
+            journal.close()
+        _journals.clear()
+
+
+# ========== REPLAY ==========
+class Replay:
+    """Election state reconstructed from a journal file."""
+
+    def __init__(self):
+        self.counts = {}
+        self.baseline = {}
+        self.voters = {}
+        self.rankings = {}
+        self.records = 0
+        self.voided = 0
+        self.resets = 0
+        self.duplicates = 0
+        self.corrupt = []
+        self.seconds = 0.0
+
+    def summary(self):
+        return {
+            'records': self.records,
+            'votes': len(self.voters),
+            'ranked': len(self.rankings),
+            'voided': self.voided,
+            'resets': self.resets,
+            'duplicates': self.duplicates,
+            'corrupt': len(self.corrupt),
+            'seconds': round(self.seconds, 3),
+            'records_per_sec': round(self.records / self.seconds) if self.seconds else 0,
+            'counts': dict(sorted(self.counts.items())),
+            'baseline': dict(sorted(self.baseline.items()))
+        }
+
+    def candidate_totals(self):
+        totals = dict(self.baseline)
+        for candidate_id, votes in self.counts.items():
+            totals[candidate_id] = totals.get(candidate_id, 0) + votes
+        return totals
+
+
+def replay(path, check_crc=True):
+    """Read every record; only votes after the last RESET count."""
+    state = Replay()
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, record_size = HEADER.unpack_from(buffer, 0)
+            if magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD_SIZE:
+                raise JournalError(f'{path} is not a version {FORMAT_VERSION} vote journal')
+            view = memoryview(buffer)[HEADER_SIZE:]
+            usable = len(view) - len(view) % RECORD_SIZE
+            counts, voters, baseline, rankings = state.counts, state.voters, state.baseline, state.rankings
+            crc32 = zlib.crc32
+            records = voided = resets = duplicates = 0
+            # The vote the next RANKING records belong to; None after a duplicate
+            ranked_voter = None
+            offset = -RECORD_SIZE
+            for seq, micros, candidate_id, flags, length, raw, crc in RECORD.iter_unpack(view[:usable]):
+                offset += RECORD_SIZE
+                if seq == 0:
+                    break
+                if check_crc and crc32(view[offset:offset + BODY.size]) != crc:
+                    state.corrupt.append(seq)
+                    continue
+                records += 1
+                if flags == FLAG_RANKING:
+                    if ranked_voter is not None:
+                        rankings[ranked_voter] = rankings.get(ranked_voter, b'') + raw[:length]
+                    continue
+                ranked_voter = None
+                if flags == FLAG_VOTE:
+                    voter_id = raw[:length].decode('utf8')
+                    if voter_id in voters:
+                        duplicates += 1
+                        continue
+                    voters[voter_id] = (candidate_id, micros)
+                    counts[candidate_id] = counts.get(candidate_id, 0) + 1
+                    ranked_voter = voter_id
+                elif flags & FLAG_VOID:
+                    voided += not flags & FLAG_RANKING
+                elif flags & FLAG_RESET:
+                    resets += 1
+                    counts.clear()
+                    voters.clear()
+                    baseline.clear()
+                    rankings.clear()
+                elif flags & FLAG_BASELINE:
+                    baseline[candidate_id] = micros
+            state.records, state.voided, state.resets, state.duplicates = records, voided, resets, duplicates
+            del view
+        finally:
+            buffer.close()
+    state.seconds = time.perf_counter() - started
+    return state
+
+
+# ========== VERIFY / REBUILD ==========
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def verify(conn, state, sample=20):
+    """Compare a replayed journal with votes_log, voters and counters."""
+    logged = {}
+    mismatched = []
+    for voter_id, candidate_id in conn.execute('SELECT voter_id, candidate_id FROM votes_log'):
+        logged[voter_id] = candidate_id
+        expected = state.voters.get(voter_id)
+        if expected is not None and expected[0] != candidate_id:
+            mismatched.append(voter_id)
+    missing_in_db = [v for v in state.voters if v not in logged]
+    missing_in_journal = [v for v in logged if v not in state.voters]
+
+    voted = {row[0] for row in conn.execute('SELECT id FROM voters WHERE has_voted = 1')}
+    not_marked = [v for v in state.voters if v not in voted]
+    marked_without_vote = [v for v in voted if v not in state.voters]
+
+    stored_rankings = {}
+    if _has_table(conn, 'ranked_ballots'):
+        stored_rankings = {voter_id: trim_ranking(ranking) for voter_id, ranking in
+                           conn.execute('SELECT voter_id, ranking FROM ranked_ballots ORDER BY id DESC')}
+    ranking_mismatch = [v for v in set(state.rankings) | set(stored_rankings)
+                        if state.rankings.get(v) != stored_rankings.get(v)]
+
+    if _has_table(conn, 'candidate_votes'):
+        counters = dict(conn.execute('SELECT candidate_id, votes FROM candidate_votes').fetchall())
+        expected = state.counts
+    else:
+        counters = dict(conn.execute('SELECT id, votes FROM candidates').fetchall())
+        expected = state.candidate_totals()
+    counter_drift = {}
+    for candidate_id in set(counters) | set(expected):
+        if counters.get(candidate_id, 0) != expected.get(candidate_id, 0):
+            counter_drift[candidate_id] = {'table': counters.get(candidate_id, 0), 'journal': expected.get(candidate_id, 0)}
+
+    problems = (missing_in_db, missing_in_journal, mismatched, not_marked, marked_without_vote, ranking_mismatch)
+    return {
+        'ok': not any(problems) and not counter_drift and not state.corrupt,
+        'journal_votes': len(state.voters),
+        'logged_votes': len(logged),
+        'missing_in_database': {'count': len(missing_in_db), 'sample': missing_in_db[:sample]},
+        'missing_in_journal': {'count': len(missing_in_journal), 'sample': missing_in_journal[:sample]},
+        'candidate_mismatch': {'count': len(mismatched), 'sample': mismatched[:sample]},
+        'voted_flag_missing': {'count': len(not_marked), 'sample': not_marked[:sample]},
+        'voted_without_ballot': {'count': len(marked_without_vote), 'sample': marked_without_vote[:sample]},
+        'ranking_mismatch': {'count': len(ranking_mismatch), 'sample': ranking_mismatch[:sample]},
+        'counter_drift': counter_drift,
+        'corrupt_records': state.corrupt[:sample]
+    }
+
+
+def rebuild(conn, state):
+    """Rewrite votes_log, voters.has_voted, ranked_ballots and vote counters
+    from the journal.
+
+    On the main database `candidates.votes` becomes the journaled baseline
+    plus the journal counts; on a shard the candidate_votes table is
+    replaced.
+    """
+    votes = sorted(state.voters.items(), key=lambda item: item[1][1])
+    rows = [(voter_id, candidate_id, from_micros(micros)) for voter_id, (candidate_id, micros) in votes]
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM votes_log')
+        conn.executemany('INSERT INTO votes_log (voter_id, candidate_id, vote_time) VALUES (?, ?, ?)', rows)
+        conn.execute('UPDATE voters SET has_voted = 0, vote_time = NULL WHERE has_voted = 1')
+        conn.executemany(
+            "INSERT OR IGNORE INTO voters (id, name, email, has_voted) VALUES (?, 'Voter ' || ?, ? || '@email.com', 0)",
+            [(r[0], r[0], r[0]) for r in rows]
+        )
+        conn.executemany('UPDATE voters SET has_voted = 1, vote_time = ? WHERE id = ?', [(r[2], r[0]) for r in rows])
+        if _has_table(conn, 'ranked_ballots'):
+            # Stored without padding; BallotBox pads them to its width
+            conn.execute('DELETE FROM ranked_ballots')
+            conn.executemany('INSERT INTO ranked_ballots (voter_id, ranking) VALUES (?, ?)',
+                             [(r[0], state.rankings[r[0]]) for r in rows if r[0] in state.rankings])
+        if _has_table(conn, 'candidate_votes'):
+            conn.execute('DELETE FROM candidate_votes')
+            conn.executemany('INSERT INTO candidate_votes (candidate_id, votes) VALUES (?, ?)', list(state.counts.items()))
+        else:
+            totals = state.candidate_totals()
+            conn.executemany(
+                'UPDATE candidates SET votes = ? WHERE id = ?',
+                [(totals.get(row[0], 0), row[0]) for row in conn.execute('SELECT id FROM candidates').fetchall()]
+            )
+        stats_rollup.rebuild(conn.cursor())
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+    if not _has_table(conn, 'candidate_votes'):
+        from tally import Tally
+        Tally().checkpoint(conn)
+    return len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay, verify or rebuild from the vote journal')
+    parser.add_argument('command', choices=['replay', 'verify', 'rebuild'])
+    parser.add_argument('--database', default='voting.db')
+    parser.add_argument('--journal', help='journal file (default: next to the database)')
+    parser.add_argument('--no-crc', action='store_true', help='skip checksum verification on replay')
+    args = parser.parse_args()
+
+    path = args.journal or journal_path(args.database)
+    state = replay(path, check_crc=not args.no_crc)
+    summary = state.summary()
+    print(f"📜 {summary['records']} records, {summary['votes']} live votes ({summary['ranked']} ranked), {summary['voided']} voided, "
+          f"{summary['resets']} resets, {summary['corrupt']} corrupt "
+          f"({summary['records_per_sec']:,} records/s)")
+
+    if args.command == 'replay':
+        for candidate_id, votes in summary['counts'].items():
+            print(f'   candidate {candidate_id}: {votes}')
+        return
+
+    conn = db_pool.connect(args.database, isolation_level=None)
+    try:
+        if args.command == 'verify':
+            report = verify(conn, state)
+            for key, value in report.items():
+                print(f'   {key}: {value}')
+            print('✅ Database matches the journal' if report['ok'] else '❌ Database and journal disagree')
+            sys.exit(0 if report['ok'] else 1)
+        written = rebuild(conn, state)
+        print(f'✅ Rebuilt votes_log, voters and counters from {written} journaled votes')
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+FAST JSON ENCODING & COLUMNAR RESULTS
+File: json_codec.py
+Used by: voting.py (app.json provider, ?format=columnar), voter_roll.py (exports)
+
+Uses orjson when it is installed and falls back to the standard library
+otherwise (or when `enabled` is switched off). Both paths sort keys, like
+Flask's default provider, so a response has the same content whichever
+encoder produced it; orjson writes it compactly and without \\u escapes.
+"""
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+AVAILABLE = orjson is not None
+ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS if AVAILABLE else 0
+
+# Switched off by voting.py when JSON_FAST=0
+enabled = True
+
+
+def _default(obj):
+    return DefaultJSONProvider.default(obj)
+
+
+def dumps_bytes(obj):
+    if enabled and AVAILABLE:
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, default=_default, sort_keys=True).encode('utf8')
+
+
+def dumps(obj):
+    if enabled and AVAILABLE:
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS).decode('utf8')
+    return json.dumps(obj, default=_default, sort_keys=True)
+
+
+def encoder_name():
+    return 'orjson' if enabled and AVAILABLE else 'json'
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes through `dumps_bytes`."""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs or not (enabled and AVAILABLE):
+            return super().dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps(obj) + '\n', mimetype=self.mimetype)
+
+
+# ========== COLUMNAR RESULTS ==========
+def columnar(rows, columns=None):
+    """Rows (dicts or sqlite3.Row) as parallel arrays, one per column.
+
+    {"count": n, "columns": ["id", ...], "values": [[id, ...], [name, ...]]}
+    Tuples and sqlite3.Row results are transposed in one pass; `columns`
+    then names their positions (by default the Row's SELECT order).
+    """
+    if rows and not isinstance(rows[0], dict):
+        columns = list(columns) if columns is not None else list(rows[0].keys())
+        return {'count': len(rows), 'columns': columns, 'values': [list(c) for c in zip(*rows)]}
+    if columns is None:
+        columns = list(rows[0]) if rows else []
+    return {'count': len(rows), 'columns': list(columns), 'values': [[row[name] for row in rows] for name in columns]}
@@ -0,0 +1,358 @@
+"""
+REQUEST METRICS & PROFILING
+File: metrics.py
+Used by: voting.py (GET /api/metrics, /api/admin/profiler), db_pool.py
+
+Per-endpoint latency histograms, SQL query counts and time, time spent
+serializing JSON and time spent waiting for database locks (pool checkout,
+group-commit queue, writer lock), exported in Prometheus text format.
+Queries are timed by a sqlite3.Connection subclass that the pool uses when
+metrics are enabled. An opt-in sampling profiler aggregates the stacks of
+all threads at a fixed interval.
+"""
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from flask import request
+
+import db_pool
+
+
+# Latency buckets in seconds (Prometheus `le` bounds)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_local = threading.local()
+
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(BUCKETS) and value > BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = BUCKETS[index - 1] if index > 0 else 0.0
+                upper = BUCKETS[index] if index < len(BUCKETS) else BUCKETS[-1] * 2
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return BUCKETS[-1]
+
+
+class EndpointStats:
+    __slots__ = ('latency', 'queries', 'sql_seconds', 'json_seconds', 'lock_wait_seconds', 'statuses')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.json_seconds = 0.0
+        self.lock_wait_seconds = 0.0
+        self.statuses = Counter()
+
+
+class RequestStats:
+    __slots__ = ('started', 'queries', 'sql_seconds', 'json_seconds', 'lock_wait_seconds')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.json_seconds = 0.0
+        self.lock_wait_seconds = 0.0
+
+
+class Metrics:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self.endpoints = {}
+        self.background = EndpointStats()
+        self.counters = Counter()
+
+    # ========== RECORDING ==========
+    def record_query(self, seconds):
+        stats = getattr(_local, 'request', None)
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_seconds += seconds
+        else:
+            with self._lock:
+                self.background.queries += 1
+                self.background.sql_seconds += seconds
+
+    def record_lock_wait(self, seconds):
+        if not self.enabled:
+            return
+        stats = getattr(_local, 'request', None)
+        if stats is not None:
+            stats.lock_wait_seconds += seconds
+        else:
+            with self._lock:
+                self.background.lock_wait_seconds += seconds
+
+    def record_json(self, seconds):
+        stats = getattr(_local, 'request', None)
+        if stats is not None:
+            stats.json_seconds += seconds
+
+    def increment(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] += amount
+
+    def start_request(self):
+        if self.enabled:
+            _local.request = RequestStats()
+
+    def finish_request(self, endpoint, status):
+        stats = getattr(_local, 'request', None)
+        if stats is None:
+            return
+        _local.request = None
+        elapsed = time.perf_counter() - stats.started
+        with self._lock:
+            entry = self.endpoints.get(endpoint)
+            if entry is None:
+                entry = self.endpoints[endpoint] = EndpointStats()
+            entry.latency.observe(elapsed)
+            entry.queries += stats.queries
+            entry.sql_seconds += stats.sql_seconds
+            entry.json_seconds += stats.json_seconds
+            entry.lock_wait_seconds += stats.lock_wait_seconds
+            entry.statuses[status] += 1
+
+    # ========== FLASK INTEGRATION ==========
+    def init_app(self, app):
+        """Wrap every route and every new pooled connection.
+
+        Does nothing when disabled, so the request path and connections stay
+        uninstrumented.
+        """
+        if not self.enabled:
+            return
+        metrics = self
+        db_pool.CONNECTION_FACTORY = InstrumentedConnection
+        db_pool.WAIT_OBSERVER = self.record_lock_wait
+
+        class TimedJSONProvider(type(app.json)):
+            def dumps(self, obj, **kwargs):
+                if getattr(_local, 'request', None) is None:
+                    return super().dumps(obj, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return super().dumps(obj, **kwargs)
+                finally:
+                    metrics.record_json(time.perf_counter() - started)
+
+        app.json = TimedJSONProvider(app)
+
+        @app.before_request
+        def _metrics_start():
+            metrics.start_request()
+
+        @app.after_request
+        def _metrics_finish(response):
+            if getattr(_local, 'request', None) is not None:
+                rule = request.url_rule.rule if request.url_rule else 'unmatched'
+                metrics.finish_request(f'{request.method} {rule}', response.status_code)
+            return response
+
+    # ========== EXPORT ==========
+    def summary(self):
+        with self._lock:
+            endpoints = {}
+            for name, entry in self.endpoints.items():
+                count = entry.latency.count
+                endpoints[name] = {
+                    'requests': count,
+                    'p50_ms': round(entry.latency.quantile(0.50) * 1000, 3),
+                    'p95_ms': round(entry.latency.quantile(0.95) * 1000, 3),
+                    'p99_ms': round(entry.latency.quantile(0.99) * 1000, 3),
+                    'queries_per_request': round(entry.queries / count, 2) if count else 0,
+                    'sql_ms_per_request': round(entry.sql_seconds / count * 1000, 3) if count else 0,
+                    'json_ms_per_request': round(entry.json_seconds / count * 1000, 3) if count else 0,
+                    'lock_wait_ms_per_request': round(entry.lock_wait_seconds / count * 1000, 3) if count else 0
+                }
+            return endpoints
+
+    def prometheus(self, extra_gauges=None):
+        lines = []
+
+        def metric(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+
+            metric('voting_request_duration_seconds', 'histogram', 'Request latency by endpoint')
+            for name, entry in endpoints:
+                label = _label(name)
+                cumulative = 0
+                for bound, count in zip(BUCKETS, entry.latency.counts):
+                    cumulative += count
+                    lines.append(f'voting_request_duration_seconds_bucket{{endpoint="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'voting_request_duration_seconds_bucket{{endpoint="{label}",le="+Inf"}} {entry.latency.count}')
+                lines.append(f'voting_request_duration_seconds_sum{{endpoint="{label}"}} {entry.latency.total:.6f}')
+                lines.append(f'voting_request_duration_seconds_count{{endpoint="{label}"}} {entry.latency.count}')
+
+            metric('voting_request_duration_quantile_seconds', 'gauge', 'Estimated latency quantiles by endpoint')
+            for name, entry in endpoints:
+                for q in (0.5, 0.95, 0.99):
+                    lines.append(f'voting_request_duration_quantile_seconds{{endpoint="{_label(name)}",quantile="{q}"}} {entry.latency.quantile(q):.6f}')
+
+            metric('voting_responses_total', 'counter', 'Responses by endpoint and status')
+            for name, entry in endpoints:
+                for status, count in sorted(entry.statuses.items()):
+                    lines.append(f'voting_responses_total{{endpoint="{_label(name)}",status="{status}"}} {count}')
+
+            rows = endpoints + [('background', self.background)]
+            for key, attr, kind, help_text in (
+                ('voting_sql_queries_total', 'queries', 'counter', 'SQL statements executed'),
+                ('voting_sql_seconds_total', 'sql_seconds', 'counter', 'Time spent in SQLite'),
+                ('voting_json_seconds_total', 'json_seconds', 'counter', 'Time spent serializing JSON'),
+                ('voting_lock_wait_seconds_total', 'lock_wait_seconds', 'counter', 'Time spent waiting for connections and write locks')
+            ):
+                metric(key, kind, help_text)
+                for name, entry in rows:
+                    value = getattr(entry, attr)
+                    lines.append(f'{key}{{endpoint="{_label(name)}"}} {value:.6f}' if isinstance(value, float) else f'{key}{{endpoint="{_label(name)}"}} {value}')
+
+            metric('voting_events_total', 'counter', 'Application event counters')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f'voting_events_total{{event="{_label(name)}"}} {value}')
+
+        metric('voting_uptime_seconds', 'gauge', 'Seconds since the process started')
+        lines.append(f'voting_uptime_seconds {time.time() - self.started_at:.1f}')
+        for name, (value, help_text) in (extra_gauges or {}).items():
+            metric(name, 'gauge', help_text)
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+# ========== SQL TIMING ==========
+metrics = Metrics()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    def execute(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            metrics.record_query(time.perf_counter() - started)
+
+    def executemany(self, *args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            metrics.record_query(time.perf_counter() - started)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+
+# ========== SAMPLING PROFILER ==========
+class SamplingProfiler:
+    """Samples every thread's stack at `interval` seconds while running.
+
+    Stacks are kept in collapsed form (`outer;inner;leaf count`, as used by
+    flame graph tools), capped at `max_stacks` distinct entries.
+    """
+
+    def __init__(self, interval=0.005, max_stacks=5000):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.samples = Counter()
+        self.total = 0
+        self.dropped = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None):
+        if interval:
+            self.interval = interval
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def reset(self):
+        self.samples = Counter()
+        self.total = 0
+        self.dropped = 0
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = ';'.join(
+                    f'{entry.name} ({entry.filename.rsplit("/", 1)[-1]}:{entry.lineno})'
+                    for entry in traceback.extract_stack(frame, limit=40)
+                )
+                if stack in self.samples or len(self.samples) < self.max_stacks:
+                    self.samples[stack] += 1
+                else:
+                    self.dropped += 1
+                self.total += 1
+
+    def report(self, top=50):
+        return {
+            'running': self.running,
+            'interval_ms': self.interval * 1000,
+            'samples': self.total,
+            'dropped': self.dropped,
+            'top': [{'stack': stack, 'samples': count} for stack, count in self.samples.most_common(top)]
+        }
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.items())
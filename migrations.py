@@ -0,0 +1,265 @@
+"""
+SCHEMA MIGRATIONS & QUERY PLAN AUDIT
+File: migrations.py
+Used by: voting.py (init_db), shards.py
+Run: python migrations.py upgrade [--database voting.db]
+     python migrations.py status [--database voting.db]
+     python migrations.py audit [--database voting.db]
+
+The schema version is kept in `PRAGMA user_version`. Each migration runs in
+its own transaction together with the version bump, so an existing
+voting.db is brought up to date in place without touching its rows.
+`audit` runs EXPLAIN QUERY PLAN on every hot query and exits non-zero if
+one of them scans a large table without an index or sorts in a temp
+B-tree (benchmarks/check_query_plans.py runs it on fresh databases).
+"""
+import argparse
+import re
+import sqlite3
+import sys
+
+import integrity
+import ranked
+import stats_rollup
+import voter_search
+from image_store import IMAGE_SCHEMA
+from tally import CHECKPOINT_SCHEMA
+
+
+BASELINE_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS candidates (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        party TEXT NOT NULL,
+        bio TEXT,
+        color TEXT,
+        votes INTEGER DEFAULT 0,
+        avatar TEXT,
+        image_url TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS voters (
+        id TEXT PRIMARY KEY,
+        name TEXT,
+        email TEXT,
+        has_voted BOOLEAN DEFAULT 0,
+        vote_time TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS admin (
+        username TEXT PRIMARY KEY,
+        password TEXT,
+        email TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS votes_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        voter_id TEXT,
+        candidate_id INTEGER,
+        vote_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    '''
+]
+
+# Shared with the shard files, which hold their own voters and votes_log.
+#  - the voted-set load and voted counts walk only the voted voters, from a
+#    partial index that covers both columns they touch
+#  - per-voter and per-candidate log lookups (audits, integrity checks)
+# Status checks already hit the primary key index of voters.
+VOTER_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_voters_voted ON voters (id, has_voted) WHERE has_voted = 1',
+    'CREATE INDEX IF NOT EXISTS idx_votes_log_voter ON votes_log (voter_id)',
+    'CREATE INDEX IF NOT EXISTS idx_votes_log_candidate ON votes_log (candidate_id, vote_time)'
+]
+
+
+def _rebuild_rollups(cursor):
+    stats_rollup.rebuild(cursor)
+
+
+# (version, description, steps); a step is SQL text or a callable(cursor)
+MIGRATIONS = [
+    (1, 'baseline tables', BASELINE_SCHEMA),
+    (2, 'vote rollups and tally checkpoint', stats_rollup.ROLLUP_SCHEMA + [CHECKPOINT_SCHEMA, _rebuild_rollups]),
+    (3, 'indexes for voted-set load and vote log lookups', VOTER_INDEXES),
+    (4, 'candidate image cache', [IMAGE_SCHEMA]),
+    (5, 'voter search index and vote time index', [voter_search.VOTE_TIME_INDEX, voter_search.ensure_index]),
+    (6, 'ranked ballots', [ranked.RANKED_SCHEMA]),
+    (7, 'integrity verifier state', [integrity.record_baseline])
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def restore_voter_objects(conn):
+    """Recreate voter indexes and search triggers a bulk import dropped and
+    never put back (the process died mid-import); returns True if any were missing."""
+    names = ('idx_voters_voted', 'idx_voters_vote_time') + voter_search.TRIGGERS
+    present = conn.execute(
+        f"SELECT COUNT(*) FROM sqlite_master WHERE name IN ({', '.join('?' * len(names))})", names
+    ).fetchone()[0]
+    if present == len(names):
+        return False
+    conn.execute(VOTER_INDEXES[0])
+    conn.execute(voter_search.VOTE_TIME_INDEX)
+    voter_search.ensure_index(conn)
+    voter_search.rebuild(conn)
+    conn.commit()
+    return True
+
+
+def current_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn, target=LATEST_VERSION):
+    """Apply pending migrations up to `target`; returns the versions applied."""
+    if conn.in_transaction:
+        conn.commit()
+    applied = []
+    for version, _, steps in MIGRATIONS:
+        if version <= current_version(conn) or version > target:
+            continue
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            for step in steps:
+                if callable(step):
+                    step(cursor)
+                else:
+                    cursor.execute(step)
+            cursor.execute(f'PRAGMA user_version = {version}')
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+        applied.append(version)
+    return applied
+
+
+# ========== QUERY PLAN AUDIT ==========
+# (name, sql, params) for every query on a request or startup path
+HOT_QUERIES = [
+    ('voter status', 'SELECT has_voted FROM voters WHERE id = ?', ('VOTER001',)),
+    ('voter record', 'SELECT * FROM voters WHERE id = ?', ('VOTER001',)),
+    ('voted-set load', 'SELECT id FROM voters WHERE has_voted = 1', ()),
+    ('voted count', 'SELECT COUNT(*) FROM voters WHERE has_voted = 1', ()),
+    ('voter count', 'SELECT COUNT(*) FROM voters', ()),
+    ('mark voted', 'UPDATE voters SET has_voted = 1, vote_time = ? WHERE id = ? AND has_voted = 0', ('', 'VOTER001')),
+    ('voter page', 'SELECT id, name, email, has_voted, vote_time FROM voters WHERE id > ? ORDER BY id LIMIT ?', ('', 1000)),
+    ('voted voter page', f'SELECT {voter_search.COLUMNS} FROM voters WHERE voters.id > ? AND voters.has_voted = 1 '
+     'ORDER BY voters.id LIMIT ?', ('', 100)),
+    ('voters by vote time', f'SELECT {voter_search.COLUMNS} FROM voters WHERE voters.id > ? AND voters.has_voted = 1 '
+     'AND voters.vote_time >= ? AND voters.vote_time < ? ORDER BY voters.id LIMIT ?', ('', '', '', 100)),
+    ('voter search', f'SELECT voters_fts.rowid, {voter_search.COLUMNS} FROM voters_fts CROSS JOIN voters '
+     'ON voters.rowid = voters_fts.rowid WHERE voters_fts MATCH ? AND voters_fts.rowid > ? '
+     'ORDER BY voters_fts.rowid LIMIT ?', ('"jam"*', 0, 100)),
+    ('search cursor', 'SELECT rowid FROM voters WHERE id = ?', ('VOTER001',)),
+    ('candidate lookup', 'SELECT id FROM candidates WHERE id = ?', (1,)),
+    ('candidate increment', 'UPDATE candidates SET votes = votes + ? WHERE id = ?', (1, 1)),
+    ('tally replay', 'SELECT candidate_id, COUNT(*) AS votes FROM votes_log WHERE id > ? GROUP BY +candidate_id', (0,)),
+    ('log high-water mark', 'SELECT COALESCE(MAX(id), 0) FROM votes_log', ()),
+    ('votes by voter', 'SELECT candidate_id, vote_time FROM votes_log WHERE voter_id = ?', ('VOTER001',)),
+    ('votes by candidate', 'SELECT COUNT(*) FROM votes_log WHERE candidate_id = ?', (1,)),
+    ('ranked ballot load', 'SELECT ranking FROM ranked_ballots WHERE id > ? AND id <= ? ORDER BY id', (0, 0)),
+    ('ranked ballot bounds', ranked.BOUNDS_QUERY, ()),
+    ('integrity log chunk', integrity.LOG_CHUNK_QUERY, (0, 2000)),
+    ('integrity voter sweep', integrity.VOTER_SWEEP_QUERY, ('', 2000)),
+    ('oldest unverified vote', integrity.NEXT_UNVERIFIED_QUERY, (0,)),
+    ('candidate image', 'SELECT * FROM candidate_images WHERE candidate_id = ?', (1,)),
+    ('admin login', 'SELECT * FROM admin WHERE username = ?', ('admin',)),
+    ('timeline', 'SELECT day AS date, votes FROM votes_by_day ORDER BY day DESC LIMIT ?', (7,))
+]
+
+# Tables that are read whole on purpose: one row per candidate / day / hour.
+SMALL_TABLES = {'candidates', 'votes_by_day', 'votes_by_hour', 'tally_checkpoint'}
+
+# Queries that must visit every row (counting the whole electorate); they
+# pass as long as they read an index instead of the table.
+FULL_SCAN_OK = {'voter count'}
+
+# Queries whose temp B-tree stays small: the tally replay groups the rows
+# past the checkpoint into one entry per candidate, and a vote time range
+# is narrowed by its partial index before it is sorted by id.
+TEMP_BTREE_OK = {'tally replay', 'voters by vote time'}
+
+SCAN = re.compile(r'\bSCAN (?:TABLE )?(\w+)(?: USING (COVERING )?INDEX (\w+))?')
+
+
+def _partial_indexes(conn):
+    return {name for name, sql in conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index'")
+            if sql and ' WHERE ' in sql.upper()}
+
+
+def audit(conn, queries=HOT_QUERIES):
+    """Return [(name, plan_lines, offending_tables)] for every query.
+
+    A SCAN of a large table is a failure unless it walks a partial index
+    (which only holds the rows the query wants) or the query is listed in
+    FULL_SCAN_OK and reads an index. Virtual tables (the FTS5 voter index)
+    report their lookups as SCAN ... VIRTUAL TABLE and are not flagged, nor
+    is the SCAN CONSTANT ROW of a SELECT made only of scalar subqueries.
+    A USE TEMP B-TREE step is a failure unless the query is listed in
+    TEMP_BTREE_OK; it is reported as 'temp b-tree'.
+    """
+    partial = _partial_indexes(conn)
+    report = []
+    for name, sql, params in queries:
+        plan = [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+        offending = []
+        for line in plan:
+            if 'USE TEMP B-TREE' in line:
+                if name not in TEMP_BTREE_OK:
+                    offending.append('temp b-tree')
+                continue
+            match = SCAN.search(line)
+            if not match or match.group(1) in SMALL_TABLES or 'VIRTUAL TABLE' in line \
+                    or 'CONSTANT ROW' in line:
+                continue
+            table, index = match.group(1), match.group(3)
+            if index in partial or (name in FULL_SCAN_OK and index):
+                continue
+            offending.append(table)
+        report.append((name, plan, offending))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage the voting database schema')
+    parser.add_argument('command', choices=['upgrade', 'status', 'audit'])
+    parser.add_argument('--database', default='voting.db')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    try:
+        if args.command == 'upgrade':
+            applied = migrate(conn)
+            print(f"✅ Schema at version {current_version(conn)}"
+                  + (f" (applied {', '.join(map(str, applied))})" if applied else ' (already current)'))
+        elif args.command == 'status':
+            version = current_version(conn)
+            for number, description, _ in MIGRATIONS:
+                print(f"{'✅' if number <= version else '⏳'} {number}: {description}")
+        else:
+            if current_version(conn) < LATEST_VERSION:
+                print(f'⚠️  Schema is at version {current_version(conn)}; run upgrade first')
+                sys.exit(1)
+            failures = 0
+            for name, plan, offending in audit(conn):
+                print(f"{'❌' if offending else '✅'} {name}")
+                for line in plan:
+                    print(f'     {line}')
+                failures += bool(offending)
+            if failures:
+                print(f'❌ {failures} hot queries scan a large table without an index or sort in a temp B-tree')
+                sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+"""
+RANKED-CHOICE BALLOTS & RUNOFF TABULATION
+File: ranked.py
+Used by: voting.py (POST /api/vote with `ranking`, GET /api/results?method=irv|stv),
+         vote_batcher.py (stores the ballots with their vote)
+
+A ranked ballot is stored in ranked_ballots as a fixed-width array of
+little-endian uint16 candidate ids, zero-padded to `width` slots. Each
+ballot is committed in the same transaction as the voter's vote, whose
+candidate is the first preference, so plurality results count first
+preferences. BallotBox keeps all ballots of a database, and of its shards,
+in one contiguous buffer. It loads them incrementally by ballot id.
+
+Tabulation never loops over ballots in Python. The buffer is mapped to
+dense candidate indices, and identical rankings are merged into weighted
+patterns. Each round then counts first continuing preferences with one
+bincount and moves only the ballots of the eliminated or elected candidate
+to their next continuing preference. This is done with NumPy when it is
+installed, or in pure Python over the merged patterns otherwise.
+
+Methods:
+  irv  one winner; the leader wins once they hold more than half of the
+       continuing ballots, otherwise the last candidate is eliminated
+  stv  `seats` winners, Droop quota, fractional (Gregory) surplus transfer;
+       one candidate is elected or eliminated per round
+Ties for last place eliminate the higher candidate id, and ties for
+election favour the lower id.
+"""
+import struct
+import threading
+import time
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RANKED_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS ranked_ballots (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        voter_id TEXT NOT NULL,
+        ranking BLOB NOT NULL
+    )
+'''
+
+# MIN(id), MAX(id) in one SELECT would scan the table; each subquery seeks
+BOUNDS_QUERY = 'SELECT (SELECT MIN(id) FROM ranked_ballots), (SELECT MAX(id) FROM ranked_ballots)'
+
+METHODS = ('irv', 'stv')
+MAX_CANDIDATE_ID = 0xFFFF
+# Float tolerance for fractional STV counts
+EPSILON = 1e-9
+
+
+class RankingError(ValueError):
+    pass
+
+
+def encode(ranking, width):
+    """[3, 1, 5] -> fixed-width uint16 blob; raises RankingError."""
+    if not isinstance(ranking, list) or not ranking:
+        raise RankingError('ranking must be a non-empty list of candidate ids')
+    if len(ranking) > width:
+        raise RankingError(f'A ballot can rank at most {width} candidates')
+    for candidate_id in ranking:
+        if type(candidate_id) is not int or not 0 < candidate_id <= MAX_CANDIDATE_ID:
+            raise RankingError(f'Invalid candidate id in ranking: {candidate_id!r}')
+    if len(set(ranking)) != len(ranking):
+        raise RankingError('A candidate can only be ranked once')
+    return struct.pack(f'<{width}H', *ranking, *[0] * (width - len(ranking)))
+
+
+def decode(blob):
+    return [candidate_id for candidate_id in struct.unpack(f'<{len(blob) // 2}H', blob) if candidate_id]
+
+
+# ========== BALLOT STORAGE ==========
+class BallotBox:
+    """Every ranked ballot of one election as a single fixed-width buffer."""
+
+    def __init__(self, width):
+        self.width = width
+        self.data = bytearray()
+        self._marks = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.data) // (2 * self.width)
+
+    def _widen(self, width):
+        old = 2 * self.width
+        self.data = bytearray(b''.join(bytes(self.data[i:i + old]).ljust(2 * width, b'\0')
+                                       for i in range(0, len(self.data), old)))
+        self.width = width
+
+    def _append(self, blobs):
+        size = 2 * self.width
+        for blob in blobs:
+            if len(blob) > size:
+                # Ballots stored under a larger RANKED_MAX_RANKS
+                self._widen(len(blob) // 2)
+                size = 2 * self.width
+            self.data += blob if len(blob) == size else blob.ljust(size, b'\0')
+
+    def refresh(self, connections):
+        """Load ballots added since the last refresh from each connection
+        factory (one per shard); reload everything after a reset."""
+        with self._lock:
+            bounds = []
+            for connection in connections:
+                with connection() as conn:
+                    bounds.append(tuple(conn.execute(BOUNDS_QUERY).fetchone()))
+            # A reset deletes every ballot; ids are never reused after it
+            if self._marks is None or any(first != mark[0] and mark[0] is not None
+                                          for (first, _), mark in zip(bounds, self._marks)):
+                self.data = bytearray()
+                self._marks = [(None, 0)] * len(connections)
+            marks = []
+            for connection, (first, last), (mark_first, mark_last) in zip(connections, bounds, self._marks):
+                if last is not None and last > mark_last:
+                    with connection() as conn:
+                        cursor = conn.execute('SELECT ranking FROM ranked_ballots WHERE id > ? AND id <= ? ORDER BY id',
+                                              (mark_last, last))
+                        while True:
+                            rows = cursor.fetchmany(100_000)
+                            if not rows:
+                                break
+                            self._append(row[0] for row in rows)
+                marks.append((mark_first if mark_first is not None else first, max(last or 0, mark_last)))
+            self._marks = marks
+            return len(self)
+
+    def snapshot(self):
+        with self._lock:
+            return bytes(self.data), self.width
+
+
+# ========== TABULATION ==========
+def _patterns_numpy(data, width, candidate_ids):
+    """Merge identical ballots: (dense pattern matrix, weights); index len(candidate_ids) means no choice."""
+    count = len(candidate_ids)
+    raw = np.frombuffer(data, dtype='<u2').reshape(-1, width)
+    dtype = np.uint8 if count < 255 else np.uint16
+    index = np.full(MAX_CANDIDATE_ID + 1, count, dtype=dtype)
+    index[np.asarray(candidate_ids, dtype=np.int64)] = np.arange(count, dtype=dtype)
+    row_bytes = width * np.dtype(dtype).itemsize
+    if row_bytes > 8:
+        return index[raw], np.ones(len(raw))
+    # Rows padded to 8 bytes sort and compare as one uint64 each
+    padded = np.full((len(raw), 8 // np.dtype(dtype).itemsize), count, dtype=dtype)
+    padded[:, :width] = index[raw]
+    keys, weights = np.unique(padded.view(np.uint64).ravel(), return_counts=True)
+    return keys.view(dtype).reshape(-1, padded.shape[1])[:, :width], weights.astype(np.float64)
+
+
+def _patterns_python(data, width, candidate_ids):
+    count = len(candidate_ids)
+    index = {candidate_id: i for i, candidate_id in enumerate(candidate_ids)}
+    size = 2 * width
+    grouped = Counter(data[i:i + size] for i in range(0, len(data), size))
+    patterns = [[index.get(c, count) for c in struct.unpack(f'<{width}H', blob)] for blob in grouped]
+    return patterns, [float(n) for n in grouped.values()]
+
+
+class _NumpyCount:
+    def __init__(self, patterns, weights, count):
+        self.patterns, self.weights, self.count = patterns, weights, count
+        self.width = patterns.shape[1]
+        self.pos = np.zeros(len(patterns), dtype=np.int64)
+        self.current = patterns[:, 0].astype(np.int64) if len(patterns) else np.zeros(0, dtype=np.int64)
+
+    def totals(self):
+        return np.bincount(self.current, weights=self.weights, minlength=self.count + 1)
+
+    def transfer(self, candidate, factor, stops):
+        """Move ballots on `candidate` to their next preference in `stops`
+        (continuing candidates plus the no-choice index), scaling their weight."""
+        moving = np.nonzero(self.current == candidate)[0]
+        if factor != 1:
+            self.weights[moving] *= factor
+        while moving.size:
+            self.pos[moving] += 1
+            done = self.pos[moving] >= self.width
+            choice = self.patterns[moving, np.minimum(self.pos[moving], self.width - 1)].astype(np.int64)
+            choice[done] = self.count
+            self.current[moving] = choice
+            moving = moving[~stops[choice]]
+
+
+class _PythonCount:
+    def __init__(self, patterns, weights, count):
+        self.patterns, self.weights, self.count = patterns, weights, count
+        self.pos = [0] * len(patterns)
+        self.current = [pattern[0] for pattern in patterns]
+
+    def totals(self):
+        totals = [0.0] * (self.count + 1)
+        for choice, weight in zip(self.current, self.weights):
+            totals[choice] += weight
+        return totals
+
+    def transfer(self, candidate, factor, stops):
+        for i, choice in enumerate(self.current):
+            if choice != candidate:
+                continue
+            self.weights[i] *= factor
+            pattern, pos = self.patterns[i], self.pos[i]
+            while True:
+                pos += 1
+                choice = pattern[pos] if pos < len(pattern) else self.count
+                if stops[choice]:
+                    break
+            self.pos[i], self.current[i] = pos, choice
+
+
+def tabulate(data, width, candidate_ids, method='irv', seats=1, engine=None):
+    """Run the rounds over a ballot buffer; returns the round-by-round report.
+
+    Vote counts in the report are keyed by candidate id.
+    """
+    if method not in METHODS:
+        raise RankingError(f'Unknown method: {method}')
+    seats = 1 if method == 'irv' else seats
+    candidate_ids = sorted(candidate_ids)
+    count = len(candidate_ids)
+    if seats < 1 or seats > count:
+        raise RankingError(f'seats must be between 1 and {count}')
+    engine = engine or ('numpy' if np is not None else 'python')
+    started = time.perf_counter()
+    if engine == 'numpy':
+        counter = _NumpyCount(*_patterns_numpy(data, width, candidate_ids), count)
+        stops = np.ones(count + 1, dtype=bool)
+    else:
+        counter = _PythonCount(*_patterns_python(data, width, candidate_ids), count)
+        stops = [True] * (count + 1)
+
+    continuing = set(range(count))
+    elected, rounds = [], []
+    totals = [float(v) for v in counter.totals()]
+    valid = sum(totals[:count])
+    quota = int(valid // (seats + 1)) + 1 if method == 'stv' else None
+
+    # No ballots elect nobody
+    while len(elected) < seats and continuing and valid > 0:
+        round_info = {
+            'round': len(rounds) + 1,
+            'votes': {candidate_ids[i]: round(totals[i], 6) for i in sorted(continuing)},
+            'exhausted': round(totals[count], 6),
+            'elected': [],
+            'eliminated': None
+        }
+        rounds.append(round_info)
+        by_votes = sorted(continuing, key=lambda i: (-totals[i], i))
+
+        if len(continuing) <= seats - len(elected):
+            # Every remaining candidate fills a remaining seat
+            round_info['elected'] = [candidate_ids[i] for i in by_votes]
+            elected.extend(by_votes)
+            break
+
+        leader = by_votes[0]
+        if method == 'irv':
+            wins = totals[leader] * 2 > sum(totals[i] for i in continuing) + EPSILON or len(continuing) == 1
+        else:
+            wins = totals[leader] >= quota - EPSILON
+        if wins:
+            round_info['elected'] = [candidate_ids[leader]]
+            elected.append(leader)
+            continuing.discard(leader)
+            if method == 'irv':
+                break
+            stops[leader] = False
+            surplus = totals[leader] - quota
+            round_info['surplus'] = round(surplus, 6)
+            counter.transfer(leader, surplus / totals[leader] if totals[leader] else 0.0, stops)
+        else:
+            lowest = min(totals[i] for i in continuing)
+            loser = max(i for i in continuing if totals[i] <= lowest + EPSILON)
+            round_info['eliminated'] = candidate_ids[loser]
+            continuing.discard(loser)
+            stops[loser] = False
+            counter.transfer(loser, 1.0, stops)
+        totals = [float(v) for v in counter.totals()]
+
+    return {
+        'method': method,
+        'seats': seats,
+        'ballots': len(data) // (2 * width),
+        'quota': quota,
+        'elected': [candidate_ids[i] for i in elected],
+        'rounds': rounds,
+        'engine': engine,
+        'seconds': round(time.perf_counter() - started, 4)
+    }
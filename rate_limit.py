@@ -0,0 +1,140 @@
+"""
+TOKEN-BUCKET RATE LIMITER
+File: rate_limit.py
+Used by: voting.py (POST /api/vote, GET /api/voter/<id>, POST /api/admin/login)
+
+Each route has limits per key kind (client IP, voter_id), written as
+"<requests>/<seconds>" with an optional ":<burst>" (default: the request
+count). Buckets live in one LRU-ordered dict per limiter; when it holds
+max_keys buckets the least recently used one is dropped, which at worst
+forgets a partly drained bucket of an idle client. Checks run before the
+view, so rejected requests never reach the database.
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import wraps
+
+from flask import jsonify, make_response, request
+
+
+class RateLimitConfigError(ValueError):
+    pass
+
+
+def parse_limit(text):
+    """'30/1' or '30/1:60' -> (tokens per second, burst)."""
+    try:
+        spec, _, burst = text.partition(':')
+        count, _, seconds = spec.partition('/')
+        count, seconds = float(count), float(seconds or 1)
+        burst = float(burst) if burst else count
+    except ValueError:
+        raise RateLimitConfigError(f'Invalid rate limit: {text!r}')
+    if count <= 0 or seconds <= 0 or burst < 1:
+        raise RateLimitConfigError(f'Invalid rate limit: {text!r}')
+    return count / seconds, burst
+
+
+def parse_limits(text):
+    """'vote.ip=30/1,vote.voter=5/60' -> {('vote', 'ip'): (rate, burst), ...}
+
+    A limit of 0 removes it, so one entry can switch off a default.
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        name, _, value = item.partition('=')
+        route, _, kind = name.strip().partition('.')
+        if not route or not kind or not value:
+            raise RateLimitConfigError(f'Invalid rate limit entry: {item!r}')
+        limits[(route, kind)] = None if value.strip() == '0' else parse_limit(value.strip())
+    return {key: limit for key, limit in limits.items() if limit is not None}
+
+
+class RateLimiter:
+    def __init__(self, limits, max_keys=100_000, enabled=True, on_reject=None):
+        self.limits = dict(limits)
+        self.max_keys = max_keys
+        self.enabled = enabled
+        self.on_reject = on_reject
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.rejected = Counter()
+        self.evictions = 0
+
+    def check(self, route, kind, key, now=None):
+        """Take one token; returns 0 when allowed, else seconds until one is free."""
+        limit = self.limits.get((route, kind))
+        if limit is None or key is None:
+            return 0
+        rate, burst = limit
+        now = time.monotonic() if now is None else now
+        bucket_key = (route, kind, key)
+        with self._lock:
+            bucket = self._buckets.get(bucket_key)
+            if bucket is None:
+                bucket = self._buckets[bucket_key] = [burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+                    self.evictions += 1
+            else:
+                self._buckets.move_to_end(bucket_key)
+                bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                self.allowed += 1
+                return 0
+            self.rejected[f'{route}.{kind}'] += 1
+            return (1 - bucket[0]) / rate
+
+    def limit(self, route, **key_functions):
+        """Decorator: check every `kind=key_function()` limit of `route` first."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.enabled:
+                    for kind, key_function in key_functions.items():
+                        retry_after = self.check(route, kind, key_function())
+                        if retry_after:
+                            if self.on_reject is not None:
+                                self.on_reject(route, kind)
+                            response = make_response(jsonify({'error': 'Too many requests, please retry later'}), 429)
+                            response.headers['Retry-After'] = str(max(1, round(retry_after)))
+                            return response
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def stats(self):
+        with self._lock:
+            buckets = len(self._buckets)
+            rejected = dict(self.rejected)
+        return {
+            'enabled': self.enabled,
+            'limits': {f'{route}.{kind}': {'per_second': round(rate, 4), 'burst': burst}
+                       for (route, kind), (rate, burst) in sorted(self.limits.items())},
+            'buckets': buckets,
+            'max_buckets': self.max_keys,
+            'evictions': self.evictions,
+            'allowed': self.allowed,
+            'rejected': rejected
+        }
+
+
+def client_ip():
+    return request.remote_addr
+
+
+def json_field(name):
+    """Key function reading `name` from the JSON body (parsed once by Flask)."""
+    def key():
+        data = request.get_json(silent=True)
+        value = data.get(name) if isinstance(data, dict) else None
+        return str(value) if value else None
+    return key
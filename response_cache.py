@@ -0,0 +1,83 @@
+"""
+VERSIONED RESPONSE CACHE
+File: response_cache.py
+Used by: voting.py (read-only GET endpoints)
+
+Serialized JSON bodies are cached per URL and tagged with the election
+version (bumped by every vote, candidate addition and reset). Requests
+whose If-None-Match matches the current entry get 304 without running
+the view, everything else within the same version reuses the stored body.
+The `g` attributes named in `context` are stored with the body and set
+again on a hit, so after_request hooks see what the view left there.
+"""
+import hashlib
+import threading
+from functools import wraps
+
+from flask import g, request, make_response
+
+
+class ResponseCache:
+    def __init__(self, version_fn, max_entries=256, context=()):
+        self.version_fn = version_fn
+        self.max_entries = max_entries
+        self.context = context
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def _respond(self, entry):
+        body, etag = entry[1], entry[2]
+        # Weak comparison: compression.py marks the ETag of encoded bodies weak
+        if request.if_none_match.contains_weak(etag):
+            self.not_modified += 1
+            response = make_response('', 304)
+        else:
+            response = make_response(body)
+            response.mimetype = 'application/json'
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def cached(self, view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            version = self.version_fn()
+            key = request.full_path
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                for name, value in entry[3].items():
+                    setattr(g, name, value)
+                return self._respond(entry)
+
+            self.misses += 1
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+
+            body = response.get_data()
+            etag = hashlib.sha1(body).hexdigest()[:20]
+            entry = (version, body, etag, {name: g.get(name) for name in self.context if name in g})
+            with self._lock:
+                if len(self._entries) >= self.max_entries and key not in self._entries:
+                    self._entries.pop(next(iter(self._entries)))
+                self._entries[key] = entry
+            return self._respond(entry)
+        return wrapper
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+            'hit_rate': round(self.hits / lookups * 100, 2) if lookups else 0
+        }
@@ -0,0 +1,164 @@
+"""
+LIVE RESULTS STREAM (SERVER-SENT EVENTS)
+File: results_stream.py
+Used by: voting.py (GET /api/results/stream)
+
+One broadcaster thread watches the tally, coalesces bursts of votes into
+at most `max_rate` updates per second, computes the delta once and fans
+the same serialized event out to every subscriber queue.
+"""
+import asyncio
+import json
+import queue
+import threading
+import time
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: {data}\n\n'
+
+
+class ResultsBroadcaster:
+    def __init__(self, tally, max_rate=4.0, heartbeat=15.0, backlog=32):
+        self.tally = tally
+        self.max_rate = max_rate
+        self.heartbeat = heartbeat
+        self.backlog = backlog
+        self._subscribers = set()
+        self._async_subscribers = set()
+        self._lock = threading.Lock()
+        self._changed = threading.Event()
+        self._thread = None
+        self._last_counts = {}
+        self._last_version = -1
+        self.events_sent = 0
+        tally.subscribe(self._changed.set)
+
+    # ========== SUBSCRIBERS ==========
+    def subscribe(self):
+        """Yield SSE frames: a full snapshot first, then deltas and heartbeats."""
+        self._ensure_started()
+        inbox = queue.Queue(self.backlog)
+        with self._lock:
+            self._subscribers.add(inbox)
+        try:
+            yield format_event('snapshot', json.dumps(self._snapshot_payload(), separators=(',', ':')))
+            while True:
+                try:
+                    yield inbox.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+        finally:
+            with self._lock:
+                self._subscribers.discard(inbox)
+
+    async def subscribe_async(self):
+        """Async variant of `subscribe` for ASGI: no thread per subscriber."""
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        inbox = asyncio.Queue(self.backlog)
+        subscriber = (loop, inbox)
+        with self._lock:
+            self._async_subscribers.add(subscriber)
+        try:
+            yield format_event('snapshot', json.dumps(self._snapshot_payload(), separators=(',', ':')))
+            while True:
+                try:
+                    yield await asyncio.wait_for(inbox.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+        finally:
+            with self._lock:
+                self._async_subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        return len(self._subscribers) + len(self._async_subscribers)
+
+    def _publish(self, frame):
+        with self._lock:
+            subscribers = list(self._subscribers)
+            async_subscribers = list(self._async_subscribers)
+        resync = None
+        for inbox in subscribers:
+            try:
+                inbox.put_nowait(frame)
+            except queue.Full:
+                # Slow reader: drop its backlog and send a fresh snapshot instead
+                resync = resync or format_event('snapshot', json.dumps(self._snapshot_payload(), separators=(',', ':')))
+                try:
+                    while True:
+                        inbox.get_nowait()
+                except queue.Empty:
+                    pass
+                inbox.put_nowait(resync)
+        for loop, inbox in async_subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver_async, inbox, frame)
+            except RuntimeError:
+                # Event loop already closed
+                pass
+        self.events_sent += 1
+
+    def _deliver_async(self, inbox, frame):
+        if inbox.full():
+            while not inbox.empty():
+                inbox.get_nowait()
+            frame = format_event('snapshot', json.dumps(self._snapshot_payload(), separators=(',', ':')))
+        inbox.put_nowait(frame)
+
+    # ========== PAYLOADS ==========
+    @staticmethod
+    def _totals(snapshot):
+        return {
+            'total_votes': snapshot['total_votes'],
+            'total_voters': snapshot['total_voters'],
+            'voted_count': snapshot['voted_count'],
+            'leading_candidate': snapshot['leading_candidate']
+        }
+
+    def _snapshot_payload(self):
+        snapshot = self.tally.snapshot()
+        return {
+            'version': snapshot['version'],
+            'candidates': [[c['id'], c['votes']] for c in snapshot['candidates']],
+            'totals': self._totals(snapshot)
+        }
+
+    def _delta_payload(self):
+        snapshot = self.tally.snapshot()
+        if snapshot['version'] == self._last_version:
+            return None
+        changes = []
+        counts = {}
+        for candidate in snapshot['candidates']:
+            counts[candidate['id']] = candidate['votes']
+            if self._last_counts.get(candidate['id']) != candidate['votes']:
+                changes.append([candidate['id'], candidate['votes']])
+        self._last_counts = counts
+        self._last_version = snapshot['version']
+        return {
+            'version': snapshot['version'],
+            'changes': changes,
+            'totals': self._totals(snapshot)
+        }
+
+    # ========== BROADCAST THREAD ==========
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._delta_payload()
+                self._thread = threading.Thread(target=self._run, name='results-stream', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        interval = 1.0 / self.max_rate
+        while True:
+            self._changed.wait()
+            self._changed.clear()
+            if self._subscribers or self._async_subscribers:
+                delta = self._delta_payload()
+                if delta is not None:
+                    self._publish(format_event('delta', json.dumps(delta, separators=(',', ':'))))
+            time.sleep(interval)
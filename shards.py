@@ -0,0 +1,319 @@
+"""
+PARTITIONED VOTER STORAGE
+File: shards.py
+Used by: voting.py (when SHARD_COUNT > 0)
+Run: python shards.py migrate --database voting.db --shards 4
+
+Voters are hashed by `voters.id` across N SQLite shard files, each with
+its own `voters`, `votes_log`, `ranked_ballots`, rollup tables and a
+`candidate_votes` counter table, so vote writes on different shards never
+share a writer lock. The main database keeps `candidates` (metadata plus a
+baseline count) and `admin`; tallies and statistics are summed across
+shards.
+"""
+import argparse
+import heapq
+import os
+import zlib
+
+import db_pool
+import integrity
+import migrations
+import ranked
+import stats_rollup
+import voter_search
+from vote_batcher import VoteBatcher
+from voter_roll import iter_voter_pages, upsert_chunk
+
+
+SHARD_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS voters (
+        id TEXT PRIMARY KEY,
+        name TEXT,
+        email TEXT,
+        has_voted BOOLEAN DEFAULT 0,
+        vote_time TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS votes_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        voter_id TEXT,
+        candidate_id INTEGER,
+        vote_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS candidate_votes (
+        candidate_id INTEGER PRIMARY KEY,
+        votes INTEGER NOT NULL DEFAULT 0
+    )
+    '''
+] + stats_rollup.ROLLUP_SCHEMA + migrations.VOTER_INDEXES + [voter_search.VOTE_TIME_INDEX, ranked.RANKED_SCHEMA,
+                                                             integrity.INTEGRITY_SCHEMA]
+
+
+def shard_for(voter_id, count):
+    return zlib.crc32(str(voter_id).encode('utf8')) % count
+
+
+def shard_path(database, index):
+    root, ext = os.path.splitext(database)
+    return f'{root}.shard{index}{ext or ".db"}'
+
+
+class ShardSet:
+    def __init__(self, database, count, pool_size=4, profile='durable', pools=None):
+        """`pools` replaces the pooled connections to the shard files; anything
+        with a connection() context manager works (see analytics.py)."""
+        self.database = database
+        self.count = count
+        self.profile = profile
+        self.paths = [shard_path(database, i) for i in range(count)]
+        self.pools = pools or [db_pool.get_pool(path, pool_size, profile) for path in self.paths]
+
+    def shard_for(self, voter_id):
+        return shard_for(voter_id, self.count)
+
+    def pool_for(self, voter_id):
+        return self.pools[self.shard_for(voter_id)]
+
+    def drop_all(self):
+        for pool in self.pools:
+            with pool.connection() as conn:
+                for table in ('voters', 'votes_log', 'candidate_votes', 'votes_by_day', 'votes_by_hour', 'voters_fts',
+                              'ranked_ballots', 'integrity_state'):
+                    conn.execute(f'DROP TABLE IF EXISTS {table}')
+                conn.commit()
+
+    def ensure_schema(self):
+        for pool in self.pools:
+            with pool.connection() as conn:
+                for statement in SHARD_SCHEMA:
+                    conn.execute(statement)
+                voter_search.ensure_index(conn)
+                conn.commit()
+
+    # ========== AGGREGATES ==========
+    def candidate_counts(self):
+        counts = {}
+        for pool in self.pools:
+            with pool.connection() as conn:
+                for candidate_id, votes in conn.execute('SELECT candidate_id, votes FROM candidate_votes'):
+                    counts[candidate_id] = counts.get(candidate_id, 0) + votes
+        return counts
+
+    def voter_counts(self):
+        total = voted = 0
+        for pool in self.pools:
+            with pool.connection() as conn:
+                row = conn.execute('SELECT COUNT(*), COALESCE(SUM(has_voted = 1), 0) FROM voters').fetchone()
+                total += row[0]
+                voted += row[1]
+        return total, voted
+
+    def timeline(self, days=7):
+        merged = {}
+        for pool in self.pools:
+            with pool.connection() as conn:
+                for row in stats_rollup.timeline(conn.cursor(), days):
+                    merged[row['date']] = merged.get(row['date'], 0) + row['votes']
+        return [{'date': day, 'votes': merged[day]} for day in sorted(merged, reverse=True)[:days]]
+
+    def most_active_hour(self):
+        hours = {}
+        for pool in self.pools:
+            with pool.connection() as conn:
+                for hour, votes in conn.execute('SELECT hour, votes FROM votes_by_hour'):
+                    hours[hour] = hours.get(hour, 0) + votes
+        hours = {hour: votes for hour, votes in hours.items() if votes > 0}
+        return max(hours, key=hours.get) if hours else None
+
+    def total_votes(self):
+        total = 0
+        for pool in self.pools:
+            with pool.connection() as conn:
+                total += stats_rollup.total_votes(conn.cursor())
+        return total
+
+    # ========== VOTER ROLL ==========
+    def iter_voter_pages(self, page_size=1000, after=''):
+        """Keyset pages in global id order, merged from every shard."""
+        def rows(pool):
+            for page in iter_voter_pages(pool.connection, page_size, after):
+                yield from page
+
+        page = []
+        for row in heapq.merge(*(rows(pool) for pool in self.pools), key=lambda r: r[0]):
+            page.append(row)
+            if len(page) >= page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def import_voters(self, rows, chunk_size=5000, result=None):
+        """Route (id, name, email) rows to their shards in chunked transactions.
+
+        Counts go into `result` as each shard chunk commits (see
+        voter_roll.import_voters).
+        """
+        result = {'processed': 0, 'created': 0} if result is None else result
+        conns = [db_pool.connect(path, self.profile) for path in self.paths]
+        try:
+            buckets = [[] for _ in conns]
+            pending = 0
+            for row in rows:
+                buckets[self.shard_for(row[0])].append(row)
+                pending += 1
+                if pending >= chunk_size:
+                    self._flush_buckets(conns, buckets, result)
+                    pending = 0
+            self._flush_buckets(conns, buckets, result)
+        finally:
+            for conn in conns:
+                conn.close()
+        return result
+
+    @staticmethod
+    def _flush_buckets(conns, buckets, result):
+        for conn, bucket in zip(conns, buckets):
+            if bucket:
+                result['created'] += upsert_chunk(conn, bucket)
+                result['processed'] += len(bucket)
+                bucket.clear()
+
+    # ========== RESET ==========
+    def reset(self, votes, voted_at):
+        """Clear every shard, then record `votes` [(voter_id, candidate_id, time)]."""
+        by_shard = [[] for _ in self.pools]
+        for vote in votes:
+            by_shard[self.shard_for(vote[0])].append(vote)
+
+        for pool, shard_votes in zip(self.pools, by_shard):
+            with pool.connection() as conn:
+                conn.execute('UPDATE voters SET has_voted = 0, vote_time = NULL WHERE has_voted = 1')
+                conn.execute('DELETE FROM votes_log')
+                conn.execute('DELETE FROM candidate_votes')
+                conn.execute('DELETE FROM ranked_ballots')
+                conn.executemany(
+                    'INSERT INTO votes_log (voter_id, candidate_id, vote_time) VALUES (?, ?, ?)',
+                    shard_votes
+                )
+                conn.execute(
+                    'UPDATE voters SET has_voted = 1, vote_time = ? WHERE id IN (SELECT voter_id FROM votes_log)',
+                    (voted_at,)
+                )
+                conn.execute('''
+                    INSERT INTO candidate_votes (candidate_id, votes)
+                    SELECT candidate_id, COUNT(*) FROM votes_log GROUP BY candidate_id
+                ''')
+                stats_rollup.rebuild(conn.cursor())
+                integrity.record_baseline(conn.cursor(), 'candidate_votes')
+                conn.commit()
+
+
+class ShardedVoteBatcher:
+    """One group-commit writer per shard; ballots are routed by voter id."""
+
+    def __init__(self, shard_set, max_batch=64, max_wait=0.005, on_commit=None, journals=None):
+        self.database = shard_set.database
+        self.shard_set = shard_set
+        self.batchers = [
+            VoteBatcher(path, max_batch, max_wait, on_commit=on_commit,
+                        profile=shard_set.profile, counter_table='candidate_votes', journal=journal)
+            for path, journal in zip(shard_set.paths, journals or [None] * shard_set.count)
+        ]
+
+    def submit(self, voter_id, candidate_id, vote_time, ranking=None):
+        return self.batchers[self.shard_set.shard_for(voter_id)].submit(voter_id, candidate_id, vote_time, ranking)
+
+    def stats(self):
+        per_shard = [b.stats() for b in self.batchers]
+        batches = sum(s['batches'] for s in per_shard)
+        votes = sum(s['votes'] for s in per_shard)
+        return {
+            'batches': batches,
+            'votes': votes,
+            'avg_batch_size': round(votes / batches, 2) if batches else 0,
+            'queued': sum(s['queued'] for s in per_shard),
+            'shards': per_shard
+        }
+
+
+# ========== MIGRATION ==========
+def migrate(database, count, chunk_size=5000, profile='durable'):
+    """Move voters, votes_log and ranked_ballots from a single-file database into shards.
+
+    Candidate counts are preserved: each shard's candidate_votes is built
+    from its log rows and the main `candidates.votes` keeps only the part
+    not backed by a log row (e.g. seeded baseline counts).
+    """
+    shard_set = ShardSet(database, count, profile=profile)
+    shard_set.ensure_schema()
+    main = db_pool.connect(database, profile)
+    shard_conns = [db_pool.connect(path, profile) for path in shard_set.paths]
+    try:
+        moved = {'voters': 0, 'votes_log': 0, 'ranked_ballots': 0}
+        for table, columns in (('voters', 'id, name, email, has_voted, vote_time'),
+                               ('votes_log', 'voter_id, candidate_id, vote_time'),
+                               ('ranked_ballots', 'voter_id, ranking')):
+            key = 'id' if table == 'voters' else 'voter_id'
+            cursor = main.execute(f'SELECT {columns} FROM {table} ORDER BY rowid')
+            placeholders = ','.join('?' * len(columns.split(',')))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                buckets = [[] for _ in shard_conns]
+                for row in rows:
+                    buckets[shard_for(row[key], count)].append(tuple(row))
+                for conn, bucket in zip(shard_conns, buckets):
+                    conn.executemany(f'INSERT OR REPLACE INTO {table} ({columns}) VALUES ({placeholders})', bucket)
+                    conn.commit()
+                moved[table] += len(rows)
+
+        for conn in shard_conns:
+            conn.execute('DELETE FROM candidate_votes')
+            conn.execute('''
+                INSERT INTO candidate_votes (candidate_id, votes)
+                SELECT candidate_id, COUNT(*) FROM votes_log GROUP BY candidate_id
+            ''')
+            stats_rollup.rebuild(conn.cursor())
+            # INSERT OR REPLACE skips the delete trigger for replaced voters
+            voter_search.rebuild(conn)
+            integrity.record_baseline(conn.cursor(), 'candidate_votes')
+            conn.commit()
+
+        main.execute('''
+            UPDATE candidates SET votes = MAX(0, votes - (
+                SELECT COUNT(*) FROM votes_log WHERE votes_log.candidate_id = candidates.id
+            ))
+        ''')
+        main.execute('DELETE FROM voters')
+        main.execute('DELETE FROM votes_log')
+        main.execute('DELETE FROM ranked_ballots')
+        stats_rollup.rebuild(main.cursor())
+        main.commit()
+        return moved
+    finally:
+        main.close()
+        for conn in shard_conns:
+            conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Partition voting.db into voter shards')
+    parser.add_argument('command', choices=['migrate'])
+    parser.add_argument('--database', default='voting.db')
+    parser.add_argument('--shards', type=int, required=True)
+    args = parser.parse_args()
+
+    moved = migrate(args.database, args.shards)
+    print(f"✅ Moved {moved['voters']} voters and {moved['votes_log']} votes into {args.shards} shards")
+    print(f"   Start the server with SHARD_COUNT={args.shards}")
+
+
+if __name__ == '__main__':
+    main()
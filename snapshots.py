@@ -0,0 +1,105 @@
+"""
+BASELINE SNAPSHOTS
+File: snapshots.py
+Used by: voting.py (POST /api/admin/snapshot, POST /api/admin/restore)
+Run: python snapshots.py save --database voting.db [--snapshot voting.baseline.db] [--shards 4]
+     python snapshots.py restore --database voting.db [--snapshot voting.baseline.db] [--shards 4]
+
+A snapshot is a page-for-page copy of the database, and of each voter
+shard next to it, made with the SQLite online backup API. Saving reads one
+consistent view of each file while votes keep landing. Restoring copies
+the baseline back over the live files through their own locks, so open
+connections stay valid and see the baseline on their next query. This
+replaces a reset or a reseed of a large electorate, which would otherwise
+rewrite every voter row. Shard files are copied one after another, so a
+snapshot taken under load is consistent per file, not across shards.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import migrations
+from shards import shard_path
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def default_path(database):
+    root, ext = os.path.splitext(database)
+    return f'{root}.baseline{ext or ".db"}'
+
+
+def file_pairs(database, snapshot, shard_count=0):
+    """[(live path, snapshot path)] for the main file and every shard."""
+    return [(database, snapshot)] + [(shard_path(database, i), shard_path(snapshot, i)) for i in range(shard_count)]
+
+
+def copy(source, target):
+    """Copy `source` over `target` with the backup API."""
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target, timeout=30)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def _report(snapshot, pairs, started):
+    return {'snapshot': snapshot, 'files': len(pairs), 'bytes': sum(os.path.getsize(saved) for _, saved in pairs),
+            'seconds': round(time.perf_counter() - started, 3)}
+
+
+def save(database, snapshot=None, shard_count=0):
+    snapshot = snapshot or default_path(database)
+    pairs = file_pairs(database, snapshot, shard_count)
+    started = time.perf_counter()
+    for live, saved in pairs:
+        copy(live, saved)
+    return _report(snapshot, pairs, started)
+
+
+def restore(database, snapshot=None, shard_count=0):
+    """Copy a saved baseline back over the live files; raises SnapshotError."""
+    snapshot = snapshot or default_path(database)
+    pairs = file_pairs(database, snapshot, shard_count)
+    missing = [saved for _, saved in pairs if not os.path.exists(saved)]
+    if missing:
+        raise SnapshotError(f"No snapshot at {', '.join(missing)}")
+    conn = sqlite3.connect(snapshot)
+    try:
+        version = migrations.current_version(conn)
+    finally:
+        conn.close()
+    if version != migrations.LATEST_VERSION:
+        raise SnapshotError(f'Snapshot schema is at version {version}, expected {migrations.LATEST_VERSION}')
+    started = time.perf_counter()
+    for live, saved in pairs:
+        copy(saved, live)
+    return _report(snapshot, pairs, started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Save or restore a baseline copy of the voting database')
+    parser.add_argument('command', choices=['save', 'restore'])
+    parser.add_argument('--database', default='voting.db')
+    parser.add_argument('--snapshot', help='defaults to <database>.baseline.db')
+    parser.add_argument('--shards', type=int, default=0, help='voter shard files next to the database')
+    args = parser.parse_args()
+
+    try:
+        result = (save if args.command == 'save' else restore)(args.database, args.snapshot, args.shards)
+    except SnapshotError as e:
+        print(f'❌ {e}')
+        sys.exit(1)
+    verb = 'Saved' if args.command == 'save' else 'Restored'
+    print(f"✅ {verb} {result['snapshot']} ({result['files']} files, {result['bytes'] / 1e6:.1f} MB) "
+          f"in {result['seconds']:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+VOTE COUNT ROLLUPS
+File: stats_rollup.py
+Used by: voting.py (/api/stats, /api/results timeline), vote_batcher.py
+Run: python stats_rollup.py rebuild [--database voting.db]
+
+Per-day and per-hour-of-day vote counts, incremented in the same
+transaction that writes votes_log so the aggregates never scan the log.
+`rebuild` regenerates both tables from votes_log for recovery.
+"""
+import argparse
+import sqlite3
+
+
+ROLLUP_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS votes_by_day (
+        day TEXT PRIMARY KEY,
+        votes INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS votes_by_hour (
+        hour TEXT PRIMARY KEY,
+        votes INTEGER NOT NULL DEFAULT 0
+    )
+    '''
+]
+
+
+def ensure_schema(cursor):
+    for statement in ROLLUP_SCHEMA:
+        cursor.execute(statement)
+
+
+def record(cursor, vote_times):
+    """Add ISO-format vote timestamps to the rollups (caller commits)."""
+    days = {}
+    hours = {}
+    for vote_time in vote_times:
+        if not vote_time:
+            continue
+        day, hour = vote_time[:10], vote_time[11:13]
+        days[day] = days.get(day, 0) + 1
+        hours[hour] = hours.get(hour, 0) + 1
+
+    cursor.executemany(
+        'INSERT INTO votes_by_day (day, votes) VALUES (?, ?) '
+        'ON CONFLICT(day) DO UPDATE SET votes = votes + excluded.votes',
+        list(days.items())
+    )
+    cursor.executemany(
+        'INSERT INTO votes_by_hour (hour, votes) VALUES (?, ?) '
+        'ON CONFLICT(hour) DO UPDATE SET votes = votes + excluded.votes',
+        list(hours.items())
+    )
+
+
+def rebuild(cursor):
+    """Regenerate both rollups from votes_log (caller commits)."""
+    ensure_schema(cursor)
+    cursor.execute('DELETE FROM votes_by_day')
+    cursor.execute('DELETE FROM votes_by_hour')
+    cursor.execute('''
+        INSERT INTO votes_by_day (day, votes)
+        SELECT DATE(vote_time), COUNT(*) FROM votes_log
+        WHERE vote_time IS NOT NULL
+        GROUP BY DATE(vote_time)
+    ''')
+    cursor.execute('''
+        INSERT INTO votes_by_hour (hour, votes)
+        SELECT strftime('%H', vote_time), COUNT(*) FROM votes_log
+        WHERE vote_time IS NOT NULL
+        GROUP BY strftime('%H', vote_time)
+    ''')
+
+
+# ========== READS ==========
+def timeline(cursor, days=7):
+    cursor.execute('SELECT day AS date, votes FROM votes_by_day ORDER BY day DESC LIMIT ?', (days,))
+    return [{'date': row[0], 'votes': row[1]} for row in cursor.fetchall()]
+
+
+def most_active_hour(cursor):
+    cursor.execute('SELECT hour FROM votes_by_hour WHERE votes > 0 ORDER BY votes DESC LIMIT 1')
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def total_votes(cursor):
+    cursor.execute('SELECT COALESCE(SUM(votes), 0) FROM votes_by_day')
+    return cursor.fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain vote count rollups')
+    parser.add_argument('command', choices=['rebuild'])
+    parser.add_argument('--database', default='voting.db')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.database)
+    try:
+        rebuild(conn.cursor())
+        conn.commit()
+        days = conn.execute('SELECT COUNT(*), COALESCE(SUM(votes), 0) FROM votes_by_day').fetchone()
+        print(f"✅ Rollups rebuilt: {days[1]} votes across {days[0]} days")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+IN-MEMORY TALLY ENGINE
+File: tally.py
+Used by: voting.py (/api/results, /api/candidates)
+
+Holds vote counts per candidate plus voter totals in process memory.
+Writers apply increments after their transaction commits; readers get a
+pre-built snapshot, so serving results never touches SQLite and does not
+depend on how many votes have been cast.
+
+Durability stays with SQLite. A checkpoint row records the counts together
+with the highest votes_log id they include; on startup the counts are
+rebuilt from that checkpoint plus the votes_log rows written after it.
+"""
+import json
+import threading
+from datetime import datetime
+
+
+CHECKPOINT_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS tally_checkpoint (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_log_id INTEGER NOT NULL,
+        counts TEXT NOT NULL,
+        created_at TIMESTAMP
+    )
+'''
+
+
+class Tally:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.candidates = {}
+        self.total_voters = 0
+        self.voted_count = 0
+        self.version = 0
+        self.drift = {}
+        self._snapshot = None
+        self._snapshot_version = -1
+        self._listeners = []
+
+    def subscribe(self, callback):
+        """Call `callback()` after every change to the counts."""
+        self._listeners.append(callback)
+
+    def _notify(self):
+        for callback in self._listeners:
+            callback()
+
+    # ========== LOADING & RECONCILIATION ==========
+    def load(self, conn, shards=None):
+        """Load counts from SQLite and reconcile them against votes_log.
+
+        Any candidate whose `votes` column disagrees with checkpoint + log is
+        corrected in the table and reported in `drift`. With a ShardSet the
+        shard counters are added to the baseline in `candidates.votes`
+        instead; they are written in the same transaction as each shard's
+        votes_log, so there is nothing to reconcile.
+        """
+        conn.execute(CHECKPOINT_SCHEMA)
+        rows = conn.execute('SELECT * FROM candidates ORDER BY id').fetchall()
+        candidates = {row['id']: dict(row) for row in rows}
+
+        checkpoint = conn.execute('SELECT last_log_id, counts FROM tally_checkpoint WHERE id = 1').fetchone()
+        drift = {}
+        if shards is not None:
+            for candidate_id, votes in shards.candidate_counts().items():
+                if candidate_id in candidates:
+                    candidates[candidate_id]['votes'] += votes
+        elif checkpoint is not None:
+            expected = {int(k): v for k, v in json.loads(checkpoint['counts']).items()}
+            for row in conn.execute(
+                'SELECT candidate_id, COUNT(*) AS votes FROM votes_log WHERE id > ? GROUP BY +candidate_id',
+                (checkpoint['last_log_id'],)
+            ):
+                expected[row['candidate_id']] = expected.get(row['candidate_id'], 0) + row['votes']
+
+            for candidate_id, candidate in candidates.items():
+                votes = expected.get(candidate_id, 0)
+                if candidate['votes'] != votes:
+                    drift[candidate_id] = {'table': candidate['votes'], 'log': votes}
+                    candidate['votes'] = votes
+            if drift:
+                conn.executemany(
+                    'UPDATE candidates SET votes = ? WHERE id = ?',
+                    [(candidates[cid]['votes'], cid) for cid in drift]
+                )
+                conn.commit()
+
+        if shards is not None:
+            total_voters, voted_count = shards.voter_counts()
+        else:
+            total_voters = conn.execute('SELECT COUNT(*) FROM voters').fetchone()[0]
+            voted_count = conn.execute('SELECT COUNT(*) FROM voters WHERE has_voted = 1').fetchone()[0]
+
+        with self._lock:
+            self.candidates = candidates
+            self.total_voters = total_voters
+            self.voted_count = voted_count
+            self.drift = drift
+            self.version += 1
+        self._notify()
+        return drift
+
+    def checkpoint(self, conn):
+        """Persist counts with the votes_log high-water mark they cover.
+
+        Counts and the high-water mark are read in one transaction straight
+        from SQLite, so the checkpoint is consistent even while votes land.
+        """
+        conn.execute(CHECKPOINT_SCHEMA)
+        conn.execute('BEGIN')
+        try:
+            counts = {row['id']: row['votes'] for row in conn.execute('SELECT id, votes FROM candidates')}
+            last_log_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM votes_log').fetchone()[0]
+            conn.execute(
+                'INSERT OR REPLACE INTO tally_checkpoint (id, last_log_id, counts, created_at) VALUES (1, ?, ?, ?)',
+                (last_log_id, json.dumps(counts), datetime.now().isoformat())
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return last_log_id
+
+    # ========== INCREMENTAL UPDATES ==========
+    def record_votes(self, increments, new_voters=0):
+        """Apply committed votes: {candidate_id: count} plus newly created voters."""
+        with self._lock:
+            voted = 0
+            for candidate_id, count in increments.items():
+                candidate = self.candidates.get(candidate_id)
+                if candidate is not None:
+                    candidate['votes'] += count
+                voted += count
+            self.voted_count += voted
+            self.total_voters += new_voters
+            self.version += 1
+        self._notify()
+
+    def add_candidate(self, candidate):
+        with self._lock:
+            self.candidates[candidate['id']] = dict(candidate)
+            self.version += 1
+        self._notify()
+
+    # ========== READS ==========
+    def counts(self):
+        """(version, {candidate_id: votes}, total_voters, voted_count), read atomically."""
+        with self._lock:
+            return (self.version, {cid: c['votes'] for cid, c in self.candidates.items()},
+                    self.total_voters, self.voted_count)
+
+    def candidate(self, candidate_id):
+        with self._lock:
+            candidate = self.candidates.get(candidate_id)
+            return dict(candidate) if candidate is not None else None
+
+    def snapshot(self):
+        """Return the (candidates, results, totals) view for the current version."""
+        snapshot = self._snapshot
+        if self._snapshot_version == self.version and snapshot is not None:
+            return snapshot
+        with self._lock:
+            if self._snapshot_version != self.version or self._snapshot is None:
+                self._snapshot = self._build_snapshot()
+                self._snapshot_version = self.version
+            return self._snapshot
+
+    def _build_snapshot(self):
+        ordered = sorted(self.candidates.values(), key=lambda c: -c['votes'])
+        candidates = [dict(c) for c in ordered]
+        total_votes = sum(c['votes'] for c in candidates)
+
+        results = []
+        for candidate in candidates:
+            row = dict(candidate)
+            percentage = (row['votes'] / total_votes * 100) if total_votes > 0 else 0
+            row['percentage'] = round(percentage, 2)
+            results.append(row)
+
+        return {
+            'version': self.version,
+            'candidates': candidates,
+            'results': results,
+            'total_votes': total_votes,
+            'total_voters': self.total_voters,
+            'voted_count': self.voted_count,
+            'leading_candidate': candidates[0]['name'] if candidates else 'None'
+        }
@@ -0,0 +1,194 @@
+"""
+GROUP-COMMIT VOTE INGESTION
+File: vote_batcher.py
+Used by: voting.py (POST /api/vote)
+
+Validated ballots are queued in memory and a single writer thread flushes
+them to `candidates`, `voters` and `votes_log` in one transaction per batch.
+Each caller blocks until the batch holding its ballot has been committed.
+
+Candidate counts go to `candidates.votes`, or, for a voter shard (see
+shards.py), to that shard's `candidate_votes` table. With a journal (see
+journal.py) the accepted ballots are appended and synced to it inside the
+transaction, before COMMIT, and voided there if the commit fails. Ranked
+ballots (see ranked.py) are inserted in the same transaction as their vote.
+Once COMMIT succeeds the ballots count as recorded: an `on_commit` callback
+that raises is logged and does not fail them.
+"""
+import threading
+import time
+import queue
+
+import db_pool
+import stats_rollup
+
+
+class VoteRejected(Exception):
+    """Raised to a caller whose ballot lost a race inside the batch."""
+
+    def __init__(self, message, status=403):
+        super().__init__(message)
+        self.status = status
+
+
+class PendingVote:
+    __slots__ = ('voter_id', 'candidate_id', 'vote_time', 'ranking', 'done', 'error')
+
+    def __init__(self, voter_id, candidate_id, vote_time, ranking=None):
+        self.voter_id = voter_id
+        self.candidate_id = candidate_id
+        self.vote_time = vote_time
+        self.ranking = ranking
+        self.done = threading.Event()
+        self.error = None
+
+
+class VoteBatcher:
+    def __init__(self, database, max_batch=64, max_wait=0.005, timeout=30.0,
+                 on_commit=None, profile='durable', counter_table='candidates', journal=None):
+        self.database = database
+        self.journal = journal
+        self.profile = profile
+        self.counter_table = counter_table
+        self.on_commit = on_commit
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.votes = 0
+        self.callback_errors = 0
+
+    # ========== PUBLIC API ==========
+    def submit(self, voter_id, candidate_id, vote_time, ranking=None):
+        """Queue a ballot and wait until its batch is durable.
+
+        `ranking` is an encoded ranked ballot (ranked.encode) or None.
+        `on_commit` has run for the batch by the time this returns.
+        """
+        self._ensure_started()
+        pending = PendingVote(voter_id, candidate_id, vote_time, ranking)
+        self._queue.put(pending)
+        if not pending.done.wait(self.timeout):
+            raise TimeoutError('Vote was not committed in time')
+        if pending.error is not None:
+            raise pending.error
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'votes': self.votes,
+            'avg_batch_size': round(self.votes / self.batches, 2) if self.batches else 0,
+            'callback_errors': self.callback_errors,
+            'queued': self._queue.qsize()
+        }
+
+    # ========== WRITER THREAD ==========
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='vote-batcher', daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = db_pool.connect(self.database, self.profile, isolation_level=None)
+        while True:
+            batch = self._collect()
+            try:
+                self._flush(conn, batch)
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                for pending in batch:
+                    if not pending.done.is_set():
+                        pending.error = e
+                        pending.done.set()
+
+    def _flush(self, conn, batch):
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+
+        accepted = []
+        new_voters = 0
+        for pending in batch:
+            cursor.execute(
+                'INSERT OR IGNORE INTO voters (id, name, email, has_voted) VALUES (?, ?, ?, 0)',
+                (pending.voter_id, f'Voter {pending.voter_id}', f'{pending.voter_id}@email.com')
+            )
+            new_voters += cursor.rowcount
+            cursor.execute(
+                'UPDATE voters SET has_voted = 1, vote_time = ? WHERE id = ? AND has_voted = 0',
+                (pending.vote_time, pending.voter_id)
+            )
+            if cursor.rowcount == 1:
+                accepted.append(pending)
+            else:
+                pending.error = VoteRejected('This voter has already voted!')
+
+        increments = {}
+        for pending in accepted:
+            increments[pending.candidate_id] = increments.get(pending.candidate_id, 0) + 1
+
+        journaled = []
+        if self.journal is not None and accepted:
+            journaled = self.journal.append([(p.voter_id, p.candidate_id, p.vote_time, p.ranking) for p in accepted])
+        try:
+            self._write(cursor, accepted, increments)
+        except Exception:
+            if journaled:
+                self.journal.void(journaled)
+            raise
+
+        self.batches += 1
+        self.votes += len(accepted)
+        if self.on_commit is not None:
+            # The batch is durable: telling its voters it failed would make
+            # their retries look like repeat votes
+            try:
+                self.on_commit(increments, new_voters, [p.voter_id for p in accepted])
+            except Exception as e:
+                self.callback_errors += 1
+                print(f"⚠️ Vote batch committed but its on_commit callback failed: {e}")
+
+        for pending in batch:
+            pending.done.set()
+
+    def _write(self, cursor, accepted, increments):
+        if self.counter_table == 'candidate_votes':
+            cursor.executemany(
+                'INSERT INTO candidate_votes (candidate_id, votes) VALUES (?, ?) '
+                'ON CONFLICT(candidate_id) DO UPDATE SET votes = votes + excluded.votes',
+                list(increments.items())
+            )
+        else:
+            cursor.executemany(
+                'UPDATE candidates SET votes = votes + ? WHERE id = ?',
+                [(count, candidate_id) for candidate_id, count in increments.items()]
+            )
+        cursor.executemany(
+            'INSERT INTO votes_log (voter_id, candidate_id, vote_time) VALUES (?, ?, ?)',
+            [(p.voter_id, p.candidate_id, p.vote_time) for p in accepted]
+        )
+        cursor.executemany(
+            'INSERT INTO ranked_ballots (voter_id, ranking) VALUES (?, ?)',
+            [(p.voter_id, p.ranking) for p in accepted if p.ranking is not None]
+        )
+        stats_rollup.record(cursor, [p.vote_time for p in accepted])
+        cursor.execute('COMMIT')
@@ -0,0 +1,121 @@
+"""
+IN-MEMORY VOTED-SET
+File: voter_index.py
+Used by: voting.py (POST /api/vote, GET /api/voter/<voter_id>)
+
+Remembers which voters have voted so repeat votes and status checks for
+them are answered without a database round trip. Canonical numeric IDs
+(`VOTER001`, `VOTER12345`, ...) take one bit each in a bitmap; any other
+ID is kept in a plain set. Both are bounded: past the limits the index
+stops being authoritative for the IDs it cannot hold and callers fall back
+to SQLite for those.
+"""
+import sys
+import threading
+
+
+class VotedSet:
+    def __init__(self, prefix='VOTER', pad=3, max_numeric=100_000_000, max_other=1_000_000):
+        self.prefix = prefix
+        self.pad = pad
+        self.max_numeric = max_numeric
+        self.max_other = max_other
+        self._lock = threading.Lock()
+        self._bits = bytearray()
+        self._others = set()
+        self._other_bytes = 0
+        self._count = 0
+        self.numeric_overflow = False
+        self.other_overflow = False
+
+    def _number(self, voter_id):
+        """Bit position for a canonical numeric ID, else None."""
+        if not voter_id.startswith(self.prefix):
+            return None
+        digits = voter_id[len(self.prefix):]
+        if not digits.isdigit() or not digits.isascii():
+            return None
+        number = int(digits)
+        if str(number).zfill(self.pad) != digits:
+            return None
+        return number
+
+    # ========== UPDATES ==========
+    def add(self, voter_id):
+        with self._lock:
+            self._add(voter_id)
+
+    def add_many(self, voter_ids):
+        with self._lock:
+            for voter_id in voter_ids:
+                self._add(voter_id)
+
+    def _add(self, voter_id):
+        number = self._number(voter_id)
+        if number is not None:
+            if number >= self.max_numeric:
+                self.numeric_overflow = True
+                return
+            byte, bit = divmod(number, 8)
+            if byte >= len(self._bits):
+                size = min(max(byte + 1, len(self._bits) * 3 // 2), (self.max_numeric + 7) // 8)
+                self._bits.extend(bytes(size - len(self._bits)))
+            if not self._bits[byte] & (1 << bit):
+                self._bits[byte] |= 1 << bit
+                self._count += 1
+        elif voter_id not in self._others:
+            if len(self._others) >= self.max_other:
+                self.other_overflow = True
+                return
+            self._others.add(voter_id)
+            self._other_bytes += sys.getsizeof(voter_id)
+            self._count += 1
+
+    def load(self, voter_ids):
+        """Replace the contents with `voter_ids` (an iterable of voted IDs)."""
+        with self._lock:
+            self._bits = bytearray()
+            self._others = set()
+            self._other_bytes = 0
+            self._count = 0
+            self.numeric_overflow = False
+            self.other_overflow = False
+            for voter_id in voter_ids:
+                self._add(voter_id)
+
+    # ========== LOOKUPS ==========
+    def has_voted(self, voter_id):
+        """True / False when the index knows, None when SQLite must decide."""
+        number = self._number(voter_id)
+        if number is not None:
+            if number >= self.max_numeric:
+                return None
+            byte, bit = divmod(number, 8)
+            if byte < len(self._bits) and self._bits[byte] & (1 << bit):
+                return True
+            return False
+        if voter_id in self._others:
+            return True
+        return None if self.other_overflow else False
+
+    def __len__(self):
+        return self._count
+
+    def stats(self):
+        with self._lock:
+            bitmap_bytes = len(self._bits)
+            others = len(self._others)
+            others_bytes = sys.getsizeof(self._others) + self._other_bytes
+            count = self._count
+        total = bitmap_bytes + others_bytes
+        return {
+            'voted': count,
+            'bitmap_bytes': bitmap_bytes,
+            'other_ids': others,
+            'other_bytes': others_bytes,
+            'total_bytes': total,
+            'bytes_per_million_voters': round(total / count * 1_000_000) if count else 0,
+            'max_bitmap_bytes': (self.max_numeric + 7) // 8,
+            'max_other_ids': self.max_other,
+            'authoritative': not (self.numeric_overflow or self.other_overflow)
+        }
@@ -0,0 +1,238 @@
+"""
+BULK VOTER ROLL IMPORT / EXPORT
+File: voter_roll.py
+Used by: voting.py (/api/admin/voters, /api/admin/voters/import, /api/admin/voters/export)
+Run: python voter_roll.py import roll.csv [--database voting.db]
+     python voter_roll.py export roll.ndjson [--database voting.db]
+
+Rolls are streamed in both directions so memory stays flat regardless of
+roll size: imports are parsed row by row and written in chunked
+executemany transactions (the voter search triggers are dropped for the
+load and the search index is rebuilt once at the end; the partial indexes
+on voted voters are never touched by imported rows, so they stay, and
+startup recreates the triggers if an import died halfway), exports walk
+`voters` in keyset pages on `id`.
+"""
+import argparse
+import csv
+import io
+import json
+import sqlite3
+import sys
+
+import json_codec
+import voter_search
+
+
+IMPORT_CHUNK_SIZE = 5000
+EXPORT_PAGE_SIZE = 1000
+EXPORT_COLUMNS = ('id', 'name', 'email', 'has_voted', 'vote_time')
+
+UPSERT_VOTER = '''
+    INSERT INTO voters (id, name, email, has_voted) VALUES (?, ?, ?, 0)
+    ON CONFLICT(id) DO UPDATE SET name = excluded.name, email = excluded.email
+'''
+# Run inside the chunk's write transaction, so votes creating voters at the
+# same time cannot be counted as imported
+COUNT_EXISTING = 'SELECT COUNT(*) FROM voters WHERE id IN (SELECT value FROM json_each(?))'
+
+
+class RollFormatError(ValueError):
+    pass
+
+
+# ========== PARSING ==========
+def _voter_tuple(record, line):
+    voter_id = (record.get('id') or record.get('voter_id') or '').strip()
+    if not voter_id:
+        raise RollFormatError(f'Line {line}: missing voter id')
+    name = record.get('name') or f'Voter {voter_id}'
+    email = record.get('email') or f'{voter_id}@email.com'
+    return (voter_id, name, email)
+
+
+def iter_csv(text_stream):
+    reader = csv.DictReader(text_stream)
+    for line, record in enumerate(reader, 2):
+        yield _voter_tuple(record, line)
+
+
+def iter_ndjson(text_stream):
+    for line, raw in enumerate(text_stream, 1):
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError:
+            raise RollFormatError(f'Line {line}: invalid JSON')
+        yield _voter_tuple(record, line)
+
+
+PARSERS = {'csv': iter_csv, 'ndjson': iter_ndjson}
+
+
+def open_text(binary_stream):
+    return io.TextIOWrapper(binary_stream, encoding='utf-8', newline='')
+
+
+# ========== IMPORT ==========
+def upsert_chunk(conn, chunk):
+    """Upsert one chunk in its own transaction; returns how many voters it created."""
+    ids = {row[0] for row in chunk}
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        existing = conn.execute(COUNT_EXISTING, (json.dumps(list(ids)),)).fetchone()[0]
+        conn.executemany(UPSERT_VOTER, chunk)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return len(ids) - existing
+
+
+def import_voters(conn, rows, chunk_size=IMPORT_CHUNK_SIZE, defer_search_index=True, result=None):
+    """Upsert (id, name, email) tuples in chunked transactions.
+
+    Existing voters keep their has_voted / vote_time. Returns
+    {'processed': n, 'created': n}; pass `result` to see the counts of the
+    chunks committed before an error.
+    """
+    result = {'processed': 0, 'created': 0} if result is None else result
+    if defer_search_index:
+        voter_search.drop_triggers(conn)
+        conn.commit()
+    try:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                result['created'] += upsert_chunk(conn, chunk)
+                result['processed'] += len(chunk)
+                chunk = []
+        if chunk:
+            result['created'] += upsert_chunk(conn, chunk)
+            result['processed'] += len(chunk)
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        # One rebuild of the search index is far cheaper than a trigger per row
+        if defer_search_index:
+            voter_search.ensure_index(conn)
+            voter_search.rebuild(conn)
+            conn.commit()
+    return result
+
+
+# ========== EXPORT ==========
+def iter_voter_pages(connection_factory, page_size=EXPORT_PAGE_SIZE, after=''):
+    """Yield lists of voter rows in id order, one keyset page at a time.
+
+    `connection_factory` is a context manager factory so a connection is
+    only held while a single page is read.
+    """
+    while True:
+        with connection_factory() as conn:
+            rows = conn.execute(
+                'SELECT id, name, email, has_voted, vote_time FROM voters WHERE id > ? ORDER BY id LIMIT ?',
+                (after, page_size)
+            ).fetchall()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        after = rows[-1][0]
+
+
+def stream_json_array(pages):
+    yield '['
+    first = True
+    for page in pages:
+        chunk = ','.join(json_codec.dumps(dict(zip(EXPORT_COLUMNS, row))) for row in page)
+        yield chunk if first else ',' + chunk
+        first = False
+    yield ']'
+
+
+def stream_ndjson(pages):
+    for page in pages:
+        yield ''.join(json_codec.dumps(dict(zip(EXPORT_COLUMNS, row))) + '\n' for row in page)
+
+
+def stream_csv(pages):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for page in pages:
+        writer.writerows(tuple(row) for row in page)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+EXPORTERS = {
+    'csv': (stream_csv, 'text/csv'),
+    'ndjson': (stream_ndjson, 'application/x-ndjson'),
+    'json': (stream_json_array, 'application/json')
+}
+
+
+# ========== CLI ==========
+class _Connection:
+    def __init__(self, database):
+        self.database = database
+
+    def __call__(self):
+        return self
+
+    def __enter__(self):
+        self.conn = sqlite3.connect(self.database)
+        return self.conn
+
+    def __exit__(self, *exc):
+        self.conn.close()
+
+
+def _format_for(path, explicit):
+    if explicit:
+        return explicit
+    return 'csv' if path.endswith('.csv') else 'ndjson'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import or export the voter roll')
+    parser.add_argument('command', choices=['import', 'export'])
+    parser.add_argument('path', help="roll file ('-' for stdin/stdout)")
+    parser.add_argument('--format', choices=['csv', 'ndjson', 'json'])
+    parser.add_argument('--database', default='voting.db')
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+    fmt = _format_for(args.path, args.format)
+
+    if args.command == 'import':
+        if fmt not in PARSERS:
+            parser.error(f'cannot import {fmt}')
+        stream = open_text(sys.stdin.buffer) if args.path == '-' else open(args.path, encoding='utf-8', newline='')
+        conn = sqlite3.connect(args.database)
+        try:
+            with stream:
+                result = import_voters(conn, PARSERS[fmt](stream), args.chunk_size)
+        finally:
+            conn.close()
+        print(f"✅ Imported {result['processed']} voters ({result['created']} new)")
+    else:
+        exporter = EXPORTERS[fmt][0]
+        out = sys.stdout if args.path == '-' else open(args.path, 'w', encoding='utf-8', newline='')
+        try:
+            for chunk in exporter(iter_voter_pages(_Connection(args.database))):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+
+if __name__ == '__main__':
+    main()
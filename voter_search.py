@@ -0,0 +1,173 @@
+"""
+VOTER SEARCH & FILTERED PAGES
+File: voter_search.py
+Used by: voting.py (GET /api/admin/voters), migrations.py, shards.py
+
+voters_fts is an external-content FTS5 index over voters.name and
+voters.email. Triggers keep it in sync on insert, on delete, and on
+updates of those two columns. Marking a voter as voted does not touch the
+index, so the vote path pays nothing for it. Every word of a search is
+matched as a prefix of a name or email token, so "jam mil" finds James
+Miller and "voter12 email" finds voter12@email.com.
+
+Pages are keyset pages and the cursor is always the last voter id.
+Unsearched pages are in id order. Searched pages follow the index's rowid
+order (registration order), which FTS5 reads already sorted, so even a
+one-letter prefix over millions of voters stops after one page. With
+shards, searched pages are ordered by (rowid, shard).
+"""
+import heapq
+import re
+from datetime import datetime
+
+SEARCH_SCHEMA = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS voters_fts USING fts5(
+        name, email, content='voters', content_rowid='rowid', prefix='2 3'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS voters_fts_insert AFTER INSERT ON voters BEGIN
+        INSERT INTO voters_fts (rowid, name, email) VALUES (new.rowid, new.name, new.email);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS voters_fts_delete AFTER DELETE ON voters BEGIN
+        INSERT INTO voters_fts (voters_fts, rowid, name, email) VALUES ('delete', old.rowid, old.name, old.email);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS voters_fts_update AFTER UPDATE OF name, email ON voters BEGIN
+        INSERT INTO voters_fts (voters_fts, rowid, name, email) VALUES ('delete', old.rowid, old.name, old.email);
+        INSERT INTO voters_fts (rowid, name, email) VALUES (new.rowid, new.name, new.email);
+    END
+    '''
+]
+
+# vote_time ranges only cover voters who voted, so a partial index is enough
+VOTE_TIME_INDEX = 'CREATE INDEX IF NOT EXISTS idx_voters_vote_time ON voters (vote_time) WHERE has_voted = 1'
+
+TRIGGERS = ('voters_fts_insert', 'voters_fts_delete', 'voters_fts_update')
+
+COLUMN_NAMES = ('id', 'name', 'email', 'has_voted', 'vote_time')
+COLUMNS = ', '.join(f'voters.{name}' for name in COLUMN_NAMES)
+FILTER_ARGS = ('q', 'has_voted', 'voted_from', 'voted_to')
+
+
+class SearchError(ValueError):
+    pass
+
+
+def rebuild(conn):
+    """Re-index every voter (after bulk loads that bypass the triggers)."""
+    conn.execute("INSERT INTO voters_fts (voters_fts) VALUES ('rebuild')")
+
+
+def drop_triggers(conn):
+    """For bulk loads; ensure_index() and rebuild() restore the index afterwards."""
+    for name in TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def ensure_index(conn):
+    """Create the index and triggers, filling the index if it is new."""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'voters_fts'").fetchone()
+    for statement in SEARCH_SCHEMA:
+        conn.execute(statement)
+    if not exists:
+        rebuild(conn)
+
+
+def match_expression(text):
+    """'Jam  Mil' -> '"jam"* "mil"*'; FTS5 query syntax in the input is ignored."""
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        raise SearchError('Search needs at least one letter or digit')
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def parse_filters(args):
+    """Filters from query arguments; raises SearchError on bad values."""
+    filters = {}
+    if args.get('q', '').strip():
+        filters['match'] = match_expression(args['q'])
+    if 'has_voted' in args:
+        value = args['has_voted'].lower()
+        if value not in ('0', '1', 'true', 'false'):
+            raise SearchError('has_voted must be 0 or 1')
+        filters['has_voted'] = value in ('1', 'true')
+    for name in ('voted_from', 'voted_to'):
+        if name in args:
+            # Validated, then compared as text with the stored vote_time
+            try:
+                datetime.fromisoformat(args[name])
+            except ValueError:
+                raise SearchError(f'{name} must be an ISO date or timestamp')
+            filters[name] = args[name]
+    return filters
+
+
+def _conditions(filters):
+    # Literal has_voted terms, so the partial indexes on it can be used
+    clauses, params = [], []
+    if 'has_voted' in filters:
+        clauses.append(f"voters.has_voted = {1 if filters['has_voted'] else 0}")
+    if 'voted_from' in filters or 'voted_to' in filters:
+        clauses.append('voters.has_voted = 1')
+    if 'voted_from' in filters:
+        clauses.append('voters.vote_time >= ?')
+        params.append(filters['voted_from'])
+    if 'voted_to' in filters:
+        clauses.append('voters.vote_time < ?')
+        params.append(filters['voted_to'])
+    return ''.join(f' AND {clause}' for clause in clauses), params
+
+
+def _id_page(conn, filters, after, limit):
+    where, params = _conditions(filters)
+    return conn.execute(
+        f'SELECT {COLUMNS} FROM voters WHERE voters.id > ?{where} ORDER BY voters.id LIMIT ?',
+        [after] + params + [limit]
+    ).fetchall()
+
+
+def _search_page(conn, filters, start, inclusive, limit):
+    where, params = _conditions(filters)
+    return conn.execute(
+        f'SELECT voters_fts.rowid, {COLUMNS} FROM voters_fts CROSS JOIN voters ON voters.rowid = voters_fts.rowid '
+        f'WHERE voters_fts MATCH ? AND voters_fts.rowid {">=" if inclusive else ">"} ?{where} '
+        f'ORDER BY voters_fts.rowid LIMIT ?',
+        [filters['match'], start] + params + [limit]
+    ).fetchall()
+
+
+def find_voters(connections, filters, after='', limit=100, shard_for=None):
+    """One keyset page of voter rows (COLUMN_NAMES tuples) matching `filters`.
+
+    `connections` holds one connection factory (a context manager, like
+    ConnectionPool.connection) per shard, or a single one; `shard_for`
+    maps a voter id to its index in it.
+    """
+    if 'match' not in filters:
+        pages = []
+        for connection in connections:
+            with connection() as conn:
+                pages.append(_id_page(conn, filters, after, limit))
+        return [tuple(row) for row in heapq.merge(*pages, key=lambda row: row[0])][:limit]
+
+    start, after_shard = 0, len(connections)
+    if after:
+        after_shard = shard_for(after) if shard_for else 0
+        with connections[after_shard]() as conn:
+            row = conn.execute('SELECT rowid FROM voters WHERE id = ?', (after,)).fetchone()
+        if row is None:
+            raise SearchError(f'Unknown cursor: {after}')
+        start = row[0]
+
+    pages = []
+    for index, connection in enumerate(connections):
+        # Rows after (start, after_shard) in (rowid, shard) order
+        with connection() as conn:
+            rows = _search_page(conn, filters, start, index > after_shard, limit)
+        pages.append([(row[0], index, row) for row in rows])
+    return [tuple(entry[2])[1:] for entry in heapq.merge(*pages)][:limit]
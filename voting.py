@@ -3,86 +3,530 @@ COMPLETE ONLINE VOTING SYSTEM BACKEND
 File: voting.py
 Run: python voting.py
 """
-from flask import Flask, jsonify, request, g, send_from_directory
+from flask import Flask, jsonify, request, g, send_from_directory, send_file, Response
 from flask_cors import CORS
 import sqlite3
 import os
 import json
+import threading
+import time
 from datetime import datetime
+from vote_batcher import VoteBatcher, VoteRejected
+from tally import Tally
+import db_pool
+import stats_rollup
+import migrations
+import journal as vote_journal
+from results_stream import ResultsBroadcaster
+from response_cache import ResponseCache
+import voter_roll
+import voter_search
+import shards as shard_storage
+from voter_index import VotedSet
+from metrics import metrics, SamplingProfiler
+from admin_auth import AdminAuth
+import json_codec
+from compression import Compressor
+from rate_limit import RateLimiter, parse_limits, client_ip, json_field
+from idempotency import IdempotencyCache
+from image_store import ImageStore, ImageError, ImageUnavailable
+import ranked
+import snapshots
+from analytics import AnalyticsSnapshot
+import integrity as vote_integrity
 
 # ========== FLASK APP INITIALIZATION ==========
 app = Flask(__name__)
 CORS(app)
 
+# ========== RESPONSE ENCODING ==========
+# JSON is encoded with orjson when it is installed (JSON_FAST=0 keeps the
+# stdlib encoder). Responses of COMPRESS_MIN_BYTES or more are sent brotli-
+# or gzip-compressed when the client accepts it. The provider is set before
+# metrics.init_app, which wraps it to time serialization.
+JSON_FAST = os.environ.get('JSON_FAST', '1') != '0'
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', '1') != '0'
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+
+json_codec.enabled = JSON_FAST
+app.json = json_codec.FastJSONProvider(app)
+compressor = Compressor(COMPRESS_MIN_BYTES, enabled=COMPRESSION_ENABLED)
+compressor.init_app(app)
+
+# ========== INSTRUMENTATION ==========
+# Per-endpoint latency histograms, SQL / JSON / lock-wait time (metrics.py),
+# exported at /api/metrics. The sampling profiler is off unless
+# PROFILER_ENABLED=1 or switched on via /api/admin/profiler.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', '0') == '1'
+PROFILER_INTERVAL_MS = float(os.environ.get('PROFILER_INTERVAL_MS', '5'))
+
+metrics.enabled = METRICS_ENABLED
+metrics.init_app(app)
+profiler = SamplingProfiler(PROFILER_INTERVAL_MS / 1000)
+
+# ========== ADMIN AUTHENTICATION ==========
+# Admin passwords are stored as PBKDF2 hashes (ADMIN_HASH_ITERATIONS rounds)
+# and logins return HMAC-signed tokens valid for ADMIN_TOKEN_TTL_SECONDS.
+# Without ADMIN_TOKEN_SECRET a random secret is made at startup, so tokens
+# do not survive a restart.
+ADMIN_HASH_ITERATIONS = int(os.environ.get('ADMIN_HASH_ITERATIONS', '200000'))
+ADMIN_TOKEN_TTL_SECONDS = int(os.environ.get('ADMIN_TOKEN_TTL_SECONDS', '3600'))
+ADMIN_TOKEN_SECRET = os.environ.get('ADMIN_TOKEN_SECRET')
+
+admin_auth = AdminAuth(ADMIN_TOKEN_SECRET, ADMIN_TOKEN_TTL_SECONDS, ADMIN_HASH_ITERATIONS)
+require_admin = admin_auth.required
+
+# ========== RATE LIMITING ==========
+# Token buckets per route and key ("<route>.<ip|voter>=<requests>/<seconds>
+# [:<burst>]"), checked before the view touches the database. RATE_LIMITS
+# entries override the defaults; "=0" removes one. Buckets are per process,
+# so with workers.py each worker applies the limits on its own.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') != '0'
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))
+DEFAULT_RATE_LIMITS = 'vote.ip=50/1:100,vote.voter=5/60,voter_status.ip=100/1:200,admin_login.ip=10/60'
+RATE_LIMITS = parse_limits(DEFAULT_RATE_LIMITS + ',' + os.environ.get('RATE_LIMITS', ''))
+
+rate_limiter = RateLimiter(
+    RATE_LIMITS, RATE_LIMIT_MAX_KEYS, RATE_LIMIT_ENABLED,
+    on_reject=lambda route, kind: metrics.increment(f'rate_limited_{route}_{kind}')
+)
+
+# ========== IDEMPOTENT VOTES ==========
+# A vote sent with an Idempotency-Key header (or "idempotency_key" field)
+# stores its success response for IDEMPOTENCY_TTL_SECONDS; retries with the
+# same key get it back from memory, ahead of the rate limits (see
+# idempotency.py). At most IDEMPOTENCY_MAX_KEYS responses are kept. With
+# workers.py the writer process holds them, so any worker can replay one.
+IDEMPOTENCY_ENABLED = os.environ.get('IDEMPOTENCY_ENABLED', '1') != '0'
+IDEMPOTENCY_TTL_SECONDS = float(os.environ.get('IDEMPOTENCY_TTL_SECONDS', '300'))
+IDEMPOTENCY_MAX_KEYS = int(os.environ.get('IDEMPOTENCY_MAX_KEYS', '100000'))
+
+idempotency = IdempotencyCache(IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_MAX_KEYS, enabled=IDEMPOTENCY_ENABLED)
+
 # ========== DATABASE CONFIGURATION ==========
 DATABASE = 'voting.db'
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '8'))
+DB_PRAGMA_PROFILE = os.environ.get('DB_PRAGMA_PROFILE', 'durable')
+# Startup keeps a database that already has a schema (migrating it in place
+# if it is older); DB_RESET_ON_START=1 reseeds it on every start instead.
+DB_RESET_ON_START = os.environ.get('DB_RESET_ON_START', '0') == '1'
+# Baseline copy for /api/admin/snapshot and /api/admin/restore (see
+# snapshots.py); defaults to voting.baseline.db next to DATABASE.
+SNAPSHOT_PATH = os.environ.get('SNAPSHOT_PATH')
+
+def get_pool():
+    return db_pool.get_pool(DATABASE, DB_POOL_SIZE, DB_PRAGMA_PROFILE)
 
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(DATABASE)
-        g.db.row_factory = sqlite3.Row
+        pool = get_pool()
+        g.db = pool.acquire()
+        g.db_pool = pool
     return g.db
 
 def close_db(e=None):
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        g.pop('db_pool').release(db)
 
 app.teardown_appcontext(close_db)
 
+# ========== PARTITIONED VOTER STORAGE ==========
+# SHARD_COUNT > 0 stores voters and votes_log in that many shard files next
+# to DATABASE (see shards.py); votes always use the batched path then.
+SHARD_COUNT = int(os.environ.get('SHARD_COUNT', '0'))
+
+_shards = None
+
+def get_shards():
+    global _shards
+    if SHARD_COUNT <= 0:
+        return None
+    if _shards is None or _shards.database != DATABASE or _shards.count != SHARD_COUNT:
+        _shards = shard_storage.ShardSet(DATABASE, SHARD_COUNT, profile=DB_PRAGMA_PROFILE)
+        _shards.ensure_schema()
+    return _shards
+
+def voter_pages(page_size=voter_roll.EXPORT_PAGE_SIZE, after=''):
+    """Keyset pages of voter rows in id order, across shards if enabled."""
+    shards = get_shards()
+    if shards:
+        return shards.iter_voter_pages(page_size, after)
+    return voter_roll.iter_voter_pages(get_pool().connection, page_size, after)
+
+def find_voters(filters, after='', limit=100):
+    """One keyset page of voters matching `filters` (see voter_search)."""
+    shards = get_shards()
+    if shards:
+        return voter_search.find_voters([pool.connection for pool in shards.pools], filters, after, limit,
+                                        shard_for=shards.shard_for)
+    return voter_search.find_voters([get_pool().connection], filters, after, limit)
+
+def voter_db(voter_id):
+    """Context manager yielding the connection that holds `voter_id`."""
+    shards = get_shards()
+    pool = shards.pool_for(voter_id) if shards else get_pool()
+    return pool.connection()
+
+# ========== VOTE INGESTION CONFIGURATION ==========
+# Group commit: ballots are flushed in batches of up to VOTE_BATCH_SIZE,
+# waiting at most VOTE_BATCH_WAIT_MS for a batch to fill.
+VOTE_BATCHING = os.environ.get('VOTE_BATCHING', '1') != '0'
+VOTE_BATCH_SIZE = int(os.environ.get('VOTE_BATCH_SIZE', '64'))
+VOTE_BATCH_WAIT_MS = float(os.environ.get('VOTE_BATCH_WAIT_MS', '5'))
+
+_vote_batcher = None
+
+def get_vote_batcher():
+    global _vote_batcher
+    if _worker is not None:
+        return _worker.batcher
+    shards = get_shards()
+    sharded = isinstance(_vote_batcher, shard_storage.ShardedVoteBatcher)
+    if _vote_batcher is None or _vote_batcher.database != DATABASE or sharded != bool(shards):
+        # Load the tally and voted-set before any batch commits, or they
+        # would count those votes twice
+        tally, voted_set = get_tally(), get_voted_set()
+        
+        def on_commit(increments, new_voters, voter_ids):
+            voted_set.add_many(voter_ids)
+            tally.record_votes(increments, new_voters)
+        if shards:
+            _vote_batcher = shard_storage.ShardedVoteBatcher(
+                shards, VOTE_BATCH_SIZE, VOTE_BATCH_WAIT_MS / 1000, on_commit=on_commit,
+                journals=[get_journal(path) for path in shards.paths]
+            )
+        else:
+            _vote_batcher = VoteBatcher(
+                DATABASE, VOTE_BATCH_SIZE, VOTE_BATCH_WAIT_MS / 1000, profile=DB_PRAGMA_PROFILE,
+                on_commit=on_commit, journal=get_journal(DATABASE)
+            )
+    return _vote_batcher
+
+# ========== WORKER MODE ==========
+# Set inside the HTTP worker processes started by workers.py: ballots go to
+# the single writer process and tallies / voted-set are read from shared
+# memory instead of this process.
+_worker = None
+
+def use_worker(services):
+    global _worker
+    _worker = services
+    idempotency.remote = services.idempotency
+
+# ========== VOTE JOURNAL ==========
+# Accepted ballots are appended to an mmap'd, checksummed journal next to
+# each database file (voting.journal, voting.shardN.journal) before their
+# transaction commits; see journal.py for replay, verify and rebuild.
+VOTE_JOURNAL = os.environ.get('VOTE_JOURNAL', '1') != '0'
+VOTE_JOURNAL_SYNC = os.environ.get('VOTE_JOURNAL_SYNC', '1') != '0'
+
+def get_journal(database):
+    if not VOTE_JOURNAL:
+        return None
+    return vote_journal.get_journal(vote_journal.journal_path(database), VOTE_JOURNAL_SYNC)
+
+def journal_databases():
+    shards = get_shards()
+    return shards.paths if shards else [DATABASE]
+
+def record_journal_reset(truncate=False):
+    """Re-base the journals on the votes_log rows after an init or reset."""
+    if not VOTE_JOURNAL:
+        return
+    if _worker is not None:
+        return _worker.reset_journal()
+    for database in journal_databases():
+        journal = get_journal(database)
+        if truncate:
+            journal.truncate()
+        conn = db_pool.connect(database, DB_PRAGMA_PROFILE)
+        try:
+            journal.record_reset(conn)
+        finally:
+            conn.close()
+
+# ========== IN-MEMORY TALLY ==========
+# Counts are checkpointed every TALLY_CHECKPOINT_SECONDS by a background
+# thread started with the server (0 disables the thread).
+TALLY_CHECKPOINT_SECONDS = float(os.environ.get('TALLY_CHECKPOINT_SECONDS', '30'))
+
+_tally = None
+_tally_database = None
+_tally_lock = threading.Lock()
+
+def get_tally():
+    global _tally, _tally_database
+    if _worker is not None:
+        return _worker.tally.refresh()
+    if _tally is None or _tally_database != DATABASE:
+        with _tally_lock:
+            if _tally is None or _tally_database != DATABASE:
+                # Dedicated connection: callers may already hold a pooled one
+                conn = db_pool.connect(DATABASE, DB_PRAGMA_PROFILE)
+                try:
+                    tally = Tally()
+                    drift = tally.load(conn, shards=get_shards())
+                finally:
+                    conn.close()
+                if drift:
+                    print(f"⚠️ Tally reconciled against votes_log, corrected: {drift}")
+                _tally, _tally_database = tally, DATABASE
+    return _tally
+
+def checkpoint_tally():
+    with get_pool().connection() as conn:
+        return get_tally().checkpoint(conn)
+
+# ========== VOTED-SET INDEX ==========
+# Bitmap for canonical VOTERnnn ids up to VOTED_INDEX_MAX_NUMERIC, plain set
+# for up to VOTED_INDEX_MAX_OTHER other ids.
+VOTED_INDEX_MAX_NUMERIC = int(os.environ.get('VOTED_INDEX_MAX_NUMERIC', '100000000'))
+VOTED_INDEX_MAX_OTHER = int(os.environ.get('VOTED_INDEX_MAX_OTHER', '1000000'))
+
+_voted_set = None
+_voted_set_database = None
+
+def load_voted_set(voted_set):
+    shards = get_shards()
+    pools = shards.pools if shards else [get_pool()]
+    
+    def voted_ids():
+        for pool in pools:
+            with pool.connection() as conn:
+                for row in conn.execute('SELECT id FROM voters WHERE has_voted = 1'):
+                    yield row[0]
+    
+    voted_set.load(voted_ids())
+
+def get_voted_set():
+    global _voted_set, _voted_set_database
+    if _worker is not None:
+        return _worker.voted_set
+    if _voted_set is None or _voted_set_database != DATABASE:
+        with _tally_lock:
+            if _voted_set is None or _voted_set_database != DATABASE:
+                voted_set = VotedSet(max_numeric=VOTED_INDEX_MAX_NUMERIC, max_other=VOTED_INDEX_MAX_OTHER)
+                load_voted_set(voted_set)
+                _voted_set, _voted_set_database = voted_set, DATABASE
+    return _voted_set
+
+# ========== CANDIDATE IMAGES ==========
+# Photos are fetched from image_url once (or uploaded), thumbnailed to
+# IMAGE_WIDTHS when Pillow is installed, and served from IMAGE_DIR.
+IMAGE_DIR = os.environ.get('IMAGE_DIR', 'candidate_images')
+IMAGE_WIDTHS = [int(w) for w in os.environ.get('IMAGE_WIDTHS', '160,480').split(',') if w.strip()]
+IMAGE_MAX_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', str(5 * 1024 * 1024)))
+IMAGE_FETCH_TIMEOUT = float(os.environ.get('IMAGE_FETCH_TIMEOUT', '5'))
+IMAGE_PREFETCH = os.environ.get('IMAGE_PREFETCH', '1') != '0'
+# How often each process re-reads candidate_images for uploads made by
+# another worker
+IMAGE_REVALIDATE_SECONDS = float(os.environ.get('IMAGE_REVALIDATE_SECONDS', '2'))
+# Cache lifetime of digest-stamped image URLs; plain URLs are revalidated
+IMAGE_MAX_AGE = 365 * 24 * 3600
+
+image_store = ImageStore(
+    IMAGE_DIR,
+    lambda: get_pool().connection(),
+    widths=IMAGE_WIDTHS,
+    max_bytes=IMAGE_MAX_BYTES,
+    fetch_timeout=IMAGE_FETCH_TIMEOUT,
+    revalidate_seconds=IMAGE_REVALIDATE_SECONDS
+)
+
+def with_images(candidates):
+    return [dict(candidate, image=image_store.url(candidate)) for candidate in candidates]
+
+# ========== RANKED BALLOTS ==========
+# A vote may carry a `ranking` of up to RANKED_MAX_RANKS candidate ids (see
+# ranked.py). /api/results?method=irv|stv reuses a tabulation for
+# RANKED_TABULATION_INTERVAL seconds, and redoes it only if ballots arrived.
+RANKED_MAX_RANKS = int(os.environ.get('RANKED_MAX_RANKS', '8'))
+RANKED_TABULATION_INTERVAL = float(os.environ.get('RANKED_TABULATION_INTERVAL', '2'))
+
+_ballot_box = None
+_ballot_box_database = None
+# (method, seats) -> (computed_at, ballots, candidate ids, report)
+_tabulations = {}
+_tabulation_lock = threading.Lock()
+
+def ballot_connections():
+    shards = get_shards()
+    return [pool.connection for pool in shards.pools] if shards else [get_pool().connection]
+
+def tabulate_ranked(method, seats=1):
+    """Round-by-round report for the ranked ballots; one tabulation at a time."""
+    global _ballot_box, _ballot_box_database
+    with _tabulation_lock:
+        if _ballot_box is None or _ballot_box_database != DATABASE:
+            _ballot_box, _ballot_box_database = ranked.BallotBox(RANKED_MAX_RANKS), DATABASE
+            _tabulations.clear()
+        candidates = get_tally().snapshot()['candidates']
+        candidate_ids = sorted(c['id'] for c in candidates)
+        cached = _tabulations.get((method, seats))
+        if cached and time.monotonic() - cached[0] < RANKED_TABULATION_INTERVAL and cached[2] == candidate_ids:
+            return cached[3]
+        ballots = _ballot_box.refresh(ballot_connections())
+        if cached and cached[1:3] == (ballots, candidate_ids):
+            report = cached[3]
+        else:
+            data, width = _ballot_box.snapshot()
+            report = ranked.tabulate(data, width, candidate_ids, method, seats)
+            report['candidates'] = {c['id']: {'name': c['name'], 'party': c['party']} for c in candidates}
+        _tabulations[(method, seats)] = (time.monotonic(), ballots, candidate_ids, report)
+        return report
+
+def reset_tabulations():
+    """Drop loaded ballots and cached reports (after a reset or restore)."""
+    global _ballot_box
+    with _tabulation_lock:
+        _ballot_box = None
+        _tabulations.clear()
+
+# ========== ANALYTICS SNAPSHOT ==========
+# ANALYTICS_SNAPSHOT=1 serves the /api/results timeline, /api/stats and the
+# admin voter pages and export from in-memory copies of the database (see
+# analytics.py), never older than ANALYTICS_MAX_STALENESS seconds, so
+# dashboards never read through the connections votes are written with.
+ANALYTICS_SNAPSHOT = os.environ.get('ANALYTICS_SNAPSHOT', '0') == '1'
+ANALYTICS_MAX_STALENESS = float(os.environ.get('ANALYTICS_MAX_STALENESS', '5'))
+# Served entirely from the snapshot, so the whole response carries its age;
+# /api/results and /api/stats mix in live tally counts and label only the
+# fields that came from it
+ANALYTICS_ENDPOINTS = {'get_all_voters', 'export_voters'}
+
+def analytics_sources():
+    shards = get_shards()
+    return [DATABASE] + (shards.paths if shards else [])
+
+analytics = AnalyticsSnapshot(analytics_sources, ANALYTICS_MAX_STALENESS)
+
+def analytics_view():
+    """The current analytics generation, or None when reads go to the live database."""
+    if not ANALYTICS_SNAPSHOT:
+        return None
+    view = analytics.current()
+    # The generation this response is built from, not whichever is current
+    # when it is sent (kept with cached bodies, see response_cache)
+    g.analytics_as_of = view.as_of
+    return view
+
+@app.after_request
+def report_staleness(response):
+    # Computed per response, so cached bodies still report their real age
+    as_of = g.get('analytics_as_of')
+    if as_of is not None and request.endpoint in ANALYTICS_ENDPOINTS:
+        response.headers['X-Analytics-As-Of'] = datetime.fromtimestamp(as_of).isoformat()
+        response.headers['X-Analytics-Age'] = f'{max(0.0, time.time() - as_of):.3f}'
+        response.headers['X-Analytics-Max-Staleness'] = f'{ANALYTICS_MAX_STALENESS:g}'
+    return response
+
+# ========== INTEGRITY VERIFIER ==========
+# A background thread checks votes_log against voters.has_voted and the
+# candidate counters, INTEGRITY_CHUNK_SIZE log rows at a time from a
+# persisted high-water mark (see integrity.py), pausing INTEGRITY_PAUSE_MS
+# between chunks and INTEGRITY_INTERVAL seconds between passes (0 disables
+# the thread). INTEGRITY_REPAIR=1 repairs what it finds after each pass.
+INTEGRITY_INTERVAL = float(os.environ.get('INTEGRITY_INTERVAL', '10'))
+INTEGRITY_CHUNK_SIZE = int(os.environ.get('INTEGRITY_CHUNK_SIZE', '2000'))
+INTEGRITY_PAUSE_MS = float(os.environ.get('INTEGRITY_PAUSE_MS', '20'))
+INTEGRITY_REPAIR = os.environ.get('INTEGRITY_REPAIR', '0') == '1'
+
+def integrity_targets():
+    # Shard counters are all backed by their own log; the main file has none
+    shards = get_shards()
+    return [(path, 'candidate_votes') for path in shards.paths] if shards else [(DATABASE, 'candidates')]
+
+def apply_integrity_repairs(voter_ids, recount):
+    """Bring the in-memory voted-set and tally in line with repaired rows."""
+    get_voted_set().add_many(voter_ids)
+    if not recount:
+        return
+    conn = db_pool.connect(DATABASE, DB_PRAGMA_PROFILE)
+    try:
+        shards = get_shards()
+        if not shards:
+            # Loading against the old checkpoint would undo repaired counters
+            get_tally().checkpoint(conn)
+        get_tally().load(conn, shards=shards)
+    finally:
+        conn.close()
+    reset_tabulations()
+
+integrity = vote_integrity.IntegrityMonitor(
+    integrity_targets, INTEGRITY_INTERVAL, INTEGRITY_CHUNK_SIZE, INTEGRITY_PAUSE_MS / 1000,
+    repair=INTEGRITY_REPAIR, on_repair=apply_integrity_repairs, profile=DB_PRAGMA_PROFILE
+)
+
+def integrity_report(run=False, repair=False, rescan=False, limit=100):
+    if run:
+        integrity.run_round(repair=repair, rescan=rescan, full_sweep=True)
+    return integrity.report(limit)
+
+def start_integrity_verifier():
+    if INTEGRITY_INTERVAL <= 0:
+        return None
+    return integrity.start()
+
+# ========== RESPONSE CACHE ==========
+def election_version():
+    """Changes whenever a vote, candidate addition, reset, stored image or
+    analytics refresh lands."""
+    tally = get_tally()
+    generation = analytics.generation.number if ANALYTICS_SNAPSHOT and analytics.generation else 0
+    return (id(tally), tally.version, image_store.revalidate(), generation)
+
+response_cache = ResponseCache(election_version, context=('analytics_as_of',))
+
+# ========== LIVE RESULTS STREAM ==========
+# Upper bound on delta events per second pushed to /api/results/stream
+RESULTS_STREAM_MAX_RATE = float(os.environ.get('RESULTS_STREAM_MAX_RATE', '4'))
+
+_results_broadcaster = None
+
+def get_results_broadcaster():
+    global _results_broadcaster
+    tally = get_tally()
+    if _results_broadcaster is None or _results_broadcaster.tally is not tally:
+        _results_broadcaster = ResultsBroadcaster(tally, RESULTS_STREAM_MAX_RATE)
+    return _results_broadcaster
+
+def start_tally_checkpointer():
+    # Shard counters are committed with their votes_log rows; nothing to checkpoint
+    if TALLY_CHECKPOINT_SECONDS <= 0 or get_shards():
+        return None
+    
+    def run():
+        while True:
+            time.sleep(TALLY_CHECKPOINT_SECONDS)
+            try:
+                checkpoint_tally()
+            except Exception as e:
+                print(f"⚠️ Tally checkpoint failed: {e}")
+    
+    thread = threading.Thread(target=run, name='tally-checkpoint', daemon=True)
+    thread.start()
+    return thread
+
 def dict_from_row(row):
     return dict(zip(row.keys(), row)) if row else None
 
+def wants_columnar():
+    return request.args.get('format') == 'columnar'
+
 # ========== DATABASE INITIALIZATION WITH IMAGES ==========
 def init_db():
     with app.app_context():
         db = get_db()
         cursor = db.cursor()
         
-        cursor.execute('DROP TABLE IF EXISTS candidates')
-        cursor.execute('DROP TABLE IF EXISTS voters')
-        cursor.execute('DROP TABLE IF EXISTS admin')
-        cursor.execute('DROP TABLE IF EXISTS votes_log')
-        
-        cursor.execute('''
-            CREATE TABLE candidates (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                party TEXT NOT NULL,
-                bio TEXT,
-                color TEXT,
-                votes INTEGER DEFAULT 0,
-                avatar TEXT,
-                image_url TEXT
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE voters (
-                id TEXT PRIMARY KEY,
-                name TEXT,
-                email TEXT,
-                has_voted BOOLEAN DEFAULT 0,
-                vote_time TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE admin (
-                username TEXT PRIMARY KEY,
-                password TEXT,
-                email TEXT
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE votes_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                voter_id TEXT,
-                candidate_id INTEGER,
-                vote_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+        for table in ('candidates', 'voters', 'admin', 'votes_log', 'votes_by_day', 'votes_by_hour', 'candidate_images', 'voters_fts',
+                      'ranked_ballots', 'integrity_state'):
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+        cursor.execute('PRAGMA user_version = 0')
+        db.commit()
+        migrations.migrate(db)
         
         admin_data = [
             ('admin', 'admin123', 'admin@voting.com'),
@@ -91,7 +535,7 @@ def init_db():
         ]
         cursor.executemany(
             'INSERT INTO admin (username, password, email) VALUES (?, ?, ?)',
-            admin_data
+            [(username, admin_auth.hash_password(password), email) for username, password, email in admin_data]
         )
         
         # CANDIDATES WITH REAL IMAGE URLs
@@ -202,9 +646,50 @@ def init_db():
             votes_log_data
         )
         
+        stats_rollup.rebuild(cursor)
+        # The seeded counts have no log rows behind them; verify from here
+        vote_integrity.record_baseline(cursor)
+        
         db.commit()
+        
+        # Seeded counts are the baseline the tally reconciles from
+        Tally().checkpoint(db)
+        
+        shards = get_shards()
+        if shards:
+            shards.drop_all()
+            shards.ensure_schema()
+            shard_storage.migrate(DATABASE, SHARD_COUNT, profile=DB_PRAGMA_PROFILE)
+        record_journal_reset(truncate=True)
+        
+        if _tally is not None and _tally_database == DATABASE:
+            _tally.load(db, shards=shards)
+        if _voted_set is not None and _voted_set_database == DATABASE:
+            load_voted_set(_voted_set)
+        image_store.reset()
+        idempotency.clear()
         print("✅ Database initialized with candidate images!")
 
+def prepare_db():
+    """Seed the database only if it has no tables yet; returns True if it did."""
+    conn = db_pool.connect(DATABASE, DB_PRAGMA_PROFILE)
+    try:
+        version = migrations.current_version(conn)
+        # A database made before migrations existed has tables but user_version 0
+        has_schema = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' LIMIT 1").fetchone() is not None
+        applied = migrations.migrate(conn) if has_schema and not DB_RESET_ON_START else []
+        if has_schema and not DB_RESET_ON_START and migrations.restore_voter_objects(conn):
+            print("⚠️ Recreated voter indexes and search triggers left dropped by an unfinished import")
+    finally:
+        conn.close()
+    if not has_schema or DB_RESET_ON_START:
+        init_db()
+        return True
+    get_shards()
+    print(f"✅ Keeping existing database (schema version {migrations.LATEST_VERSION}"
+          + (f", migrated from {version})" if applied else ')'))
+    return False
+
 # ========== API ENDPOINTS ==========
 
 @app.route('/')
@@ -215,77 +700,150 @@ def home():
         'version': '3.0',
         'timestamp': datetime.now().isoformat(),
         'endpoints': {
-            '/api/candidates': 'GET - Get all candidates',
-            '/api/vote': 'POST - Submit a vote',
-            '/api/results': 'GET - Get election results',
+            '/api/candidates': 'GET - Get all candidates (?format=columnar)',
+            '/api/candidates/<id>/image': 'GET - Cached candidate photo (?w= thumbnail width)',
+            '/api/vote': 'POST - Submit a vote (optionally a ranking of candidate ids; retries may repeat an Idempotency-Key header)',
+            '/api/results': 'GET - Get election results (?method=irv|stv&seats=N for ranked ballots)',
+            '/api/results/stream': 'GET - Live results (Server-Sent Events)',
             '/api/voter/<voter_id>': 'GET - Check voter status',
             '/api/stats': 'GET - Get system statistics',
             '/api/admin/login': 'POST - Admin login',
-            '/api/admin/candidates': 'POST - Add new candidate',
-            '/api/admin/reset': 'POST - Reset election',
+            '/api/admin/candidates': 'POST - Add new candidate [admin token]',
+            '/api/admin/candidates/<id>/image': 'POST - Upload candidate photo [admin token]',
+            '/api/admin/voters': 'GET - List voters (?limit=&after= for keyset pages, &q=&has_voted=&voted_from=&voted_to=, &format=columnar) [admin token]',
+            '/api/admin/voters/import': 'POST - Bulk import voters (CSV or NDJSON body) [admin token]',
+            '/api/admin/voters/export': 'GET - Stream voter roll (?format=csv|ndjson|json) [admin token]',
+            '/api/admin/reset': 'POST - Reset election [admin token]',
+            '/api/admin/snapshot': 'POST - Save a baseline copy of the database [admin token]',
+            '/api/admin/restore': 'POST - Restore the saved baseline [admin token]',
+            '/api/admin/integrity': 'GET - Integrity verifier findings and lag; POST to run a pass ({"repair": true}) [admin token]',
             '/api/health': 'GET - Health check'
         }
     })
 
 @app.route('/api/candidates', methods=['GET'])
+@response_cache.cached
 def get_candidates():
     try:
-        db = get_db()
-        cursor = db.cursor()
-        cursor.execute('SELECT * FROM candidates ORDER BY votes DESC')
-        rows = cursor.fetchall()
-        
-        candidates = [dict_from_row(row) for row in rows]
+        candidates = with_images(get_tally().snapshot()['candidates'])
+        if wants_columnar():
+            return jsonify(json_codec.columnar(candidates))
         return jsonify(candidates)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def record_vote(db, voter_id, candidate_id, vote_time, voter_exists=True, ranking=None):
+    """Per-request commit path, used when VOTE_BATCHING is disabled."""
+    cursor = db.cursor()
+    
+    if not voter_exists:
+        cursor.execute(
+            'INSERT OR IGNORE INTO voters (id, name, email, has_voted) VALUES (?, ?, ?, ?)',
+            (voter_id, f'Voter {voter_id}', f'{voter_id}@email.com', 0)
+        )
+    
+    # A concurrent request for the same voter may have passed the check too
+    cursor.execute(
+        'UPDATE voters SET has_voted = 1, vote_time = ? WHERE id = ? AND has_voted = 0',
+        (vote_time, voter_id)
+    )
+    if cursor.rowcount != 1:
+        db.rollback()
+        raise VoteRejected('This voter has already voted!')
+    
+    cursor.execute('UPDATE candidates SET votes = votes + 1 WHERE id = ?', (candidate_id,))
+    
+    cursor.execute(
+        'INSERT INTO votes_log (voter_id, candidate_id, vote_time) VALUES (?, ?, ?)',
+        (voter_id, candidate_id, vote_time)
+    )
+    if ranking is not None:
+        cursor.execute('INSERT INTO ranked_ballots (voter_id, ranking) VALUES (?, ?)', (voter_id, ranking))
+    stats_rollup.record(cursor, [vote_time])
+    
+    journal = get_journal(DATABASE)
+    journaled = journal.append([(voter_id, candidate_id, vote_time, ranking)]) if journal else []
+    try:
+        db.commit()
+    except Exception:
+        if journaled:
+            journal.void(journaled)
+        raise
+    get_voted_set().add(voter_id)
+    get_tally().record_votes({candidate_id: 1}, 0 if voter_exists else 1)
+    
+    cursor.execute('SELECT * FROM candidates WHERE id = ?', (candidate_id,))
+    return dict_from_row(cursor.fetchone())
+
 @app.route('/api/vote', methods=['POST'])
+@idempotency.replayable
+@rate_limiter.limit('vote', ip=client_ip, voter=json_field('voter_id'))
 def vote():
     try:
         data = request.json
         candidate_id = data.get('candidate_id')
         voter_id = data.get('voter_id')
+        ranking = data.get('ranking')
+        
+        # A ranked ballot's first choice is the vote counted in plurality results
+        encoded_ranking = None
+        if ranking is not None:
+            try:
+                encoded_ranking = ranked.encode(ranking, RANKED_MAX_RANKS)
+            except ranked.RankingError as e:
+                return jsonify({'error': str(e)}), 400
+            if candidate_id is None:
+                candidate_id = ranking[0]
+            elif candidate_id != ranking[0]:
+                return jsonify({'error': 'candidate_id must be the first choice of the ranking'}), 400
         
         if not candidate_id or not voter_id:
             return jsonify({'error': 'Candidate ID and Voter ID are required'}), 400
+        # voters.id is TEXT; a JSON number is stored as its text either way,
+        # anything else (lists, objects, booleans) is not an id
+        if type(voter_id) not in (str, int):
+            return jsonify({'error': 'Voter ID must be a string or an integer'}), 400
+        voter_id = str(voter_id)
         
-        db = get_db()
-        cursor = db.cursor()
+        if VOTE_JOURNAL and len(str(voter_id).encode('utf8')) > vote_journal.MAX_VOTER_ID_BYTES:
+            return jsonify({'error': 'Voter ID is too long'}), 400
         
-        cursor.execute('SELECT has_voted FROM voters WHERE id = ?', (voter_id,))
-        voter = cursor.fetchone()
+        batched = VOTE_BATCHING or get_shards() or _worker is not None
+        known = get_voted_set().has_voted(voter_id)
+        if known:
+            return jsonify({'error': 'This voter has already voted!'}), 403
         
-        if voter:
-            if voter['has_voted']:
+        # Look the voter up before taking the request connection: holding one
+        # pooled connection while waiting for another can exhaust the pool
+        voter = None
+        if known is None or not batched:
+            with voter_db(voter_id) as voter_conn:
+                voter = voter_conn.execute('SELECT has_voted FROM voters WHERE id = ?', (voter_id,)).fetchone()
+            
+            if voter and voter['has_voted']:
                 return jsonify({'error': 'This voter has already voted!'}), 403
-        else:
-            cursor.execute(
-                'INSERT INTO voters (id, name, email, has_voted) VALUES (?, ?, ?, ?)',
-                (voter_id, f'Voter {voter_id}', f'{voter_id}@email.com', 0)
-            )
+        
+        db = get_db()
+        cursor = db.cursor()
         
         cursor.execute('SELECT id FROM candidates WHERE id = ?', (candidate_id,))
-        if not cursor.fetchone():
+        candidate_row = cursor.fetchone()
+        if not candidate_row:
             return jsonify({'error': 'Candidate not found'}), 404
-        
-        cursor.execute('UPDATE candidates SET votes = votes + 1 WHERE id = ?', (candidate_id,))
+        candidate_id = candidate_row['id']
+        if ranking is not None and any(get_tally().candidate(c) is None for c in ranking):
+            return jsonify({'error': 'Ranking contains an unknown candidate'}), 404
         
         vote_time = datetime.now().isoformat()
-        cursor.execute(
-            'UPDATE voters SET has_voted = 1, vote_time = ? WHERE id = ?',
-            (vote_time, voter_id)
-        )
-        
-        cursor.execute(
-            'INSERT INTO votes_log (voter_id, candidate_id, vote_time) VALUES (?, ?, ?)',
-            (voter_id, candidate_id, vote_time)
-        )
-        
-        db.commit()
         
-        cursor.execute('SELECT * FROM candidates WHERE id = ?', (candidate_id,))
-        candidate = dict_from_row(cursor.fetchone())
+        if batched:
+            submitted = time.perf_counter()
+            get_vote_batcher().submit(voter_id, candidate_id, vote_time, encoded_ranking)
+            metrics.record_lock_wait(time.perf_counter() - submitted)
+            candidate = get_tally().candidate(candidate_id)
+        else:
+            candidate = record_vote(db, voter_id, candidate_id, vote_time, voter_exists=bool(voter),
+                                    ranking=encoded_ranking)
         
         return jsonify({
             'success': True,
@@ -299,108 +857,118 @@ def vote():
             }
         })
         
+    except VoteRejected as e:
+        return jsonify({'error': str(e)}), e.status
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/results', methods=['GET'])
+@response_cache.cached
 def get_results():
     try:
-        db = get_db()
-        cursor = db.cursor()
-        cursor.execute('SELECT * FROM candidates ORDER BY votes DESC')
-        rows = cursor.fetchall()
-        
-        candidates = [dict_from_row(row) for row in rows]
-        total_votes = sum(candidate['votes'] for candidate in candidates)
-        
-        for candidate in candidates:
-            percentage = (candidate['votes'] / total_votes * 100) if total_votes > 0 else 0
-            candidate['percentage'] = round(percentage, 2)
+        method = request.args.get('method', 'plurality')
+        if method in ranked.METHODS:
+            try:
+                seats = int(request.args.get('seats', '1'))
+                return jsonify(tabulate_ranked(method, seats))
+            except (ValueError, ranked.RankingError) as e:
+                return jsonify({'error': str(e)}), 400
+        if method != 'plurality':
+            return jsonify({'error': f'Unknown method: {method}'}), 400
         
-        cursor.execute('SELECT COUNT(*) as total FROM voters')
-        total_voters = cursor.fetchone()['total']
+        snapshot = get_tally().snapshot()
+        total_voters = snapshot['total_voters']
+        voted_count = snapshot['voted_count']
         
-        cursor.execute('SELECT COUNT(*) as voted FROM voters WHERE has_voted = 1')
-        voted_count = cursor.fetchone()['voted']
-        
-        cursor.execute('''
-            SELECT DATE(vote_time) as date, COUNT(*) as votes 
-            FROM votes_log 
-            WHERE vote_time IS NOT NULL 
-            GROUP BY DATE(vote_time) 
-            ORDER BY date DESC 
-            LIMIT 7
-        ''')
-        timeline = [dict_from_row(row) for row in cursor.fetchall()]
+        view = analytics_view()
+        if view is not None:
+            timeline = view.timeline(7)
+        else:
+            db = get_db()
+            cursor = db.cursor()
+            shards = get_shards()
+            timeline = shards.timeline(7) if shards else stats_rollup.timeline(cursor, 7)
         
-        return jsonify({
-            'candidates': candidates,
+        body = {
+            'candidates': with_images(snapshot['results']),
             'summary': {
-                'total_votes': total_votes,
+                'total_votes': snapshot['total_votes'],
                 'total_voters': total_voters,
                 'voted_count': voted_count,
                 'voting_percentage': round((voted_count / total_voters * 100), 2) if total_voters > 0 else 0,
-                'leading_candidate': candidates[0]['name'] if candidates else 'None',
+                'leading_candidate': snapshot['leading_candidate'],
                 'timestamp': datetime.now().isoformat()
             },
             'timeline': timeline
-        })
+        }
+        if view is not None:
+            # Candidates and summary are live; only the timeline is snapshot data
+            body['analytics'] = dict(view.info(), fields=['timeline'])
+        return jsonify(body)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/results/stream', methods=['GET'])
+def stream_results():
+    return Response(
+        get_results_broadcaster().subscribe(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/stats', methods=['GET'])
+@response_cache.cached
 def get_stats():
     try:
-        db = get_db()
-        cursor = db.cursor()
-        
-        cursor.execute('SELECT COUNT(*) as count FROM candidates')
-        candidate_count = cursor.fetchone()['count']
-        
-        cursor.execute('SELECT COUNT(*) as count FROM voters')
-        voter_count = cursor.fetchone()['count']
-        
-        cursor.execute('SELECT COUNT(*) as count FROM votes_log')
-        vote_count = cursor.fetchone()['count']
-        
-        cursor.execute('SELECT COUNT(*) as count FROM voters WHERE has_voted = 1')
-        voted_count = cursor.fetchone()['count']
+        snapshot = get_tally().snapshot()
+        candidate_count = len(snapshot['candidates'])
+        voter_count = snapshot['total_voters']
+        voted_count = snapshot['voted_count']
         
-        cursor.execute('''
-            SELECT strftime('%H', vote_time) as hour, COUNT(*) as votes
-            FROM votes_log 
-            WHERE vote_time IS NOT NULL
-            GROUP BY hour
-            ORDER BY votes DESC
-            LIMIT 1
-        ''')
-        most_active = cursor.fetchone()
+        view = analytics_view()
+        shards = get_shards()
+        if view is not None:
+            vote_count = view.total_votes()
+            most_active = view.most_active_hour()
+        elif shards:
+            vote_count = shards.total_votes()
+            most_active = shards.most_active_hour()
+        else:
+            cursor = get_db().cursor()
+            vote_count = stats_rollup.total_votes(cursor)
+            most_active = stats_rollup.most_active_hour(cursor)
         
-        return jsonify({
+        body = {
             'statistics': {
                 'candidates': candidate_count,
                 'voters': voter_count,
                 'total_votes': vote_count,
                 'voters_voted': voted_count,
                 'voting_rate': round((voted_count / voter_count * 100), 2) if voter_count > 0 else 0,
-                'most_active_hour': most_active['hour'] if most_active else 'N/A'
+                'most_active_hour': most_active or 'N/A'
             },
             'system': {
                 'database': DATABASE,
                 'status': 'running',
                 'timestamp': datetime.now().isoformat()
             }
-        })
+        }
+        if view is not None:
+            body['analytics'] = dict(view.info(), fields=['statistics.total_votes', 'statistics.most_active_hour'])
+        return jsonify(body)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/voter/<voter_id>', methods=['GET'])
+@rate_limiter.limit('voter_status', ip=client_ip)
 def get_voter_status(voter_id):
     try:
-        db = get_db()
-        cursor = db.cursor()
-        cursor.execute('SELECT * FROM voters WHERE id = ?', (voter_id,))
-        voter = cursor.fetchone()
+        # Voted voters are answered from memory with the status fields only
+        if get_voted_set().has_voted(voter_id):
+            return jsonify({'id': voter_id, 'has_voted': 1})
+        
+        with voter_db(voter_id) as db:
+            voter = db.execute('SELECT * FROM voters WHERE id = ?', (voter_id,)).fetchone()
         
         if voter:
             return jsonify(dict_from_row(voter))
@@ -417,26 +985,32 @@ def get_voter_status(voter_id):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/admin/login', methods=['POST'])
+@rate_limiter.limit('admin_login', ip=client_ip)
 def admin_login():
     try:
         data = request.json
         username = data.get('username')
-        password = data.get('password')
+        password = data.get('password') or ''
         
         db = get_db()
         cursor = db.cursor()
-        cursor.execute(
-            'SELECT * FROM admin WHERE username = ? AND password = ?',
-            (username, password)
-        )
+        cursor.execute('SELECT * FROM admin WHERE username = ?', (username,))
         admin = cursor.fetchone()
         
-        if admin:
+        if admin_auth.verify_password(password, admin['password'] if admin else None):
+            if admin_auth.needs_rehash(admin['password']):
+                cursor.execute(
+                    'UPDATE admin SET password = ? WHERE username = ?',
+                    (admin_auth.hash_password(password), username)
+                )
+                db.commit()
+            token, expires_at = admin_auth.issue(username)
             return jsonify({
                 'success': True,
                 'message': 'Login successful',
-                'admin': dict_from_row(admin),
-                'token': f'admin_token_{username}_{datetime.now().timestamp()}'
+                'admin': {'username': admin['username'], 'email': admin['email']},
+                'token': token,
+                'expires_at': datetime.fromtimestamp(expires_at).isoformat()
             })
         else:
             return jsonify({
@@ -447,6 +1021,7 @@ def admin_login():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/admin/candidates', methods=['POST'])
+@require_admin
 def add_candidate():
     try:
         data = request.json
@@ -472,6 +1047,9 @@ def add_candidate():
         candidate_id = cursor.lastrowid
         cursor.execute('SELECT * FROM candidates WHERE id = ?', (candidate_id,))
         new_candidate = dict_from_row(cursor.fetchone())
+        get_tally().add_candidate(new_candidate)
+        if image_url and IMAGE_PREFETCH:
+            image_store.prefetch([new_candidate])
         
         return jsonify({
             'success': True,
@@ -481,65 +1059,250 @@ def add_candidate():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/candidates/<int:candidate_id>/image', methods=['GET'])
+def get_candidate_image(candidate_id):
+    try:
+        candidate = get_tally().candidate(candidate_id)
+        if candidate is None:
+            return jsonify({'error': 'Candidate not found'}), 404
+        record = image_store.ensure(candidate, request.args.get('v'))
+        if record is None:
+            return jsonify({'error': 'Candidate has no image'}), 404
+        
+        path, mimetype, etag = image_store.file_for(record, request.args.get('w', type=int))
+        # A URL stamped with the current digest never changes content
+        immutable = image_store.is_current(record, request.args.get('v'))
+        response = send_file(path, mimetype=mimetype, etag=etag, conditional=True,
+                             max_age=IMAGE_MAX_AGE if immutable else 300)
+        response.cache_control.immutable = immutable
+        return response
+    except ImageUnavailable as e:
+        return jsonify({'error': str(e)}), 502
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/candidates/<int:candidate_id>/image', methods=['POST'])
+@require_admin
+def upload_candidate_image(candidate_id):
+    try:
+        if get_tally().candidate(candidate_id) is None:
+            return jsonify({'error': 'Candidate not found'}), 404
+        upload = request.files.get('image')
+        data = upload.read() if upload else request.get_data()
+        if not data:
+            return jsonify({'error': 'Send the image as the request body or an "image" form file'}), 400
+        
+        record = image_store.upload(candidate_id, data)
+        return jsonify({
+            'success': True,
+            'message': 'Candidate image stored',
+            'image': image_store.url({'id': candidate_id}),
+            'widths': record['widths']
+        })
+    except ImageError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/admin/voters', methods=['GET'])
+@require_admin
+@response_cache.cached
 def get_all_voters():
+    """Voters in id order.
+
+    With `limit` (and optionally `after`, the last id of the previous page)
+    returns one keyset page; without it the whole roll is streamed as a
+    JSON array page by page. `q` (prefix search on name and email),
+    `has_voted`, `voted_from` and `voted_to` filter the page and imply a
+    limit of 100; searched pages are in registration order (see
+    voter_search). `format=columnar` returns a page as parallel arrays
+    (see json_codec.columnar) and needs `limit`.
+    """
     try:
-        db = get_db()
-        cursor = db.cursor()
-        cursor.execute('SELECT * FROM voters ORDER BY id')
-        rows = cursor.fetchall()
+        after = request.args.get('after', '')
+        limit = request.args.get('limit', type=int)
+        filters = voter_search.parse_filters(request.args)
+        view = analytics_view()
         
-        voters = [dict_from_row(row) for row in rows]
-        return jsonify(voters)
+        if limit is None and not filters:
+            if wants_columnar():
+                return jsonify({'error': 'format=columnar needs a limit'}), 400
+            pages = view.voter_pages(after=after) if view is not None else voter_pages(after=after)
+            return Response(voter_roll.stream_json_array(pages), mimetype='application/json')
+        
+        limit = max(1, min(limit or 100, 1000))
+        rows = view.find_voters(filters, after, limit) if view is not None else find_voters(filters, after, limit)
+        next_after = rows[-1][0] if len(rows) == limit else None
+        if wants_columnar():
+            body = dict(json_codec.columnar(rows, voter_search.COLUMN_NAMES), next_after=next_after)
+        else:
+            body = {
+                'voters': [dict(zip(voter_search.COLUMN_NAMES, row)) for row in rows],
+                'next_after': next_after
+            }
+        if view is not None:
+            body['analytics'] = view.info()
+        return jsonify(body)
+    except voter_search.SearchError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/voters/export', methods=['GET'])
+@require_admin
+def export_voters():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in voter_roll.EXPORTERS:
+        return jsonify({'error': f'Unsupported format: {fmt}'}), 400
+    
+    exporter, mimetype = voter_roll.EXPORTERS[fmt]
+    view = analytics_view()
+    return Response(
+        exporter(view.voter_pages() if view is not None else voter_pages()),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=voters.{fmt}'}
+    )
+
+@app.route('/api/admin/voters/import', methods=['POST'])
+@require_admin
+def import_voters():
+    """Stream a CSV (id,name,email) or NDJSON roll from the request body."""
+    fmt = request.args.get('format')
+    if fmt is None:
+        fmt = 'csv' if 'csv' in (request.content_type or '') else 'ndjson'
+    if fmt not in voter_roll.PARSERS:
+        return jsonify({'error': f'Unsupported format: {fmt}'}), 400
+    
+    shards = get_shards()
+    conn = None if shards else db_pool.connect(DATABASE, DB_PRAGMA_PROFILE)
+    # Chunks commit as they go; errors report what was already written
+    result = {'processed': 0, 'created': 0}
+    try:
+        rows = voter_roll.PARSERS[fmt](voter_roll.open_text(request.stream))
+        if shards:
+            shards.import_voters(rows, result=result)
+        else:
+            voter_roll.import_voters(conn, rows, result=result)
+    except voter_roll.RollFormatError as e:
+        return jsonify(dict(result, error=str(e))), 400
+    except Exception as e:
+        return jsonify(dict(result, error=str(e))), 500
+    finally:
+        if conn is not None:
+            conn.close()
+        # Bumps the election version even when nobody was created: renamed
+        # voters must not be served from cached pages and searches
+        if result['processed']:
+            get_tally().record_votes({}, result['created'])
+    
+    return jsonify({
+        'success': True,
+        'message': f"Imported {result['processed']} voters",
+        'processed': result['processed'],
+        'created': result['created']
+    })
+
 @app.route('/api/admin/reset', methods=['POST'])
+@require_admin
 def reset_election():
     try:
         db = get_db()
         cursor = db.cursor()
         
-        cursor.execute('UPDATE candidates SET votes = 0')
-        cursor.execute('UPDATE voters SET has_voted = 0, vote_time = NULL')
+        # Only voted rows are rewritten: the partial index finds them
+        cursor.execute('UPDATE voters SET has_voted = 0, vote_time = NULL WHERE has_voted = 1')
         cursor.execute('DELETE FROM votes_log')
+        cursor.execute('DELETE FROM ranked_ballots')
         
-        votes_data = []
-        for i in range(1, 61):
-            voter_id = f'VOTER{str(i).zfill(3)}'
-            candidate_id = (i % 8) + 1
-            votes_data.append((voter_id, candidate_id, datetime.now().isoformat()))
+        voted_at = datetime.now().isoformat()
+        seed_votes = [(f'VOTER{str(i).zfill(3)}', (i % 8) + 1, voted_at) for i in range(1, 31)]
         
-        cursor.executemany(
-            'INSERT INTO votes_log (voter_id, candidate_id, vote_time) VALUES (?, ?, ?)',
-            votes_data[:30]
-        )
-        
-        for candidate_id in range(1, 9):
-            vote_count = len([v for v in votes_data[:30] if v[1] == candidate_id])
-            if vote_count > 0:
-                cursor.execute(
-                    'UPDATE candidates SET votes = votes + ? WHERE id = ?',
-                    (vote_count, candidate_id)
+        shards = get_shards()
+        if shards:
+            cursor.execute('UPDATE candidates SET votes = 0')
+            shards.reset(seed_votes, voted_at)
+        else:
+            cursor.executemany(
+                'INSERT INTO votes_log (voter_id, candidate_id, vote_time) VALUES (?, ?, ?)',
+                seed_votes
+            )
+            cursor.execute('''
+                UPDATE candidates SET votes = (
+                    SELECT COUNT(*) FROM votes_log WHERE votes_log.candidate_id = candidates.id
                 )
-        
-        for i in range(1, 31):
-            voter_id = f'VOTER{str(i).zfill(3)}'
+            ''')
             cursor.execute(
-                'UPDATE voters SET has_voted = 1, vote_time = ? WHERE id = ?',
-                (datetime.now().isoformat(), voter_id)
+                'UPDATE voters SET has_voted = 1, vote_time = ? WHERE id IN (SELECT voter_id FROM votes_log)',
+                (voted_at,)
             )
+            vote_integrity.record_baseline(cursor)
         
+        stats_rollup.rebuild(cursor)
         db.commit()
+        record_journal_reset()
+        
+        get_tally().checkpoint(db)
+        get_tally().load(db, shards=shards)
+        load_voted_set(get_voted_set())
+        reset_tabulations()
+        # Stored responses describe ballots that no longer exist
+        idempotency.clear()
         
         return jsonify({
             'success': True,
             'message': 'Election reset with 30 dummy votes',
-            'votes_added': 30
+            'votes_added': len(seed_votes)
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/snapshot', methods=['POST'])
+@require_admin
+def save_snapshot():
+    try:
+        result = snapshots.save(DATABASE, SNAPSHOT_PATH, SHARD_COUNT if get_shards() else 0)
+        return jsonify(dict(result, success=True, message='Snapshot saved'))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/restore', methods=['POST'])
+@require_admin
+def restore_snapshot():
+    try:
+        shards = get_shards()
+        result = snapshots.restore(DATABASE, SNAPSHOT_PATH, SHARD_COUNT if shards else 0)
+        
+        # Everything held in memory was derived from the replaced files
+        record_journal_reset(truncate=True)
+        db = get_db()
+        get_tally().load(db, shards=shards)
+        load_voted_set(get_voted_set())
+        image_store.reset()
+        reset_tabulations()
+        integrity.reload()
+        idempotency.clear()
+        
+        return jsonify(dict(result, success=True, message='Snapshot restored'))
+    except snapshots.SnapshotError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/integrity', methods=['GET', 'POST'])
+@require_admin
+def integrity_check():
+    try:
+        # POST runs a pass now: {"repair": true} fixes findings, {"rescan": true} rechecks the whole log
+        data = (request.get_json(silent=True) or {}) if request.method == 'POST' else {}
+        options = (request.method == 'POST', bool(data.get('repair')), bool(data.get('rescan')),
+                   int(request.args.get('limit', 100)))
+        report = _worker.integrity(*options) if _worker is not None else integrity_report(*options)
+        return jsonify(report)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     try:
@@ -550,20 +1313,43 @@ def health_check():
         cursor.execute('SELECT COUNT(*) as count FROM candidates')
         candidates = cursor.fetchone()['count']
         
-        cursor.execute('SELECT COUNT(*) as count FROM voters')
-        voters = cursor.fetchone()['count']
+        shards = get_shards()
+        if shards:
+            voters = shards.voter_counts()[0]
+        else:
+            cursor.execute('SELECT COUNT(*) as count FROM voters')
+            voters = cursor.fetchone()['count']
         
         return jsonify({
             'status': 'healthy',
             'database': 'connected',
+            'pool': get_pool().stats(),
+            'response_cache': response_cache.stats(),
+            'admin_auth': admin_auth.stats(),
+            'rate_limit': rate_limiter.stats(),
+            'idempotency': idempotency.stats(),
+            'json_encoder': json_codec.encoder_name(),
+            'compression': compressor.stats(),
+            'images': image_store.stats(),
+            'analytics': analytics.stats() if ANALYTICS_SNAPSHOT else None,
+            'integrity': integrity.stats() if _worker is None else None,
+            'ranked': {'engine': 'numpy' if ranked.np is not None else 'python',
+                       'max_ranks': RANKED_MAX_RANKS, 'ballots_loaded': len(_ballot_box) if _ballot_box else 0},
+            'shards': SHARD_COUNT,
+            'voted_index': get_voted_set().stats(),
+            'journal': [get_journal(path).stats() for path in journal_databases()] if VOTE_JOURNAL and _worker is None else None,
+            'worker': _worker.info() if _worker is not None else None,
             'tables': {
                 'candidates': candidates,
                 'voters': voters,
                 'votes_log': 'present',
                 'admin': 'present'
             },
+            'metrics': METRICS_ENABLED,
+            'profiler': profiler.running,
             'timestamp': datetime.now().isoformat(),
-            'uptime': 'running'
+            'started_at': datetime.fromtimestamp(metrics.started_at).isoformat(),
+            'uptime': round(time.time() - metrics.started_at, 1)
         })
     except Exception as e:
         return jsonify({
@@ -572,20 +1358,79 @@ def health_check():
             'error': str(e)
         }), 500
 
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    try:
+        gauges = {}
+        pool = get_pool().stats()
+        gauges['voting_db_pool_in_use'] = (pool['in_use'], 'Pooled connections checked out')
+        gauges['voting_db_pool_open'] = (pool['open'], 'Pooled connections open')
+        gauges['voting_tally_version'] = (get_tally().version, 'In-memory tally version')
+        gauges['voting_results_subscribers'] = (get_results_broadcaster().subscriber_count(), 'Open /api/results/stream clients')
+        gauges['voting_voted_index_bytes'] = (get_voted_set().stats()['total_bytes'], 'Memory held by the voted-set')
+        gauges['voting_rate_limit_buckets'] = (rate_limiter.stats()['buckets'], 'Token buckets held by the rate limiter')
+        replay = idempotency.stats()
+        gauges['voting_idempotency_keys'] = (replay['entries'], 'Vote responses held for idempotent retries')
+        gauges['voting_idempotency_replays'] = (replay['hits'], 'Votes answered from a stored response')
+        gauges['voting_idempotency_hit_rate'] = (replay['hit_rate'], 'Percent of keyed votes answered from a stored response')
+        if VOTE_BATCHING or get_shards() or _worker is not None:
+            gauges['voting_vote_queue_depth'] = (get_vote_batcher().stats()['queued'], 'Ballots waiting for group commit')
+        if request.args.get('format') == 'json':
+            return jsonify({'endpoints': metrics.summary(), 'gauges': {k: v[0] for k, v in gauges.items()}})
+        return Response(metrics.prometheus(gauges), mimetype='text/plain; version=0.0.4')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/admin/profiler', methods=['GET', 'POST'])
+@require_admin
+def sampling_profiler():
+    try:
+        if request.method == 'POST':
+            data = request.json or {}
+            if data.get('reset'):
+                profiler.reset()
+            if data.get('enabled'):
+                interval_ms = float(data.get('interval_ms') or PROFILER_INTERVAL_MS)
+                profiler.start(max(interval_ms, 1) / 1000)
+            elif 'enabled' in data:
+                profiler.stop()
+        if request.args.get('format') == 'collapsed':
+            return Response(profiler.collapsed(), mimetype='text/plain')
+        return jsonify(profiler.report(int(request.args.get('top', 50))))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ========== APPLICATION START ==========
+def startup():
+    """Prepare the database and start background services (WSGI and ASGI).
+
+    Returns True if the database was (re)seeded.
+    """
+    initialized = prepare_db()
+    get_pool().warm()
+    get_tally()
+    start_tally_checkpointer()
+    start_integrity_verifier()
+    if IMAGE_PREFETCH:
+        image_store.prefetch(get_tally().snapshot()['candidates'])
+    if PROFILER_ENABLED:
+        profiler.start()
+    return initialized
+
 if __name__ == '__main__':
     print("=" * 60)
     print("ONLINE VOTING SYSTEM BACKEND - WITH CANDIDATE IMAGES")
     print("=" * 60)
-    print("Initializing database with candidate images...")
-    
-    init_db()
+    print("Preparing database with candidate images...")
     
-    print("\n✅ Ready! Your backend has been populated with:")
-    print("   • 8 Candidates with images from Unsplash")
-    print("   • 100 Voters (60 already voted)")
-    print("   • 60 Vote records")
-    print("   • 3 Admin accounts")
+    if startup():
+        print("\n✅ Ready! Your backend has been populated with:")
+        print("   • 8 Candidates with images from Unsplash")
+        print("   • 100 Voters (60 already voted)")
+        print("   • 60 Vote records")
+        print("   • 3 Admin accounts")
+    else:
+        print("\n✅ Ready! Set DB_RESET_ON_START=1 to reseed the demo data.")
     print("\n📊 Admin Login Credentials:")
     print("   Username: admin, Password: admin123")
     print("\n🌐 Available Endpoints:")
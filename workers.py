@@ -0,0 +1,464 @@
+"""
+PRE-FORK MULTI-PROCESS MODE
+File: workers.py
+Used by: voting.py (worker processes), benchmarks/check_worker_votes.py
+Run: python workers.py [--workers 4] [--port 5000]
+
+A supervisor initializes the database, opens the listening socket and
+forks one writer process plus N HTTP workers that accept on the shared
+socket. Every ballot is sent to the writer over a local socket and goes
+through its group-commit batcher, so the `has_voted = 0` guard runs in one
+place and a voter cannot be counted twice however the requests are spread.
+The writer publishes tallies into shared memory (seqlock-protected counts
+per candidate id) and sets voted-set bits in a shared bitmap before it
+answers, so every worker serves the same /api/results, and repeat votes for
+canonical VOTERnnn ids are rejected in the worker without a round trip.
+Dead children are restarted by the supervisor.
+"""
+import argparse
+import mmap
+import os
+import queue
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import db_pool
+import journal as vote_journal
+import voting
+from tally import Tally
+from vote_batcher import VoteRejected
+from voter_index import VotedSet
+
+
+MAX_CANDIDATES = int(os.environ.get('WORKER_MAX_CANDIDATES', '4096'))
+CLIENT_POOL_SIZE = 32
+
+# seq (odd while the writer is mid-update), version, generation (bumped when
+# the candidate list may have changed), total_voters, voted_count, voted-set size
+HEADER = struct.Struct('<QQQQQQ')
+HEADER_SIZE = 64
+
+
+# ========== SHARED MEMORY ==========
+class SharedState:
+    """Anonymous shared mappings created before fork: tally and voted bitmap."""
+
+    def __init__(self, max_candidates=MAX_CANDIDATES, max_numeric=voting.VOTED_INDEX_MAX_NUMERIC):
+        self.max_candidates = max_candidates
+        self.state = mmap.mmap(-1, HEADER_SIZE + 8 * max_candidates)
+        self.bitmap = mmap.mmap(-1, max(1, (max_numeric + 7) // 8))
+        self.counts = memoryview(self.state)[HEADER_SIZE:].cast('q')
+        self._lock = threading.Lock()
+
+    def header(self):
+        while True:
+            values = HEADER.unpack_from(self.state, 0)
+            if values[0] % 2 == 0 and struct.unpack_from('<Q', self.state, 0)[0] == values[0]:
+                return values
+
+    def read(self, candidate_ids):
+        """(version, generation, total_voters, voted_count, {id: votes}), consistent."""
+        while True:
+            seq, version, generation, total_voters, voted_count, _ = HEADER.unpack_from(self.state, 0)
+            if seq % 2:
+                continue
+            counts = {cid: self.counts[cid] for cid in candidate_ids if 0 <= cid < self.max_candidates}
+            if struct.unpack_from('<Q', self.state, 0)[0] == seq:
+                return version, generation, total_voters, voted_count, counts
+
+    def publish(self, tally, voted_set, new_generation=False):
+        """Writer side: copy the tally (and voted-set size) into shared memory."""
+        version, counts, total_voters, voted_count = tally.counts()
+        with self._lock:
+            seq, _, generation, _, _, _ = HEADER.unpack_from(self.state, 0)
+            struct.pack_into('<Q', self.state, 0, seq + 1)
+            if new_generation:
+                self.counts[:] = memoryview(bytes(8 * self.max_candidates)).cast('q')
+                generation += 1
+            for candidate_id, votes in counts.items():
+                if candidate_id >= self.max_candidates:
+                    raise ValueError(f'Candidate id {candidate_id} exceeds WORKER_MAX_CANDIDATES')
+                self.counts[candidate_id] = votes
+            HEADER.pack_into(self.state, 0, seq + 1, version, generation, total_voters, voted_count, len(voted_set))
+            struct.pack_into('<Q', self.state, 0, seq + 2)
+
+
+class SharedTally(Tally):
+    """A worker's view of the writer's tally.
+
+    Candidate metadata comes from SQLite and is reloaded when the writer
+    bumps the generation; counts and totals come from shared memory on
+    every `refresh()`. Changes are sent to the writer.
+    """
+
+    def __init__(self, shared, client, poll_interval=0.05):
+        super().__init__()
+        self.shared = shared
+        self.client = client
+        self.poll_interval = poll_interval
+        self._generation = None
+        self._metadata = {}
+        self._poller = None
+
+    def _load_metadata(self):
+        conn = db_pool.connect(voting.DATABASE, voting.DB_PRAGMA_PROFILE)
+        try:
+            return {row['id']: dict(row) for row in conn.execute('SELECT * FROM candidates ORDER BY id')}
+        finally:
+            conn.close()
+
+    def refresh(self, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            _, version, generation, _, _, _ = self.shared.header()
+            if generation:
+                break
+            if time.monotonic() > deadline:
+                raise RuntimeError('Vote writer process has not published a tally')
+            time.sleep(0.05)
+        if version == self.version and generation == self._generation:
+            return self
+
+        if generation != self._generation:
+            self._metadata = self._load_metadata()
+        version, read_generation, total_voters, voted_count, counts = self.shared.read(self._metadata)
+        if read_generation != generation:
+            return self.refresh(timeout)
+
+        candidates = {}
+        for candidate_id, row in self._metadata.items():
+            candidate = dict(row)
+            candidate['votes'] = counts.get(candidate_id, 0)
+            candidates[candidate_id] = candidate
+        with self._lock:
+            self.candidates = candidates
+            self.total_voters = total_voters
+            self.voted_count = voted_count
+            self.version = version
+            self._generation = generation
+        self._notify()
+        return self
+
+    def subscribe(self, callback):
+        super().subscribe(callback)
+        if self._poller is None:
+            self._poller = threading.Thread(target=self._poll, name='shared-tally-poll', daemon=True)
+            self._poller.start()
+
+    def _poll(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Shared tally refresh failed: {e}")
+
+    def load(self, conn, shards=None):
+        self.client.call('reload')
+        self.refresh()
+        return {}
+
+    def add_candidate(self, candidate):
+        self.client.call('add_candidate', dict(candidate))
+        self.refresh()
+
+    def record_votes(self, increments, new_voters=0):
+        self.client.call('record_votes', dict(increments), new_voters)
+        self.refresh()
+
+
+class SharedVotedSet(VotedSet):
+    """VotedSet whose bitmap lives in shared memory.
+
+    The writer process owns it (`writer=True`); workers only read the
+    bitmap, so non-canonical ids are never authoritative there.
+    """
+
+    def __init__(self, shared, writer, **kwargs):
+        super().__init__(max_numeric=len(shared.bitmap) * 8, **kwargs)
+        self.shared = shared
+        self.writer = writer
+        self._bits = memoryview(shared.bitmap)
+
+    def load(self, voter_ids):
+        if not self.writer:
+            return
+        with self._lock:
+            self._bits[:] = bytes(len(self._bits))
+            self._others = set()
+            self._other_bytes = 0
+            self._count = 0
+            self.numeric_overflow = False
+            self.other_overflow = False
+            for voter_id in voter_ids:
+                self._add(voter_id)
+
+    def has_voted(self, voter_id):
+        known = super().has_voted(voter_id)
+        if not self.writer and not known and self._number(voter_id) is None:
+            return None
+        return known
+
+    def __len__(self):
+        return self._count if self.writer else self.shared.header()[5]
+
+    def stats(self):
+        stats = super().stats()
+        stats['voted'] = len(self)
+        stats['shared'] = True
+        return stats
+
+
+# ========== WRITER PROCESS ==========
+class WriterClient:
+    """Pooled connections from a worker to the writer process."""
+
+    def __init__(self, address, authkey, size=CLIENT_POOL_SIZE):
+        self.address = address
+        self.authkey = authkey
+        self._idle = queue.LifoQueue()
+        self._slots = threading.Semaphore(size)
+
+    def _connect(self, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return Client(self.address, authkey=self.authkey)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+
+    def call(self, command, *args):
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                conn.send((command,) + args)
+                reply = conn.recv()
+            except (EOFError, OSError):
+                conn.close()
+                raise RuntimeError('Lost connection to the vote writer process')
+            self._idle.put(conn)
+        if reply[0] == 'ok':
+            return reply[1]
+        if reply[0] == 'rejected':
+            raise VoteRejected(reply[1], reply[2])
+        raise RuntimeError(reply[1])
+
+
+class RemoteVoteBatcher:
+    def __init__(self, client):
+        self.client = client
+        self.database = voting.DATABASE
+
+    def submit(self, voter_id, candidate_id, vote_time, ranking=None):
+        self.client.call('vote', voter_id, candidate_id, vote_time, ranking)
+
+    def stats(self):
+        return self.client.call('stats')['batcher']
+
+
+class RemoteIdempotencyStore:
+    """Stored vote responses live in the writer, shared by every worker."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def lookup(self, key, digest):
+        return self.client.call('idempotency_lookup', key, digest)
+
+    def store(self, key, digest, body):
+        self.client.call('idempotency_store', key, digest, body)
+
+
+class WorkerServices:
+    """What voting.py uses instead of its in-process state inside a worker."""
+
+    def __init__(self, shared, client, index):
+        self.index = index
+        self.client = client
+        self.tally = SharedTally(shared, client)
+        self.voted_set = SharedVotedSet(shared, writer=False)
+        self.batcher = RemoteVoteBatcher(client)
+        self.idempotency = RemoteIdempotencyStore(client)
+
+    def reset_journal(self):
+        self.client.call('reset_journal')
+
+    def info(self):
+        return {'pid': os.getpid(), 'index': self.index, 'writer': self.client.call('stats')}
+
+    def integrity(self, run=False, repair=False, rescan=False, limit=100):
+        return self.client.call('integrity', run, repair, rescan, limit)
+
+
+def run_writer(shared, address, authkey):
+    voted_set = SharedVotedSet(shared, writer=True, max_other=voting.VOTED_INDEX_MAX_OTHER)
+    voting._voted_set, voting._voted_set_database = voted_set, voting.DATABASE
+    voting.load_voted_set(voted_set)
+    tally = voting.get_tally()
+    # Keep versions increasing across writer restarts; workers cache on them
+    tally.version = shared.header()[1] + 1
+    tally.subscribe(lambda: shared.publish(tally, voted_set))
+    shared.publish(tally, voted_set, new_generation=True)
+    voting.start_tally_checkpointer()
+    voting.start_integrity_verifier()
+    if voting.IMAGE_PREFETCH:
+        voting.image_store.prefetch(tally.snapshot()['candidates'])
+    batcher = voting.get_vote_batcher()
+
+    def reload():
+        conn = db_pool.connect(voting.DATABASE, voting.DB_PRAGMA_PROFILE)
+        try:
+            tally.load(conn, shards=voting.get_shards())
+        finally:
+            conn.close()
+        voting.load_voted_set(voted_set)
+        shared.publish(tally, voted_set, new_generation=True)
+        voting.integrity.reload()
+        voting.idempotency.clear()
+
+    def handle(command, args):
+        if command == 'vote':
+            batcher.submit(*args)
+            return None
+        if command == 'reload':
+            return reload()
+        if command == 'add_candidate':
+            tally.add_candidate(args[0])
+            return shared.publish(tally, voted_set, new_generation=True)
+        if command == 'record_votes':
+            return tally.record_votes(*args)
+        if command == 'idempotency_lookup':
+            return voting.idempotency.lookup(*args)
+        if command == 'idempotency_store':
+            return voting.idempotency.store(*args)
+        if command == 'integrity':
+            return voting.integrity_report(*args)
+        if command == 'reset_journal':
+            return voting.record_journal_reset()
+        if command == 'stats':
+            journals = [voting.get_journal(path).stats() for path in voting.journal_databases()] if voting.VOTE_JOURNAL else None
+            return {'pid': os.getpid(), 'batcher': batcher.stats(), 'journal': journals,
+                    'idempotency': voting.idempotency.stats()}
+        raise ValueError(f'Unknown command: {command}')
+
+    def serve(conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = ('ok', handle(message[0], message[1:]))
+                except VoteRejected as e:
+                    reply = ('rejected', str(e), e.status)
+                except Exception as e:
+                    reply = ('error', str(e))
+                conn.send(reply)
+
+    listener = Listener(address, authkey=authkey)
+    print(f"✍️  Vote writer ready (pid {os.getpid()})")
+    while True:
+        conn = listener.accept()
+        threading.Thread(target=serve, args=(conn,), name='writer-conn', daemon=True).start()
+
+
+def run_worker(shared, listen_socket, address, authkey, index, host, port):
+    from werkzeug.serving import make_server
+
+    voting.use_worker(WorkerServices(shared, WriterClient(address, authkey), index))
+    if voting.PROFILER_ENABLED:
+        voting.profiler.start()
+    server = make_server(host, port, voting.app, threaded=True, fd=listen_socket.fileno())
+    print(f"🧵 Worker {index} serving (pid {os.getpid()})")
+    server.serve_forever()
+
+
+# ========== SUPERVISOR ==========
+def main():
+    parser = argparse.ArgumentParser(description='Run voting.py across several worker processes')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--no-init', action='store_true', help='serve the existing database as is, without migrating it')
+    args = parser.parse_args()
+
+    if not args.no_init:
+        voting.prepare_db()
+    # Nothing opened here may be shared with the children
+    db_pool.close_all()
+    vote_journal.close_journals()
+
+    shared = SharedState()
+    listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listen_socket.bind((args.host, args.port))
+    listen_socket.listen(1024)
+    address = os.path.join(tempfile.mkdtemp(prefix='voting-writer-'), 'writer.sock')
+    authkey = os.urandom(16)
+
+    roles = {}
+    stopping = False
+
+    def spawn(role, index=0):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                if role == 'writer':
+                    run_writer(shared, address, authkey)
+                else:
+                    run_worker(shared, listen_socket, address, authkey, index, args.host, args.port)
+            except BaseException as e:
+                print(f"❌ {role} {index} exited: {e}", file=sys.stderr)
+                code = 1
+            finally:
+                os._exit(code)
+        roles[pid] = (role, index)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(roles):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    print(f"🚀 Serving on http://{args.host}:{args.port} with {args.workers} workers")
+    spawn('writer')
+    for index in range(args.workers):
+        spawn('worker', index)
+
+    while roles:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        role, index = roles.pop(pid, (None, None))
+        if role is not None and not stopping:
+            print(f"⚠️ {role} {index} (pid {pid}) exited with status {status}; restarting")
+            time.sleep(0.5)
+            spawn(role, index)
+
+
+if __name__ == '__main__':
+    main()